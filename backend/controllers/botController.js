@@ -22,6 +22,22 @@ const setSocketServer = (server) => {
 const createBotPost = async (req, res) => {
   try {
     const { content, images, bot_metadata, multimedia, post_type, mood, time_context, events_referenced } = req.body;
+    const idempotencyKey = req.get('Idempotency-Key');
+
+    // A retry of a request that already went through gets the original post back
+    if (idempotencyKey) {
+      const existingPost = await Post.findOne({ 'botMetadata.idempotencyKey': idempotencyKey })
+        .populate('userId', 'username displayName avatar isVerified isBot');
+      if (existingPost) {
+        return res.status(200).json({
+          success: true,
+          message: 'Bot post already created',
+          post: existingPost,
+          bot_user: existingPost.userId?.username,
+          duplicate: true
+        });
+      }
+    }
 
     // Support both image posts and text-only posts
     if (!content) {
@@ -94,8 +110,13 @@ const createBotPost = async (req, res) => {
           uploadedImages.push(uploadResult.secure_url);
         } catch (uploadError) {
           console.error('❌ Error uploading image to Cloudinary:', uploadError);
-          // Use original Unsplash URL as fallback
-          uploadedImages.push(imageUrl);
+          // Use original Unsplash URL as fallback (never store an inline data URI)
+          const fallbackUrl = imageUrl.startsWith('data:')
+            ? bot_metadata?.image_derivative?.source_url
+            : imageUrl;
+          if (fallbackUrl) {
+            uploadedImages.push(fallbackUrl);
+          }
         }
       }
     }
@@ -139,6 +160,7 @@ const createBotPost = async (req, res) => {
         createdBy: 'python_bot',
         topic: bot_metadata?.topic,
         photoData: bot_metadata?.photo_data,
+        idempotencyKey: idempotencyKey,
         postType: post_type || 'image_post',
         mood: mood,
         timeContext: time_context,
@@ -148,7 +170,23 @@ const createBotPost = async (req, res) => {
       }
     });
 
-    await newPost.save();
+    try {
+      await newPost.save();
+    } catch (saveError) {
+      // A concurrent retry with the same key saved first
+      if (saveError.code === 11000 && idempotencyKey) {
+        const existingPost = await Post.findOne({ 'botMetadata.idempotencyKey': idempotencyKey })
+          .populate('userId', 'username displayName avatar isVerified isBot');
+        return res.status(200).json({
+          success: true,
+          message: 'Bot post already created',
+          post: existingPost,
+          bot_user: botUser.username,
+          duplicate: true
+        });
+      }
+      throw saveError;
+    }
 
     // Populate user data for response
     await newPost.populate('userId', 'username displayName avatar isVerified isBot');
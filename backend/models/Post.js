@@ -188,6 +188,9 @@ const PostSchema = new mongoose.Schema({
         photoData: {
             type: mongoose.Schema.Types.Mixed, // Unsplash photo metadata
         },
+        idempotencyKey: {
+            type: String, // Idempotency-Key the Python backend sent the post with
+        },
         createdAt: {
             type: Date,
             default: Date.now
@@ -213,6 +216,7 @@ PostSchema.index({ likeCount: -1 });
 PostSchema.index({ engagementScore: -1 });
 PostSchema.index({ visibility: 1 });
 PostSchema.index({ isDeleted: 1 });
+PostSchema.index({ 'botMetadata.idempotencyKey': 1 }, { unique: true, sparse: true });
 
 // Virtual for post URL
 PostSchema.virtual('postUrl').get(function() {
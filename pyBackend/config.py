@@ -4,7 +4,7 @@ Configuration settings for HooksDream Python Backend
 
 import os
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     # Environment
@@ -27,11 +27,73 @@ class Settings(BaseSettings):
     BOT_ENABLED: bool = True
     BOT_INTERVAL_MINUTES: int = 60  # Reduced to every 1 hour (save Cloudinary)
     BOT_POSTS_PER_RUN: int = 5      # Moderate posting (5 bots per hour)
+    BOT_PRESTAGE_LEAD_MINUTES: int = 10  # Build the next scheduled post this long before its slot
+    BOT_SCHEDULE_JITTER_SECONDS: int = 30       # Random delay after each slot so posts don't land on the exact second
+    BOT_SCHEDULER_MAX_SLEEP_SECONDS: int = 900  # Longest single sleep, so wall-clock jumps are noticed
+    BOT_SCHEDULE_SPREAD_SECONDS: int = 120      # Stable per-bot offset window so bots sharing a slot are staggered
+    BOT_MAX_CONCURRENT_POSTS: int = 4           # Scheduler workers (posts built/sent at once across all bots)
+    BOT_CATCHUP_GRACE_MINUTES: int = 180        # Slots missed (restart, sleep) this recently are replayed; 0 disables catch-up
+    BOT_CATCHUP_MAX_REPLAYS: int = 5            # Most missed slots replayed per catch-up, newest first
+    BOT_CATCHUP_SPACING_SECONDS: int = 120      # Gap between replayed posts
+    SCHEDULER_LEADER_ELECTION: bool = True      # Only the process holding the lease (data/trackers.db) runs the scheduler
+    SCHEDULER_LEASE_TTL_SECONDS: float = 30.0   # A dead leader is replaced within this long
+    
+    # Post pipeline (select -> enrich -> caption -> render -> deliver)
+    POST_PIPELINE_CONCURRENCY: Dict[str, int] = {"select": 2, "enrich": 4, "caption": 4, "render": 2, "deliver": 4}
+    POST_PIPELINE_QUEUE_SIZE: int = 8  # Jobs waiting in front of each stage before the previous one blocks
+
+    # Node backend delivery outbox (data/trackers.db)
+    POST_OUTBOX_MAX_ATTEMPTS: int = 8              # Then the post is dead-lettered
+    POST_OUTBOX_BASE_DELAY_SECONDS: float = 5.0    # Retry delay doubles per attempt, with jitter
+    POST_OUTBOX_MAX_DELAY_SECONDS: float = 900.0
+    POST_OUTBOX_POLL_SECONDS: float = 5.0
+    POST_OUTBOX_DRAIN_SECONDS: float = 20.0        # Shutdown keeps delivering due posts this long
+    POST_OUTBOX_KEEP_DAYS: int = 7                 # Delivered rows (and their keys) kept this long
     
     # Cloudinary limits (Free tier protection)
     MAX_IMAGES_PER_DAY: int = 100   # Max 100 images per day (free tier = 25GB/month)
     MAX_IMAGES_PER_HOUR: int = 10   # Max 10 images per hour
     
+    # Image derivatives (rendered with Pillow before handing posts to Node)
+    IMAGE_PIPELINE_ENABLED: bool = True
+    IMAGE_PIPELINE_WORKERS: int = 2
+    IMAGE_FEED_WIDTH: int = 1080
+    IMAGE_THUMB_WIDTH: int = 400
+    IMAGE_QUALITY: int = 80
+    
+    # Near-duplicate detection (64-bit dHash, Hamming distance)
+    PHASH_ENABLED: bool = True
+    PHASH_DUPLICATE_THRESHOLD: int = 6     # Max differing bits to count as the same image
+    PHASH_DOWNLOAD_CONCURRENCY: int = 4
+    
+    # Photo catalog (local copy of source portfolios)
+    PHOTO_CATALOG_TTL_MINUTES: int = 360  # Refresh from Unsplash every 6 hours
+    PHOTO_CATALOG_REFRESH_CLAIM_SECONDS: int = 600  # One worker refreshes a source; others wait this long before retrying
+    PORTFOLIO_FETCH_CONCURRENCY: int = 4  # Max Unsplash pages fetched at once
+    PORTFOLIO_MAX_PAGES: int = 10         # Hard cap on pages per portfolio refresh
+    PORTFOLIO_PREFETCH_PAGES: int = 2     # Pages buffered ahead of a streaming consumer
+    
+    # Photo/schedule tracker storage
+    TRACKER_STORAGE: str = "sqlite"         # "sqlite" (data/trackers.db, WAL, multi-worker safe) or "json" (single process)
+    PHOTO_TRACKER_COMPACT_EVERY: int = 500  # JSON only: journal entries before rewriting the snapshot
+    TRACKER_FLUSH_INTERVAL_SECONDS: float = 2.0  # Write-behind debounce before flushing tracker writes
+    TRACKER_RELOAD_CHECK_SECONDS: float = 5.0    # How often to look for writes from other workers (sqlite)
+    PHOTO_REUSE_COOLDOWN_DAYS: int = 30          # Once every photo is used, only reuse ones not posted for this long
+    PHOTO_HISTORY_RETENTION_DAYS: int = 365      # Uses older than this are forgotten (photo counts as unused)
+    SCHEDULE_HISTORY_RECENT_DAYS: int = 14       # Posted slots kept exactly; older days roll up into daily counts
+    SCHEDULE_HISTORY_DAILY_DAYS: int = 90        # Daily counts kept this long, then rolled up into monthly counts
+    
+    # Shared HTTP client pools (one per upstream)
+    HTTP_MAX_CONNECTIONS: int = 20
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    HTTP2_ENABLED: bool = True  # Used when the h2 package is installed
+    
+    # Unsplash rate budget (demo apps get 50 requests/hour)
+    UNSPLASH_HOURLY_LIMIT: int = 50
+    UNSPLASH_SCHEDULED_RESERVE: int = 5     # Only scheduled posts may dip below this
+    UNSPLASH_INTERACTIVE_RESERVE: int = 10  # Background refreshes leave this for API traffic
+    
     # Server configuration
     HOST: str = "0.0.0.0"
     PORT: int = 8000  # Changed to match Fly.io expectation
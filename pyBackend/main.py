@@ -13,6 +13,13 @@ from dotenv import load_dotenv
 
 from services.unsplash_service import UnsplashService
 from services.bot_service import BotService
+from services.photo_catalog_service import photo_catalog
+from services.http_client_service import http_clients
+from services.image_pipeline_service import image_pipeline
+from services.marcin_art_service import fetch_source_portfolio
+from services.premium_bot_accounts import get_premium_bot_accounts
+from services.tracker_storage import get_tracker_storage
+from services.leader_election import LeaderLease
 from routers import bot_router
 from config import settings, get_host, get_port
 
@@ -21,24 +28,20 @@ load_dotenv()
 
 async def keep_alive_task():
     """Keep the service alive by making periodic requests to prevent Railway sleep"""
-    import httpx
-    
     while True:
         try:
             # Wait 8 minutes between keep-alive pings (Railway sleeps after 10 min)
             await asyncio.sleep(480)  # 8 minutes
             
             # Ping self to prevent sleep
-            port = get_port()
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                try:
-                    response = await client.get(f"http://localhost:{port}/health")
-                    if response.status_code == 200:
-                        print("💓 Keep-alive ping successful")
-                    else:
-                        print(f"⚠️ Keep-alive ping returned {response.status_code}")
-                except Exception as ping_error:
-                    print(f"⚠️ Keep-alive ping failed: {ping_error}")
+            try:
+                response = await http_clients.get_local_client().get("/health")
+                if response.status_code == 200:
+                    print("💓 Keep-alive ping successful")
+                else:
+                    print(f"⚠️ Keep-alive ping returned {response.status_code}")
+            except Exception as ping_error:
+                print(f"⚠️ Keep-alive ping failed: {ping_error}")
                     
         except Exception as e:
             print(f"❌ Keep-alive task error: {e}")
@@ -47,11 +50,12 @@ async def keep_alive_task():
 # Global services
 unsplash_service = None
 bot_service = None
+scheduler_lease = None
 
 @asynccontextmanager
 async def Lifecycle(app: FastAPI):
     """Application Lifecycle management"""
-    global unsplash_service, bot_service
+    global unsplash_service, bot_service, scheduler_lease
     
     # Startup
     print("🚀 Starting HooksDream Python Backend...")
@@ -60,22 +64,50 @@ async def Lifecycle(app: FastAPI):
     
     # Initialize services
     print("🔧 Initializing services...")
-    unsplash_service = UnsplashService()
+    await http_clients.start()
+    print("🔌 Shared HTTP client pools created")
+    
+    await get_tracker_storage().start()
+    print("💾 Tracker write-behind flusher started")
+    
+    if settings.IMAGE_PIPELINE_ENABLED:
+        image_pipeline.start()
+        print("🖼️ Image pipeline workers started")
+    
+    unsplash_service = UnsplashService(client=http_clients.get_unsplash_client())
     print("✅ Unsplash service initialized")
     
     # Initialize bot service for Marcin
-    bot_service = BotService()
+    bot_service = BotService(
+        http_client=http_clients.get_node_backend_client(),
+        unsplash_client=http_clients.get_unsplash_client()
+    )
     print("🤖 Marcin bot service initialized")
     
+    # Deliver posts left in the outbox by a previous run, and retry failed ones
+    await bot_service.start_outbox()
+    print("📮 Post outbox delivery started")
+    
+    # Keep the local photo catalog fresh in the background
+    source_usernames = [bot["unsplash_source"] for bot in get_premium_bot_accounts()]
+    await photo_catalog.start_background_refresh(source_usernames, fetch_source_portfolio)
+    print(f"📚 Photo catalog refresher started for {len(source_usernames)} source(s)")
+    
     # Set global variables for routers
     import routers.bot_router as bot_router_module
     bot_router_module.bot_service = bot_service
     
     # Start bot services if enabled
     if settings.BOT_ENABLED:
-        print("🚀 Starting Marcin bot scheduler...")
-        asyncio.create_task(bot_service.start_scheduler())
-        print("📝 Marcin bot scheduler started")
+        if settings.SCHEDULER_LEADER_ELECTION:
+            # Every worker/replica competes; only the lease holder runs the scheduler
+            scheduler_lease = LeaderLease("bot-scheduler", bot_service.start_scheduler, bot_service.stop_scheduler)
+            await scheduler_lease.start()
+            print("🗳️ Competing for the bot scheduler lease")
+        else:
+            print("🚀 Starting Marcin bot scheduler...")
+            asyncio.create_task(bot_service.start_scheduler())
+            print("📝 Marcin bot scheduler started")
         
         # Start keep-alive task to prevent Railway sleep
         asyncio.create_task(keep_alive_task())
@@ -87,8 +119,15 @@ async def Lifecycle(app: FastAPI):
     
     # Shutdown
     print("🛑 Shutting down Python Backend...")
+    if scheduler_lease:
+        await scheduler_lease.stop()
     if bot_service:
         await bot_service.stop_scheduler()
+        await bot_service.close()
+    await photo_catalog.stop_background_refresh()
+    await get_tracker_storage().close()
+    await http_clients.close()
+    image_pipeline.close()
     # Note: bot_interaction_service doesn't have stop_scheduler method
 
 # Create FastAPI app
@@ -119,7 +158,7 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint to prevent Railway sleep"""
-    global bot_service, unsplash_service
+    global bot_service, unsplash_service, scheduler_lease
     
     bot_status = "running" if bot_service and bot_service.is_running else "stopped"
     
@@ -130,8 +169,14 @@ async def health_check():
         "services": {
             "unsplash": "available" if unsplash_service else "unavailable",
             "bot_scheduler": bot_status,
+            "scheduler_engine": bot_service.get_scheduler_stats() if bot_service else None,
+            "post_pipeline": bot_service.get_pipeline_stats() if bot_service else None,
+            "post_outbox": await bot_service.get_outbox_stats() if bot_service else None,
+            "scheduler_lease": scheduler_lease.get_stats() if scheduler_lease else None,
             "schedule_tracker": "active",
-            "photo_tracker": "active"
+            "photo_tracker": "active",
+            "tracker_storage": get_tracker_storage().get_stats(),
+            "photo_catalog": photo_catalog.get_stats()
         }
     }
 
@@ -3,11 +3,15 @@ Bot API Router
 Endpoints for managing automated content generation
 """
 
+import asyncio
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel
 from typing import Optional
 from services.bot_service import BotService
 from services.premium_bot_accounts import get_premium_bot_accounts
+from services.posting_schedule import posting_schedules
+from services.rate_budget_service import RateBudgetExceeded, unsplash_budget
+from services.single_flight import api_flight, upstream_flight
 from config import settings
 
 # Global service references (will be set by main.py)
@@ -83,11 +87,14 @@ async def create_single_post(theme: str = "random"):
                 "photo_id": result.get("photo_id"),
                 "photographer": result.get("photographer"),
                 "likes": result.get("likes"),
+                "delivery": result.get("delivery"),
                 "theme": theme
             }
         else:
             raise HTTPException(status_code=400, detail=result["error"])
     
+    except RateBudgetExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error creating post: {str(e)}")
 
@@ -109,6 +116,8 @@ async def get_bot_stats():
         if not marcin_bot:
             return {"error": "No Marcin bot configuration found"}
         
+        schedule = posting_schedules.get(marcin_bot["username"])
+        
         return {
             "bot_info": {
                 "username": marcin_bot["username"],
@@ -119,8 +128,9 @@ async def get_bot_stats():
             },
             "scheduler_status": {
                 "is_running": bot_service.is_running,
-                "posting_times": ["09:00", "15:00", "19:00"],
-                "timezone": "Asia/Ho_Chi_Minh"
+                "posting_times": schedule.describe(),
+                "cron": schedule.expressions,
+                "timezone": schedule.timezone.zone
             },
             "content_strategy": {
                 "themes": marcin_bot["content_themes"],
@@ -215,7 +225,7 @@ async def get_avatar_stats():
 async def get_hybrid_image_stats():
     """Get hybrid image service statistics"""
     try:
-        global hybrid_image_service, unsplash_service
+        global hybrid_image_service
         if not hybrid_image_service:
             raise HTTPException(status_code=503, detail="Hybrid image service not initialized")
         
@@ -225,8 +235,9 @@ async def get_hybrid_image_stats():
             "success": True,
             "hybrid_stats": stats,
             "services": {
+                # Throttling is the shared rate budget's job now
                 "unsplash": {
-                    "consecutive_errors": unsplash_service.consecutive_errors if unsplash_service else 0
+                    "rate_budget": unsplash_budget.get_stats()
                 },
                 "pexels": {
                     "consecutive_errors": 0  # Pexels service doesn't track errors yet
@@ -295,12 +306,16 @@ async def get_marcin_photos(per_page: int = 10, page: int = 1):
     try:
         from services.marcin_art_service import get_marcin_photos
         
-        result = await get_marcin_photos(per_page, page)
+        # Concurrent identical requests (e.g. several dashboard tabs) share one call
+        result = await api_flight.do(
+            ("marcin-photos", per_page, page),
+            lambda: get_marcin_photos(per_page, page)
+        )
         
         if result["success"]:
             return {
                 "success": True,
-                "photos": result["photos"],
+                "photos": [photo.to_dict() for photo in result["photos"]],
                 "total_photos": result["total_photos"],
                 "photographer": result["photographer"],
                 "page": page,
@@ -309,6 +324,8 @@ async def get_marcin_photos(per_page: int = 10, page: int = 1):
         else:
             raise HTTPException(status_code=400, detail=result["error"])
             
+    except RateBudgetExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching Marcin photos: {str(e)}")
 
@@ -318,17 +335,21 @@ async def get_random_marcin_photo():
     try:
         from services.marcin_art_service import get_random_marcin_photo
         
+        # Not coalesced: each call reserves its own photo; the upstream
+        # fetch behind it is shared through the catalog refresh instead
         result = await get_random_marcin_photo()
         
         if result["success"]:
             return {
                 "success": True,
-                "photo": result["photo"],
+                "photo": result["photo"].to_dict(),
                 "selection_method": result["selection_method"]
             }
         else:
             raise HTTPException(status_code=400, detail=result["error"])
             
+    except RateBudgetExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting random photo: {str(e)}")
 
@@ -338,12 +359,15 @@ async def get_marcin_photos_by_theme(theme: str):
     try:
         from services.marcin_art_service import get_marcin_photo_by_theme
         
-        result = await get_marcin_photo_by_theme(theme)
+        result = await api_flight.do(
+            ("marcin-theme", theme.lower()),
+            lambda: get_marcin_photo_by_theme(theme)
+        )
         
         if result["success"]:
             return {
                 "success": True,
-                "photos": result["photos"],
+                "photos": [photo.to_dict() for photo in result["photos"]],
                 "theme": result["theme"],
                 "total_found": result["total_found"],
                 "selection_method": result["selection_method"]
@@ -351,6 +375,8 @@ async def get_marcin_photos_by_theme(theme: str):
         else:
             raise HTTPException(status_code=400, detail=result["error"])
             
+    except RateBudgetExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting themed photos: {str(e)}")
 
@@ -390,43 +416,89 @@ async def get_photo_usage_stats():
         from services.photo_tracker_service import get_photo_stats
         
         bot_username = "marcin_frames_art"
+        from services.perceptual_hash_service import perceptual_hashes
+        
         stats = get_photo_stats(bot_username)
         
         return {
             "success": True,
             "bot_username": bot_username,
             "photo_usage": stats,
+            "near_duplicates": perceptual_hashes.get_stats(),
             "duplicate_prevention": "active"
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting photo stats: {str(e)}")
 
 @router.get("/schedule-stats")
-async def get_schedule_stats():
+async def get_schedule_stats(bot_username: str = "marcin_frames_art", upcoming: int = 10):
     """Get schedule tracking statistics"""
     try:
         from services.schedule_tracker_service import get_schedule_stats
         
-        bot_username = "marcin_frames_art"
         stats = get_schedule_stats(bot_username)
+        next_posts = posting_schedules.next_posting_times()
         
         return {
             "success": True,
             "bot_username": bot_username,
             "schedule_tracking": stats,
+            "upcoming_posts": [
+                {"bot_username": username, "slot": slot.isoformat()}
+                for slot, username in next_posts[:max(upcoming, 0)]
+            ],
+            "scheduled_bots": len(next_posts),
             "persistent_scheduling": "active"
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting schedule stats: {str(e)}")
 
+@router.get("/rate-budget")
+async def get_rate_budget():
+    """Get the shared Unsplash rate budget"""
+    return {
+        "success": True,
+        "unsplash": unsplash_budget.get_stats(),
+        "coalescing": {
+            "api": api_flight.get_stats(),
+            "upstream": upstream_flight.get_stats()
+        }
+    }
+
+@router.get("/outbox")
+async def get_post_outbox():
+    """Get the Node backend delivery outbox and its dead letters"""
+    if not bot_service:
+        raise HTTPException(status_code=503, detail="Bot service not initialized")
+    
+    return {
+        "success": True,
+        "outbox": await bot_service.get_outbox_stats(),
+        "dead_letters": await asyncio.to_thread(bot_service.outbox.get_dead_letters)
+    }
+
+@router.post("/outbox/requeue-dead")
+async def requeue_dead_posts():
+    """Retry every dead-lettered post from scratch"""
+    if not bot_service:
+        raise HTTPException(status_code=503, detail="Bot service not initialized")
+    
+    requeued = await asyncio.to_thread(bot_service.outbox.requeue_dead_letters)
+    return {
+        "success": True,
+        "requeued": requeued
+    }
+
 @router.post("/reset-photo-history")
 async def reset_photo_usage_history():
     """Reset photo usage history (for testing or when all photos exhausted)"""
     try:
         from services.photo_tracker_service import reset_used_photos
+        from services.perceptual_hash_service import perceptual_hashes
         
         bot_username = "marcin_frames_art"
         reset_used_photos(bot_username)
+        await perceptual_hashes.reset_posted(bot_username)
         
         return {
             "success": True,
@@ -4,33 +4,77 @@ Handles automated content creation for Marcin Frames Art Bot
 """
 
 import asyncio
-import aiohttp
+import httpx
 import logging
 import random
-from datetime import datetime, timedelta
+import uuid
+from datetime import datetime
 from typing import Dict, List, Optional
 import os
 
 from .premium_bot_accounts import get_premium_bot_accounts
 from .marcin_art_service import MarcinArtService
-from .schedule_tracker_service import can_post_now, mark_post_created, get_schedule_stats, is_posting_time, get_vietnam_time
+from .http_client_service import http_clients
+from .photo_catalog_service import photo_catalog
+from .photo_index import determine_mood
+from .photo_model import Photo
+from .image_pipeline_service import image_pipeline
+from .perceptual_hash_service import perceptual_hashes
+from .rate_budget_service import unsplash_priority, PRIORITY_SCHEDULED, RateBudgetExceeded
+from .scheduler_engine import SchedulerEngine
+from .post_pipeline import PostPipeline, PostJob
+from .post_outbox import PostOutbox, STATUS_DELIVERED, STATUS_PENDING
+from .posting_schedule import posting_schedules
+from .photo_tracker_service import reserve_photo, reuse_least_recent, release_photo
+from .schedule_tracker_service import can_post_now, claim_post_slot, release_post_slot, is_slot_posted, get_schedule_stats
 
 logger = logging.getLogger(__name__)
 
+# Scheduled posts pick one of these at random ("random" or a theme search)
+SELECTION_METHODS = ("random", "portrait", "artistic", "dramatic", "fashion")
+
 class BotService:
-    def __init__(self, image_service=None):
+    def __init__(self, image_service=None, http_client: Optional[httpx.AsyncClient] = None, unsplash_client: Optional[httpx.AsyncClient] = None):
         self.image_service = image_service
         self.node_backend_url = os.getenv('NODE_BACKEND_URL', 'http://localhost:5000')
+        self._http_client = http_client
         self.is_running = False
-        self.scheduler_task = None
-        self.marcin_service = MarcinArtService()
+        # bot_username -> post built ahead of its slot
+        self.staged_posts: Dict[str, PostJob] = {}
+        
+        # Every premium art bot with an Unsplash source gets its own photo service
+        self.bots: Dict[str, Dict] = {}
+        self.art_services: Dict[str, MarcinArtService] = {}
+        for bot in get_premium_bot_accounts():
+            if bot.get("unsplash_source"):
+                self.bots[bot["username"]] = bot
+                self.art_services[bot["username"]] = MarcinArtService(client=unsplash_client, source_username=bot["unsplash_source"])
         
         # Get Marcin bot configuration
         bot_accounts = get_premium_bot_accounts()
         self.marcin_bot = bot_accounts[0] if bot_accounts else None
+        self.marcin_service = self.art_services.get("marcin_frames_art") or MarcinArtService(client=unsplash_client)
         
         if not self.marcin_bot:
             logger.warning("⚠️ No Marcin bot configuration found")
+        
+        self.scheduler = SchedulerEngine(self._post_scheduled_slot, self._stage_scheduled_slot, is_slot_posted)
+        
+        # Scheduled, pre-staged and manual posts all go through the same stages
+        self.pipeline = PostPipeline([
+            ("select", self._select_photo),
+            ("enrich", self._enrich_post),
+            ("caption", self._write_caption),
+            ("render", self._render_post),
+            ("deliver", self._deliver_post)
+        ])
+        # Payloads are persisted before they're sent, and retried until the backend has them
+        self.outbox = PostOutbox(self._send_post_to_backend)
+    
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """Injected client, or the app-wide pooled Node backend client"""
+        return self._http_client or http_clients.get_node_backend_client()
     
     async def start_scheduler(self):
         """Start the automated posting scheduler"""
@@ -39,10 +83,17 @@ class BotService:
             return
         
         self.is_running = True
-        logger.info("🚀 Starting Marcin Art Bot scheduler...")
+        logger.info("🚀 Starting art bot scheduler...")
+        
+        schedules = {}
+        for bot_username, schedule in posting_schedules.load().items():
+            if bot_username in self.bots:
+                schedules[bot_username] = schedule
+            else:
+                logger.info(f"⏭️ @{bot_username} has a posting schedule but no photo source, not scheduling it")
         
-        # Start the scheduler task
-        self.scheduler_task = asyncio.create_task(self._scheduler_loop())
+        self.scheduler.set_schedules(schedules)
+        await self.scheduler.start()
         
     async def stop_scheduler(self):
         """Stop the automated posting scheduler"""
@@ -50,42 +101,72 @@ class BotService:
             return
         
         self.is_running = False
-        logger.info("🛑 Stopping Marcin Art Bot scheduler...")
+        logger.info("🛑 Stopping art bot scheduler...")
+        
+        await self.scheduler.stop()
+        
+        # A staged post that will never be sent shouldn't keep its photo reserved
+        for staged in self.staged_posts.values():
+            self._release_undelivered(staged)
+        self.staged_posts.clear()
+    
+    async def start_outbox(self):
+        """Start delivering queued posts (including ones left from before a restart)"""
+        await self.outbox.start()
+    
+    async def close(self):
+        """Stop the post pipeline's workers, then drain the outbox"""
+        await self.pipeline.close()
+        await self.outbox.close()
+    
+    def reschedule(self):
+        """Recompute next fire times now (e.g. after a posting schedule changed)"""
+        self.scheduler.reschedule()
+    
+    def get_scheduler_stats(self) -> Dict:
+        """Get scheduler engine statistics"""
+        stats = self.scheduler.get_stats()
+        stats["staged_posts"] = len(self.staged_posts)
+        return stats
+    
+    def get_pipeline_stats(self) -> Dict:
+        """Get post pipeline statistics"""
+        return self.pipeline.get_stats()
+    
+    async def get_outbox_stats(self) -> Dict:
+        """Get delivery outbox statistics (read off the event loop)"""
+        return await asyncio.to_thread(self.outbox.get_stats)
+    
+    async def _stage_scheduled_slot(self, bot_username: str, slot: datetime):
+        """Build the next post ahead of its slot so the slot itself only has to send"""
+        self._discard_stale_staged_post(bot_username, slot)
+        if bot_username not in self.staged_posts:
+            with unsplash_priority(PRIORITY_SCHEDULED):
+                await self._prestage_next_post(bot_username, slot)
+    
+    async def _post_scheduled_slot(self, bot_username: str, slot: datetime):
+        """Claim a slot and post for it"""
+        # Claim the slot first so no other worker posts it too
+        time_slot = await claim_post_slot(bot_username, slot)
+        if time_slot is None:
+            logger.info(f"⏭️ Slot {slot.strftime('%H:%M')} already claimed for {bot_username}")
+            return
         
-        if self.scheduler_task:
-            self.scheduler_task.cancel()
-            try:
-                await self.scheduler_task
-            except asyncio.CancelledError:
-                pass
-    
-    async def _scheduler_loop(self):
-        """Main scheduler loop for automated posting with persistent tracking"""
+        logger.info(f"⏰ Time to create art post for {bot_username} in the {time_slot} slot...")
         try:
-            while self.is_running:
-                try:
-                    # Check if it's time to post using Vietnam timezone and persistent tracking
-                    if can_post_now("marcin_frames_art"):
-                        vietnam_time = get_vietnam_time()
-                        logger.info(f"⏰ Time to create Marcin art post at {vietnam_time.strftime('%H:%M')} Vietnam time...")
-                        
-                        result = await self._create_art_post()
-                        if result and result.get("success"):
-                            # Mark post as created in persistent tracker
-                            mark_post_created("marcin_frames_art")
-                            logger.info("✅ Post created and tracked successfully")
-                    
-                    # Check every 5 minutes for more responsive scheduling
-                    await asyncio.sleep(300)  # 5 minutes
-                    
-                except Exception as e:
-                    logger.error(f"❌ Error in scheduler loop: {str(e)}")
-                    await asyncio.sleep(300)  # Wait 5 minutes on error
-                    
+            with unsplash_priority(PRIORITY_SCHEDULED):
+                result = await self._create_art_post(bot_username, slot)
         except asyncio.CancelledError:
-            logger.info("📋 Scheduler loop cancelled")
-        except Exception as e:
-            logger.error(f"❌ Fatal error in scheduler loop: {str(e)}")
+            # Stopped mid-post (shutdown or lost lease): keep the slot only if its post is already queued
+            if not await asyncio.to_thread(self.outbox.has_post, self._post_key(bot_username, slot)):
+                release_post_slot(bot_username, time_slot, slot.strftime('%Y-%m-%d'))
+            raise
+        
+        if result and result.get("success"):
+            logger.info("✅ Post created and tracked successfully")
+        else:
+            # Give the slot back so it isn't recorded as posted
+            release_post_slot(bot_username, time_slot, slot.strftime('%Y-%m-%d'))
     
     async def _should_post_now(self) -> bool:
         """DEPRECATED: Use schedule_tracker_service.can_post_now() instead"""
@@ -94,217 +175,340 @@ class BotService:
     
     # Removed _can_post_now method - replaced by persistent schedule tracking
     
-    async def _create_art_post(self):
-        """Create and post an artistic post using Marcin's photos"""
+    # Post pipeline stages: select -> enrich -> caption -> render -> deliver
+    
+    async def _pick_photo(self, job: PostJob, service: MarcinArtService) -> Optional[Photo]:
+        """Get a photo for the job's selection method (random, or a theme search)"""
+        if job.method == "random":
+            result = await service.get_random_marcin_photo(job.bot_username)
+            if not result["success"]:
+                job.error = f"Failed to get random photo: {result['error']}"
+                logger.error(f"❌ {job.error}")
+                return None
+            job.reserved = result.get("reserved", True)
+            return result["photo"]
+        
+        result = await service.get_marcin_photo_by_theme(job.method)
+        if not (result["success"] and result["photos"]):
+            job.error = f"Failed to get {job.method} photos: {result.get('error', 'No photos found')}"
+            logger.error(f"❌ {job.error}")
+            return None
+        
+        # Search results aren't in the catalog, so they may not be hashed yet
+        await perceptual_hashes.ensure_hashes(f"'{job.method}' search", result["photos"])
+        candidates = list(perceptual_hashes.filter_near_duplicates(job.bot_username, result["photos"]))
+        if not candidates:
+            job.error = f"Every {job.method} photo looks like one already posted"
+            logger.error(f"❌ {job.error}")
+            return None
+        random.shuffle(candidates)
+        # Reserve it so nothing else (in any worker) picks it before the slot
+        for candidate in candidates:
+            if await reserve_photo(job.bot_username, candidate.id):
+                job.reserved = True
+                return candidate
+        
+        # Every match was used already: reuse whichever was posted longest ago
+        photo = await reuse_least_recent(job.bot_username, candidates)
+        if photo is None:
+            job.error = f"No {job.method} photos left to post"
+            logger.error(f"❌ {job.error}")
+            return None
+        job.reserved = True
+        return photo
+    
+    async def _select_photo(self, job: PostJob) -> bool:
+        """Select stage: pick (and reserve) the photo"""
+        service = self.art_services.get(job.bot_username)
+        if service is None:
+            job.error = f"No art bot configuration available for {job.bot_username}"
+            logger.error(f"❌ {job.error}")
+            return False
+        
+        logger.info(f"🎲 Using selection method: {job.method}")
+        # Pick up what other workers posted before checking for near-duplicates
+        await perceptual_hashes.refresh_posted()
+        photo = await self._pick_photo(job, service)
+        if photo and job.options.get("verify_image") and not await self._check_image_url(photo.url("regular")):
+            # Broken image: give the photo back and pick another one
+            job.photo = photo
+            self._release_undelivered(job)
+            photo = await self._pick_photo(job, service)
+        
+        job.photo = photo
+        return photo is not None
+    
+    async def _enrich_post(self, job: PostJob) -> bool:
+        """Enrich stage: look up the photo's mood"""
+        job.mood = self._determine_mood_from_photo(job.photo, self.art_services[job.bot_username].marcin_username)
+        return True
+    
+    async def _write_caption(self, job: PostJob) -> bool:
+        """Caption stage: write the post text"""
+        job.caption = self.art_services[job.bot_username].generate_artistic_caption(job.photo)
+        return True
+    
+    async def _render_post(self, job: PostJob) -> bool:
+        """Render stage: prepare the feed image and build the Node.js payload"""
+        bot = self.bots[job.bot_username]
+        photo = job.photo
+        
+        if job.scheduled:
+            time_context = {"scheduled": True, "selection_method": job.method}
+        else:
+            time_context = {"manual": True, "theme": job.method}
+        
+        job.post_data = {
+            "content": job.caption,
+            "images": [photo.url("regular")],  # Use regular size for posts
+            "bot_metadata": {
+                "bot_user": {
+                    "username": bot["username"],
+                    "name": bot["displayName"],
+                    "bio": bot["bio"],
+                    "botType": bot["botType"]
+                },
+                "topic": job.method,
+                "photo_data": photo.to_post_photo_data()
+            },
+            "post_type": "artistic_photo",
+            "mood": job.mood,
+            "time_context": {
+                "posting_time": datetime.now().isoformat(),
+                **time_context
+            }
+        }
+        
+        # Hand Node a small feed-sized derivative instead of the full image URL
+        job.image = await image_pipeline.prepare_post_image(photo, self.art_services[job.bot_username].client)
+        if job.image:
+            job.post_data["images"] = [job.image["data_uri"]]
+            job.post_data["bot_metadata"]["image_derivative"] = {
+                "crop": job.image["crop"],
+                "mime_type": job.image["mime_type"],
+                "size": job.image["size"],
+                "source_url": photo.url("regular")
+            }
+        return True
+    
+    async def _deliver_post(self, job: PostJob) -> bool:
+        """Deliver stage: queue the payload in the outbox and send it to the Node.js backend"""
+        if job.idempotency_key is None:
+            job.idempotency_key = self._post_key(job.bot_username, job.slot)
+        
+        job.post_data["time_context"]["posting_time"] = datetime.now().isoformat()
+        if not await self.outbox.enqueue(job.idempotency_key, job.bot_username, job.post_data):
+            job.error = f"Post {job.idempotency_key} is already queued"
+            return False
+        
+        # The outbox owns the post now: a pending one is retried (even if this job is
+        # cancelled), so it counts as posted
+        job.delivery = STATUS_PENDING
+        status = await self.outbox.deliver_now(job.idempotency_key)
+        if status not in (STATUS_DELIVERED, STATUS_PENDING):
+            job.delivery = None
+            job.error = "Backend rejected the post"
+            return False
+        
+        job.delivery = status
+        await perceptual_hashes.record_posted(job.bot_username, job.photo)
+        return True
+    
+    def _post_key(self, bot_username: str, slot: Optional[datetime]) -> str:
+        """Idempotency key: one per slot, so a retry or a restart can't post the slot twice"""
+        if slot:
+            return f"{bot_username}:{slot.isoformat()}"
+        return f"{bot_username}:manual:{uuid.uuid4().hex}"
+    
+    def _release_undelivered(self, job: PostJob):
+        """Give back the photo of a job that never reached the outbox (only if the job reserved it)"""
+        if job.photo and job.reserved and job.delivery is None:
+            release_photo(job.bot_username, job.photo.id)
+            job.reserved = False
+    
+    async def _abandon_job(self, job: PostJob):
+        """Clean up after a cancelled job, unless its post reached the outbox anyway"""
+        if job.delivery is None and job.idempotency_key is not None:
+            # Cancelled while the outbox was storing it
+            if await asyncio.to_thread(self.outbox.has_post, job.idempotency_key):
+                job.delivery = STATUS_PENDING
+        self._release_undelivered(job)
+    
+    async def _prestage_next_post(self, bot_username: str, slot: datetime):
+        """Build, verify and hold the post for the upcoming slot"""
+        job = None
         try:
-            if not self.marcin_bot:
-                logger.error("❌ No Marcin bot configuration available")
+            logger.info(f"📦 Pre-staging art post for {bot_username} at {slot.strftime('%H:%M')}...")
+            
+            job = PostJob(bot_username, random.choice(SELECTION_METHODS), scheduled=True, verify_image=True)
+            if not await self.pipeline.run(job, until="render"):
+                self._release_undelivered(job)
+                logger.warning("⚠️ Pre-staging failed, the post will be built at the slot")
                 return
             
-            logger.info("🎨 Creating Marcin art post...")
+            await self._warm_backend_connection()
             
-            # Get a random artistic photo from Marcin's collection
-            async with self.marcin_service as service:
-                # Randomly choose between different selection methods
-                selection_methods = [
-                    ("random", lambda: service.get_random_marcin_photo("marcin_frames_art")),
-                    ("portrait", lambda: service.get_marcin_photo_by_theme("portrait")),
-                    ("artistic", lambda: service.get_marcin_photo_by_theme("artistic")),
-                    ("dramatic", lambda: service.get_marcin_photo_by_theme("dramatic")),
-                    ("fashion", lambda: service.get_marcin_photo_by_theme("fashion"))
-                ]
-                
-                method_name, method_func = random.choice(selection_methods)
-                logger.info(f"🎲 Using selection method: {method_name}")
-                
-                if method_name == "random":
-                    result = await method_func()
-                    if result["success"]:
-                        photo = result["photo"]
-                        caption = service.generate_artistic_caption(photo)
-                    else:
-                        logger.error(f"❌ Failed to get random photo: {result['error']}")
-                        return
-                else:
-                    result = await method_func()
-                    if result["success"] and result["photos"]:
-                        photo = random.choice(result["photos"])
-                        caption = service.generate_artistic_caption(photo)
-                    else:
-                        logger.error(f"❌ Failed to get {method_name} photos: {result.get('error', 'No photos found')}")
-                        return
+            job.slot = slot
+            self.staged_posts[bot_username] = job
+            logger.info(f"📦 Staged photo {job.photo.id} ({job.method}) for {bot_username} at {slot.strftime('%H:%M')}")
             
-            # Prepare post data for Node.js backend
-            post_data = {
-                "content": caption,
-                "images": [photo["urls"]["regular"]],  # Use regular size for posts
-                "bot_metadata": {
-                    "bot_user": {
-                        "username": self.marcin_bot["username"],
-                        "name": self.marcin_bot["displayName"],
-                        "bio": self.marcin_bot["bio"],
-                        "botType": self.marcin_bot["botType"]
-                    },
-                    "topic": method_name,
-                    "photo_data": {
-                        "id": photo["id"],
-                        "description": photo["description"],
-                        "photographer": photo["photographer"]["name"],
-                        "likes": photo["likes"],
-                        "tags": photo["tags"],
-                        "unsplash_url": photo["html_url"]
-                    }
-                },
-                "post_type": "artistic_photo",
-                "mood": self._determine_mood_from_photo(photo),
-                "time_context": {
-                    "posting_time": datetime.now().isoformat(),
-                    "scheduled": True,
-                    "selection_method": method_name
-                }
-            }
+        except asyncio.CancelledError:
+            if job and self.staged_posts.get(bot_username) is not job:
+                self._release_undelivered(job)
+            raise
+        except Exception as e:
+            logger.error(f"❌ Error pre-staging post: {str(e)}")
+    
+    async def _check_image_url(self, url: str) -> bool:
+        """HEAD-check that an image URL is still served"""
+        try:
+            response = await self.marcin_service.client.head(url, follow_redirects=True, timeout=10.0)
+            if response.status_code < 400:
+                return True
+            logger.warning(f"⚠️ Image check returned {response.status_code} for {url}")
+        except Exception as e:
+            logger.warning(f"⚠️ Image check failed for {url}: {str(e)}")
+        return False
+    
+    async def _warm_backend_connection(self):
+        """Open a pooled connection to the Node.js backend ahead of the slot"""
+        try:
+            await self.http_client.get(f"{self.node_backend_url}/api/health", timeout=10.0)
+        except Exception as e:
+            logger.warning(f"⚠️ Backend warm-up failed: {str(e)}")
+    
+    def _take_staged_post(self, bot_username: str, slot: Optional[datetime]) -> Optional[PostJob]:
+        """Hand over the bot's staged post if it was built for this slot"""
+        staged = self.staged_posts.get(bot_username)
+        if not staged or staged.slot != slot:
+            # A post staged for another (e.g. upcoming) slot stays put; staging discards stale ones
+            return None
+        
+        return self.staged_posts.pop(bot_username)
+    
+    def _discard_stale_staged_post(self, bot_username: str, slot: datetime):
+        """Drop a staged post built for another slot (missed, or the schedule changed)"""
+        staged = self.staged_posts.get(bot_username)
+        if staged and staged.slot != slot:
+            logger.info(f"🗑️ Discarding staged post for {bot_username} at {staged.slot.strftime('%H:%M')}")
+            self._release_undelivered(staged)
+            del self.staged_posts[bot_username]
+    
+    async def _create_art_post(self, bot_username: str = "marcin_frames_art", slot: Optional[datetime] = None) -> Dict:
+        """Create and post an artistic post from the bot's source photos"""
+        job = None
+        try:
+            job = self._take_staged_post(bot_username, slot)
+            if job:
+                logger.info(f"📦 Sending pre-staged post for {bot_username} at {job.slot.strftime('%H:%M')}")
+            else:
+                logger.info(f"🎨 Creating art post for {bot_username}...")
+                job = PostJob(bot_username, random.choice(SELECTION_METHODS), scheduled=True)
+                job.slot = slot
             
-            # Send to Node.js backend
-            success = await self._send_post_to_backend(post_data)
+            # A staged job carries on from the deliver stage
+            success = await self.pipeline.run(job)
             
-            if success:
-                logger.info(f"✅ Successfully created Marcin art post using {method_name} method")
-                logger.info(f"📸 Photo: {photo['id']} by {photo['photographer']['name']}")
-                logger.info(f"❤️ Likes: {photo['likes']}")
+            if success and job.delivery == STATUS_PENDING:
+                logger.info(f"📮 Art post for {bot_username} queued for retry ({job.idempotency_key})")
+            elif success:
+                logger.info(f"✅ Successfully created art post for {bot_username} using {job.method} method")
+                logger.info(f"📸 Photo: {job.photo.id} by {job.photo.photographer_name}")
+                logger.info(f"❤️ Likes: {job.photo.likes}")
             else:
-                logger.error("❌ Failed to create Marcin art post")
+                logger.error(f"❌ Failed to create art post for {bot_username}")
+                self._release_undelivered(job)
+            
+            return {"success": success}
                 
+        except asyncio.CancelledError:
+            if job:
+                await self._abandon_job(job)
+            raise
         except Exception as e:
             logger.error(f"❌ Error creating art post: {str(e)}")
+            if job:
+                self._release_undelivered(job)
+            return {"success": False}
     
-    def _determine_mood_from_photo(self, photo: Dict) -> str:
+    def _determine_mood_from_photo(self, photo: Photo, source_username: Optional[str] = None) -> str:
         """Determine mood from photo metadata"""
-        description = (photo.get("description", "") or "").lower()
-        tags = [tag.lower() for tag in photo.get("tags", [])]
-        all_text = f"{description} {' '.join(tags)}"
-        
-        # Mood keywords
-        if any(word in all_text for word in ["dark", "shadow", "dramatic", "moody", "black"]):
-            return "dramatic"
-        elif any(word in all_text for word in ["fashion", "style", "elegant", "chic"]):
-            return "sophisticated"
-        elif any(word in all_text for word in ["portrait", "face", "person", "model"]):
-            return "intimate"
-        elif any(word in all_text for word in ["art", "creative", "artistic", "abstract"]):
-            return "creative"
-        else:
-            return "artistic"
+        # Catalogued photos have their mood precomputed by the keyword index
+        index = photo_catalog.get_index(source_username or self.marcin_service.marcin_username)
+        mood = index.mood_for(photo.id)
+        return mood or determine_mood(photo)
     
-    async def _send_post_to_backend(self, post_data: Dict) -> bool:
-        """Send post data to Node.js backend"""
+    async def _send_post_to_backend(self, post_data: Dict, idempotency_key: str) -> Optional[int]:
+        """Send post data to Node.js backend (HTTP status, or None without a response)"""
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.node_backend_url}/api/bot/create-post",
-                    json=post_data,
-                    headers={'Content-Type': 'application/json'},
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    
-                    if response.status == 201:
-                        result = await response.json()
-                        logger.info(f"✅ Post created successfully: {result.get('message', 'Success')}")
-                        return True
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"❌ Backend error {response.status}: {error_text}")
-                        return False
-                        
-        except asyncio.TimeoutError:
+            response = await self.http_client.post(
+                f"{self.node_backend_url}/api/bot/create-post",
+                json=post_data,
+                headers={'Content-Type': 'application/json', 'Idempotency-Key': idempotency_key},
+                timeout=30.0
+            )
+            
+            # 200 means an earlier attempt with this key already created the post
+            if response.status_code in (200, 201):
+                result = response.json()
+                logger.info(f"✅ Post created successfully: {result.get('message', 'Success')}")
+            else:
+                logger.error(f"❌ Backend error {response.status_code}: {response.text}")
+            return response.status_code
+                
+        except httpx.TimeoutException:
             logger.error("⏰ Timeout sending post to backend")
-            return False
+            return None
         except Exception as e:
             logger.error(f"❌ Error sending post to backend: {str(e)}")
-            return False
+            return None
+    
     
     async def create_manual_post(self, theme: str = "random") -> Dict:
         """Manually create a post for testing"""
+        job = None
         try:
             logger.info(f"🎨 Creating manual Marcin art post with theme: {theme}")
             
-            if not self.marcin_bot:
+            if "marcin_frames_art" not in self.bots:
                 return {
                     "success": False,
                     "error": "No Marcin bot configuration available"
                 }
             
-            # Get photo based on theme
-            async with self.marcin_service as service:
-                if theme == "random":
-                    result = await service.get_random_marcin_photo("marcin_frames_art")
-                    if result["success"]:
-                        photo = result["photo"]
-                    else:
-                        return {
-                            "success": False,
-                            "error": f"Failed to get random photo: {result['error']}"
-                        }
-                else:
-                    result = await service.get_marcin_photo_by_theme(theme)
-                    if result["success"] and result["photos"]:
-                        photo = random.choice(result["photos"])
-                    else:
-                        return {
-                            "success": False,
-                            "error": f"Failed to get {theme} photos: {result.get('error', 'No photos found')}"
-                        }
-                
-                caption = service.generate_artistic_caption(photo)
-            
-            # Create post data
-            post_data = {
-                "content": caption,
-                "images": [photo["urls"]["regular"]],
-                "bot_metadata": {
-                    "bot_user": {
-                        "username": self.marcin_bot["username"],
-                        "name": self.marcin_bot["displayName"],
-                        "bio": self.marcin_bot["bio"],
-                        "botType": self.marcin_bot["botType"]
-                    },
-                    "topic": theme,
-                    "photo_data": {
-                        "id": photo["id"],
-                        "description": photo["description"],
-                        "photographer": photo["photographer"]["name"],
-                        "likes": photo["likes"],
-                        "tags": photo["tags"],
-                        "unsplash_url": photo["html_url"]
-                    }
-                },
-                "post_type": "artistic_photo",
-                "mood": self._determine_mood_from_photo(photo),
-                "time_context": {
-                    "posting_time": datetime.now().isoformat(),
-                    "manual": True,
-                    "theme": theme
-                }
-            }
-            
-            # Send to backend
-            success = await self._send_post_to_backend(post_data)
-            
-            if success:
-                return {
-                    "success": True,
-                    "message": f"Successfully created manual art post with theme: {theme}",
-                    "photo_id": photo["id"],
-                    "photographer": photo["photographer"]["name"],
-                    "likes": photo["likes"]
-                }
-            else:
+            job = PostJob("marcin_frames_art", theme)
+            if not await self.pipeline.run(job):
+                self._release_undelivered(job)
                 return {
                     "success": False,
-                    "error": "Failed to send post to backend"
+                    "error": job.error or "Failed to create post"
                 }
+            
+            if job.delivery == STATUS_PENDING:
+                message = f"Manual art post with theme {theme} queued, the backend didn't take it yet"
+            else:
+                message = f"Successfully created manual art post with theme: {theme}"
+            return {
+                "success": True,
+                "message": message,
+                "delivery": job.delivery,
+                "photo_id": job.photo.id,
+                "photographer": job.photo.photographer_name,
+                "likes": job.photo.likes
+            }
                 
+        except asyncio.CancelledError:
+            if job:
+                await self._abandon_job(job)
+            raise
+        except RateBudgetExceeded:
+            if job:
+                self._release_undelivered(job)
+            raise
         except Exception as e:
             logger.error(f"❌ Error creating manual post: {str(e)}")
+            if job:
+                self._release_undelivered(job)
             return {
                 "success": False,
                 "error": str(e)
@@ -314,4 +518,7 @@ class BotService:
 async def create_bot_post():
     """Create a manual bot post"""
     service = BotService()
-    return await service.create_manual_post()
+    try:
+        return await service.create_manual_post()
+    finally:
+        await service.close()
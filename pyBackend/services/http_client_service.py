@@ -0,0 +1,93 @@
+"""
+HTTP Client Service
+Shared, keep-alive, connection-pooled HTTP clients for each upstream
+"""
+
+import importlib.util
+import logging
+from typing import Optional
+
+import httpx
+
+from config import settings, get_port
+from .rate_budget_service import unsplash_budget
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 needs the optional h2 package (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+class HttpClientService:
+    """Owns one pooled client per upstream for the lifetime of the app"""
+
+    def __init__(self):
+        self.unsplash: Optional[httpx.AsyncClient] = None
+        self.node_backend: Optional[httpx.AsyncClient] = None
+        self.local: Optional[httpx.AsyncClient] = None
+
+    def _build_client(self, base_url: str, http2: bool = False, timeout: float = 30.0, headers: Optional[dict] = None, event_hooks: Optional[dict] = None) -> httpx.AsyncClient:
+        """Build a pooled client using the configured limits"""
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS
+        )
+        return httpx.AsyncClient(
+            base_url=base_url,
+            http2=http2 and settings.HTTP2_ENABLED and HTTP2_AVAILABLE,
+            limits=limits,
+            timeout=timeout,
+            headers=headers,
+            event_hooks=event_hooks
+        )
+
+    async def start(self):
+        """Create the shared clients (called from the FastAPI lifespan)"""
+        self.get_unsplash_client()
+        self.get_node_backend_client()
+        self.get_local_client()
+
+        if settings.HTTP2_ENABLED and not HTTP2_AVAILABLE:
+            logger.warning("⚠️ HTTP/2 requested but h2 is not installed, using HTTP/1.1")
+
+        logger.info("🔌 Shared HTTP clients ready")
+
+    async def close(self):
+        """Close every shared client and release pooled connections"""
+        for client in (self.unsplash, self.node_backend, self.local):
+            if client and not client.is_closed:
+                await client.aclose()
+
+        self.unsplash = None
+        self.node_backend = None
+        self.local = None
+
+    def get_unsplash_client(self) -> httpx.AsyncClient:
+        """Client for api.unsplash.com and the Unsplash image CDN"""
+        if self.unsplash is None or self.unsplash.is_closed:
+            self.unsplash = self._build_client(
+                "https://api.unsplash.com",
+                http2=True,
+                headers={"Accept-Version": "v1"},
+                # Every API call is charged against (and synced with) the shared budget
+                event_hooks={
+                    "request": [unsplash_budget.on_request],
+                    "response": [unsplash_budget.on_response]
+                }
+            )
+        return self.unsplash
+
+    def get_node_backend_client(self) -> httpx.AsyncClient:
+        """Client for the Node.js backend"""
+        if self.node_backend is None or self.node_backend.is_closed:
+            self.node_backend = self._build_client("", http2=True)
+        return self.node_backend
+
+    def get_local_client(self) -> httpx.AsyncClient:
+        """Client for requests to this service itself (keep-alive pings)"""
+        if self.local is None or self.local.is_closed:
+            self.local = self._build_client(f"http://localhost:{get_port()}", timeout=5.0)
+        return self.local
+
+# Global instance
+http_clients = HttpClientService()
@@ -0,0 +1,185 @@
+"""
+Image Pipeline Service
+Downloads selected photos once and renders feed-sized derivatives with Pillow
+in worker processes, so the Node backend uploads a small asset to Cloudinary
+"""
+
+import asyncio
+import base64
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import httpx
+from PIL import Image, ImageFilter, ImageOps, features
+
+from config import settings
+from .http_client_service import http_clients
+from .photo_model import Photo
+
+logger = logging.getLogger(__name__)
+
+# Target aspect ratios (width / height) for feed crops
+CROP_RATIOS = {
+    "square": 1.0,   # 1:1
+    "portrait": 0.8  # 4:5
+}
+
+def _smart_crop_box(image: Image.Image, ratio: float) -> Tuple[int, int, int, int]:
+    """Crop box with the target ratio placed over the most detailed region"""
+    width, height = image.size
+    if width / height > ratio:
+        crop_width, crop_height = round(height * ratio), height
+    else:
+        crop_width, crop_height = width, round(width / ratio)
+
+    if (crop_width, crop_height) == (width, height):
+        return 0, 0, width, height
+
+    # Edge energy on a small grayscale copy decides where the window goes
+    scale = 128 / max(width, height)
+    small = image.convert("L").resize((max(1, round(width * scale)), max(1, round(height * scale))))
+    edges = small.filter(ImageFilter.FIND_EDGES)
+    small_width, small_height = edges.size
+    pixels = edges.load()
+
+    horizontal = crop_width < width
+    length = small_width if horizontal else small_height
+    window = max(1, round((crop_width if horizontal else crop_height) * scale))
+    if horizontal:
+        energy = [sum(pixels[x, y] for y in range(small_height)) for x in range(small_width)]
+    else:
+        energy = [sum(pixels[x, y] for x in range(small_width)) for y in range(small_height)]
+
+    # Sliding window over the 1-D energy profile
+    current = sum(energy[:window])
+    best_start, best_sum = 0, current
+    for start in range(1, length - window + 1):
+        current += energy[start + window - 1] - energy[start - 1]
+        if current > best_sum:
+            best_start, best_sum = start, current
+
+    offset = round(best_start / scale)
+    if horizontal:
+        left = min(offset, width - crop_width)
+        return left, 0, left + crop_width, crop_height
+    top = min(offset, height - crop_height)
+    return 0, top, crop_width, top + crop_height
+
+def _encode(image: Image.Image, image_format: str, quality: int) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue()
+
+def _encode_smallest(image: Image.Image, quality: int) -> Tuple[str, bytes]:
+    """Encode as WebP (and AVIF when Pillow supports it) and keep the smaller"""
+    candidates = [("image/webp", _encode(image, "WEBP", quality))]
+    if features.check("avif"):
+        candidates.append(("image/avif", _encode(image, "AVIF", quality)))
+    return min(candidates, key=lambda candidate: len(candidate[1]))
+
+def render_derivatives(data: bytes, feed_width: int, thumb_width: int, quality: int) -> Dict[str, Tuple[str, bytes]]:
+    """Render feed crops and a thumbnail (runs in a worker process)"""
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source).convert("RGB")
+
+    derivatives = {}
+    for name, ratio in CROP_RATIOS.items():
+        cropped = image.crop(_smart_crop_box(image, ratio))
+        if cropped.width > feed_width:
+            cropped = cropped.resize((feed_width, round(feed_width / ratio)), Image.LANCZOS)
+        derivatives[name] = _encode_smallest(cropped, quality)
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail((thumb_width, thumb_width * 2), Image.LANCZOS)
+    derivatives["thumbnail"] = _encode_smallest(thumbnail, quality)
+
+    return derivatives
+
+def compute_dhash(data: bytes) -> int:
+    """64-bit difference hash of an image (runs in a worker process)"""
+    with Image.open(io.BytesIO(data)) as source:
+        pixels = list(source.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+
+    dhash = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            right = pixels[row * 9 + column + 1]
+            dhash = (dhash << 1) | (left > right)
+    return dhash
+
+class ImagePipelineService:
+    """Owns the worker pool that renders post images"""
+
+    def __init__(self):
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        """Start the worker processes (called from the FastAPI lifespan)"""
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=settings.IMAGE_PIPELINE_WORKERS)
+            logger.info(f"🖼️ Image pipeline started with {settings.IMAGE_PIPELINE_WORKERS} workers")
+
+    def close(self):
+        """Stop the worker processes"""
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def download(self, url: str, client: Optional[httpx.AsyncClient] = None) -> bytes:
+        """Download an image through the shared Unsplash client"""
+        response = await (client or http_clients.get_unsplash_client()).get(url, follow_redirects=True, timeout=30.0)
+        response.raise_for_status()
+        return response.content
+
+    async def render(self, data: bytes) -> Dict[str, Tuple[str, bytes]]:
+        """Render derivatives off the event loop"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            render_derivatives,
+            data,
+            settings.IMAGE_FEED_WIDTH,
+            settings.IMAGE_THUMB_WIDTH,
+            settings.IMAGE_QUALITY
+        )
+
+    async def hash_image(self, data: bytes) -> int:
+        """Perceptual hash of an image, computed off the event loop"""
+        self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, compute_dhash, data)
+
+    async def prepare_post_image(self, photo: Photo, client: Optional[httpx.AsyncClient] = None) -> Optional[Dict]:
+        """Produce the smallest suitable feed asset for a photo (None to fall back to its URL)"""
+        if not settings.IMAGE_PIPELINE_ENABLED:
+            return None
+
+        try:
+            data = await self.download(photo.url("regular"), client)
+            derivatives = await self.render(data)
+
+            # Portrait photos keep more of the frame as 4:5, everything else goes square
+            crop = "portrait" if photo.height > photo.width else "square"
+            mime_type, content = derivatives[crop]
+
+            logger.info(f"🖼️ Rendered {crop} derivative for {photo.id}: {len(data) // 1024}KB -> {len(content) // 1024}KB ({mime_type})")
+
+            return {
+                "crop": crop,
+                "mime_type": mime_type,
+                "size": len(content),
+                "original_size": len(data),
+                "data_uri": f"data:{mime_type};base64,{base64.b64encode(content).decode('ascii')}",
+                "derivatives": {name: {"mime_type": mime, "size": len(body)} for name, (mime, body) in derivatives.items()}
+            }
+
+        except Exception as e:
+            logger.error(f"❌ Error rendering image for {photo.id}: {str(e)}")
+            return None
+
+# Global instance
+image_pipeline = ImagePipelineService()
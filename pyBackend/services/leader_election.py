@@ -0,0 +1,182 @@
+"""
+Leader Election
+Lease row in data/trackers.db so only one worker/replica runs the posting scheduler
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from config import settings
+from .tracker_storage import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+class LeaderLease:
+    """Holds a named lease while renewing it; whoever holds it is the leader
+
+    Every process races for the same row. The holder renews it every third of
+    the TTL, and a lease that hasn't been renewed within the TTL can be taken
+    over, so a crashed leader is replaced within one TTL. A leader that can't
+    renew steps down once its own lease would have expired.
+    """
+
+    def __init__(self, name: str, on_acquired: Callable[[], Awaitable], on_lost: Callable[[], Awaitable],
+                 ttl_seconds: Optional[float] = None, db_file: Optional[str] = None):
+        self.name = name
+        self.on_acquired = on_acquired
+        self.on_lost = on_lost
+        self.ttl = ttl_seconds or settings.SCHEDULER_LEASE_TTL_SECONDS
+        self.db_file = db_file or os.path.join(DATA_DIR, "trackers.db")
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self.is_leader = False
+        self.renewed_at: Optional[float] = None  # monotonic
+        # (holder, expires_at) as the election loop last read it
+        self.last_seen: Optional[Tuple[str, float]] = None
+        self.task: Optional[asyncio.Task] = None
+        self.elections_won = 0
+
+        self._ensure_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Manual transactions: BEGIN IMMEDIATE takes the write lock before reading the row
+        return sqlite3.connect(self.db_file, timeout=10.0, isolation_level=None)
+
+    def _ensure_db(self):
+        """Ensure the lease table exists"""
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT PRIMARY KEY,
+                    holder TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+
+    def _try_acquire(self) -> bool:
+        """Take or renew the lease if it's ours, free or expired"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (self.name,)).fetchone()
+                if row and row[0] != self.holder and row[1] > now:
+                    conn.execute("ROLLBACK")
+                    self.last_seen = row
+                    return False
+
+                conn.execute(
+                    "INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)",
+                    (self.name, self.holder, now + self.ttl)
+                )
+                conn.execute("COMMIT")
+                self.last_seen = (self.holder, now + self.ttl)
+                return True
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _release(self):
+        """Give the lease up so another process can take over at once"""
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder))
+        self.last_seen = None
+
+    def current_holder(self) -> Optional[Dict]:
+        """Who held the lease when the election loop last checked (None if nobody, or it has expired since)"""
+        row = self.last_seen
+        if not row or row[1] <= time.time():
+            return None
+        return {"holder": row[0], "expires_in_seconds": round(row[1] - time.time(), 1)}
+
+    async def _become_leader(self):
+        self.is_leader = True
+        self.elections_won += 1
+        logger.info(f"👑 {self.holder} is now leader for '{self.name}'")
+        try:
+            await self.on_acquired()
+        except Exception as e:
+            # Don't sit on a lease with nothing running: undo, hand it back and try again next round
+            logger.error(f"❌ {self.holder} failed to start as leader for '{self.name}': {str(e)}")
+            await self._step_down("startup failed")
+            try:
+                await asyncio.to_thread(self._release)
+            except Exception as e:
+                logger.error(f"❌ Error releasing lease '{self.name}': {str(e)}")
+
+    async def _step_down(self, reason: str):
+        self.is_leader = False
+        logger.warning(f"🏳️ {self.holder} stepped down as leader for '{self.name}': {reason}")
+        try:
+            await self.on_lost()
+        except Exception as e:
+            logger.error(f"❌ Error stepping down as leader for '{self.name}': {str(e)}")
+
+    async def _election_loop(self):
+        """Try for (or renew) the lease every third of the TTL"""
+        try:
+            while True:
+                try:
+                    acquired = await asyncio.to_thread(self._try_acquire)
+                except Exception as e:
+                    logger.error(f"❌ Lease check for '{self.name}' failed: {str(e)}")
+                    acquired = None
+
+                if acquired:
+                    self.renewed_at = time.monotonic()
+                    if not self.is_leader:
+                        await self._become_leader()
+                elif self.is_leader:
+                    if acquired is False:
+                        await self._step_down("lease taken over by another process")
+                    elif time.monotonic() - self.renewed_at >= self.ttl:
+                        # Others may already consider the lease free
+                        await self._step_down("could not renew the lease within its TTL")
+
+                await asyncio.sleep(self.ttl / 3)
+
+        except asyncio.CancelledError:
+            logger.info(f"📋 Leader election for '{self.name}' cancelled")
+
+    async def start(self):
+        """Start competing for the lease"""
+        if self.task is None:
+            self.task = asyncio.create_task(self._election_loop())
+
+    async def stop(self):
+        """Stop competing, and hand the lease back if we hold it"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+        if self.is_leader:
+            self.is_leader = False
+            await self.on_lost()
+            try:
+                await asyncio.to_thread(self._release)
+            except Exception as e:
+                logger.error(f"❌ Error releasing lease '{self.name}': {str(e)}")
+
+    def get_stats(self) -> Dict:
+        """Get lease statistics"""
+        return {
+            "name": self.name,
+            "me": self.holder,
+            "is_leader": self.is_leader,
+            "ttl_seconds": self.ttl,
+            "current": self.current_holder(),
+            "elections_won": self.elections_won
+        }
@@ -3,35 +3,61 @@ Marcin Art Service
 Fetches and manages artistic photos from Marcin Sajur's Unsplash account
 """
 
-import aiohttp
+import asyncio
+import httpx
+import math
 import random
 import logging
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 from datetime import datetime
 import os
-from .photo_tracker_service import get_unused_photos, mark_photo_used, get_photo_stats, reset_used_photos
+from config import settings
+from .http_client_service import http_clients
+from .rate_budget_service import RateBudgetExceeded
+from .premium_bot_accounts import get_premium_bot_by_source
+from .photo_tracker_service import is_photo_used, reserve_photo, reuse_least_recent, get_photo_stats
+from .shuffle_bag_service import shuffle_bags
+from .photo_catalog_service import photo_catalog
+from .photo_model import Photo
+from .single_flight import upstream_flight
+from .perceptual_hash_service import perceptual_hashes
 
 logger = logging.getLogger(__name__)
 class MarcinArtService:
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, source_username: str = "m_sajur"):
         self.unsplash_access_key = os.getenv('UNSPLASH_ACCESS_KEY')
         self.base_url = "https://api.unsplash.com"
-        self.marcin_username = "m_sajur"
-        self.session = None
+        # Unsplash account the photos come from (Marcin's unless another art bot is configured)
+        self.marcin_username = source_username
+        self._client = client
         
         if not self.unsplash_access_key:
             logger.warning("⚠️ UNSPLASH_ACCESS_KEY not found in environment variables")
     
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Injected client, or the app-wide pooled Unsplash client"""
+        return self._client or http_clients.get_unsplash_client()
+    
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession()
+        # Connections live in the shared pool, nothing to open per use
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.session:
-            await self.session.close()
+        pass
+    
+    async def get_marcin_photos(self, per_page: int = 30, page: int = 1, username: Optional[str] = None) -> Dict:
+        """Get photos from Marcin Sajur's Unsplash account (or another source account)"""
+        username = username or self.marcin_username
+        
+        # Identical concurrent page requests share one Unsplash call
+        return await upstream_flight.do(
+            ("users/photos", username, per_page, page),
+            lambda: self._fetch_photos_page(per_page, page, username)
+        )
     
-    async def get_marcin_photos(self, per_page: int = 30, page: int = 1) -> Dict:
-        """Get photos from Marcin Sajur's Unsplash account"""
+    async def _fetch_photos_page(self, per_page: int, page: int, username: str) -> Dict:
+        """Fetch one page of a source account's photos from Unsplash"""
         try:
             if not self.unsplash_access_key:
                 return {
@@ -40,7 +66,7 @@ class MarcinArtService:
                     "photos": []
                 }
             
-            url = f"{self.base_url}/users/{self.marcin_username}/photos"
+            url = f"{self.base_url}/users/{username}/photos"
             params = {
                 "per_page": min(per_page, 30),  # Max 30 per request
                 "page": page,
@@ -52,65 +78,38 @@ class MarcinArtService:
                 "Accept-Version": "v1"
             }
             
-            async with self.session.get(url, params=params, headers=headers) as response:
-                if response.status == 200:
-                    photos = await response.json()
-                    
-                    processed_photos = []
-                    for photo in photos:
-                        processed_photo = {
-                            "id": photo.get("id"),
-                            "description": photo.get("description") or photo.get("alt_description", ""),
-                            "urls": {
-                                "raw": photo["urls"]["raw"],
-                                "full": photo["urls"]["full"],
-                                "regular": photo["urls"]["regular"],
-                                "small": photo["urls"]["small"],
-                                "thumb": photo["urls"]["thumb"]
-                            },
-                            "width": photo.get("width"),
-                            "height": photo.get("height"),
-                            "color": photo.get("color"),
-                            "likes": photo.get("likes", 0),
-                            "created_at": photo.get("created_at"),
-                            "updated_at": photo.get("updated_at"),
-                            "download_url": photo["links"]["download"],
-                            "html_url": photo["links"]["html"],
-                            "photographer": {
-                                "name": photo["user"]["name"],
-                                "username": photo["user"]["username"],
-                                "profile_url": f"https://unsplash.com/@{photo['user']['username']}"
-                            },
-                            "tags": [tag["title"] for tag in photo.get("tags", [])[:5]],  # First 5 tags
-                            "exif": photo.get("exif", {}),
-                            "location": photo.get("location", {})
-                        }
-                        processed_photos.append(processed_photo)
-                    
-                    logger.info(f"✅ Fetched {len(processed_photos)} photos from @{self.marcin_username}")
-                    
-                    return {
-                        "success": True,
-                        "photos": processed_photos,
-                        "total_photos": len(processed_photos),
-                        "page": page,
-                        "per_page": per_page,
-                        "photographer": {
-                            "name": "Marcin Sajur",
-                            "username": self.marcin_username,
-                            "profile_url": f"https://unsplash.com/@{self.marcin_username}",
-                            "instagram": "https://instagram.com/frames_and_faces"
-                        }
-                    }
-                else:
-                    error_text = await response.text()
-                    logger.error(f"❌ Unsplash API error {response.status}: {error_text}")
-                    return {
-                        "success": False,
-                        "error": f"Unsplash API error: {response.status}",
-                        "photos": []
+            response = await self.client.get(url, params=params, headers=headers)
+            if response.status_code == 200:
+                photos = response.json()
+                
+                processed_photos = [Photo.from_unsplash(photo) for photo in photos]
+                
+                logger.info(f"✅ Fetched {len(processed_photos)} photos from @{username}")
+                
+                return {
+                    "success": True,
+                    "photos": processed_photos,
+                    "total_photos": len(processed_photos),
+                    "total_available": int(response.headers.get("X-Total", 0) or 0),
+                    "page": page,
+                    "per_page": per_page,
+                    "photographer": {
+                        "name": "Marcin Sajur",
+                        "username": self.marcin_username,
+                        "profile_url": f"https://unsplash.com/@{self.marcin_username}",
+                        "instagram": "https://instagram.com/frames_and_faces"
                     }
-                    
+                }
+            else:
+                logger.error(f"❌ Unsplash API error {response.status_code}: {response.text}")
+                return {
+                    "success": False,
+                    "error": f"Unsplash API error: {response.status_code}",
+                    "photos": []
+                }
+                
+        except RateBudgetExceeded:
+            raise
         except Exception as e:
             logger.error(f"❌ Error fetching Marcin's photos: {str(e)}")
             return {
@@ -119,17 +118,173 @@ class MarcinArtService:
                 "photos": []
             }
     
+    async def fetch_portfolio(self, username: Optional[str] = None, total_photos: Optional[int] = None) -> List[Photo]:
+        """Fetch a source account's whole portfolio from Unsplash, pages in parallel"""
+        username = username or self.marcin_username
+        per_page = 30
+        semaphore = asyncio.Semaphore(settings.PORTFOLIO_FETCH_CONCURRENCY)
+        
+        async def fetch_page(page: int) -> Dict:
+            async with semaphore:
+                return await self.get_marcin_photos(per_page=per_page, page=page, username=username)
+        
+        budget_errors: List[RateBudgetExceeded] = []
+        
+        async def fetch_pages(pages: List[int]) -> List[Dict]:
+            # A page the rate budget refuses shouldn't throw away the pages that did arrive
+            results = []
+            for result in await asyncio.gather(*(fetch_page(page) for page in pages), return_exceptions=True):
+                if isinstance(result, RateBudgetExceeded):
+                    budget_errors.append(result)
+                    result = {"success": False, "error": str(result), "photos": []}
+                elif isinstance(result, BaseException):
+                    raise result
+                results.append(result)
+            return results
+        
+        def page_count(total: int) -> int:
+            return max(1, min(math.ceil(total / per_page), settings.PORTFOLIO_MAX_PAGES))
+        
+        # Use the account's declared total, otherwise learn X-Total from page 1 first
+        if total_photos is None:
+            bot = get_premium_bot_by_source(username)
+            total_photos = bot.get("total_source_photos") if bot else None
+        
+        if total_photos:
+            pages = list(range(1, page_count(total_photos) + 1))
+            results = await fetch_pages(pages)
+        else:
+            results = [await fetch_page(1)]
+            pages = [1]
+        
+        # The declared total can be out of date, so trust X-Total when it says there is more
+        first_page = results[0]
+        if first_page["success"] and first_page.get("total_available"):
+            extra_pages = list(range(len(pages) + 1, page_count(first_page["total_available"]) + 1))
+            if extra_pages:
+                results.extend(await fetch_pages(extra_pages))
+        
+        # Merge in page order and drop photos that shifted between pages mid-fetch
+        all_photos = []
+        seen_ids = set()
+        for result in results:
+            if not result["success"]:
+                continue
+            for photo in result["photos"]:
+                if photo.id not in seen_ids:
+                    seen_ids.add(photo.id)
+                    all_photos.append(photo)
+        
+        if budget_errors:
+            if not all_photos:
+                raise budget_errors[0]
+            logger.warning(f"⚠️ Rate budget refused {len(budget_errors)} pages of @{username}, keeping the pages fetched")
+        
+        logger.info(f"📦 Fetched portfolio of @{username}: {len(all_photos)} photos from {len(results)} pages")
+        return all_photos
+    
+    async def iter_portfolio(self, username: Optional[str] = None, per_page: int = 30, prefetch_pages: Optional[int] = None) -> AsyncIterator[Photo]:
+        """Stream a source's whole portfolio, prefetching pages ahead of the consumer"""
+        username = username or self.marcin_username
+        # Unsplash caps pages at 30; a larger per_page would make page 1 look like the last one
+        per_page = min(per_page, 30)
+        end_of_portfolio = object()
+        
+        # Bounded: at most prefetch_pages pages wait here while the consumer is busy
+        pages: asyncio.Queue = asyncio.Queue(maxsize=prefetch_pages or settings.PORTFOLIO_PREFETCH_PAGES)
+        
+        async def produce():
+            try:
+                page = 1
+                while True:
+                    result = await self.get_marcin_photos(per_page=per_page, page=page, username=username)
+                    if not result["success"]:
+                        # Surfaced to the consumer rather than passing for the end of the portfolio
+                        raise RuntimeError(f"Stopped streaming @{username} at page {page}: {result['error']}")
+                    
+                    await pages.put(result["photos"])
+                    if len(result["photos"]) < per_page:
+                        break
+                    page += 1
+                    
+            except Exception as e:
+                # Budget refusals and failed pages are re-raised in the consumer
+                await pages.put(e)
+                return
+            
+            await pages.put(end_of_portfolio)
+        
+        producer = asyncio.create_task(produce())
+        previous_ids = set()
+        try:
+            while True:
+                item = await pages.get()
+                if item is end_of_portfolio:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                
+                # Photos can shift by a page boundary mid-stream; only the last page's ids are kept
+                page_ids = set()
+                for photo in item:
+                    page_ids.add(photo.id)
+                    if photo.id not in previous_ids:
+                        yield photo
+                previous_ids = page_ids
+        finally:
+            producer.cancel()
+            try:
+                await producer
+            except asyncio.CancelledError:
+                pass
+    
+    async def get_catalog_photos(self) -> List[Photo]:
+        """Get Marcin's photos from the local catalog, fetching only when it is empty"""
+        return await photo_catalog.ensure_photos(self.marcin_username, fetch_source_portfolio)
+    
+    async def get_catalog_page(self, per_page: int = 30, page: int = 1) -> Dict:
+        """Get a page of Marcin's photos from the local catalog"""
+        try:
+            all_photos = await self.get_catalog_photos()
+            
+            if not all_photos:
+                return {
+                    "success": False,
+                    "error": "No photos available from Marcin's collection",
+                    "photos": []
+                }
+            
+            start = (page - 1) * per_page
+            photos = all_photos[start:start + per_page]
+            
+            return {
+                "success": True,
+                "photos": photos,
+                "total_photos": len(photos),
+                "page": page,
+                "per_page": per_page,
+                "photographer": {
+                    "name": "Marcin Sajur",
+                    "username": self.marcin_username,
+                    "profile_url": f"https://unsplash.com/@{self.marcin_username}",
+                    "instagram": "https://instagram.com/frames_and_faces"
+                }
+            }
+            
+        except RateBudgetExceeded:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Error reading Marcin's catalog: {str(e)}")
+            return {
+                "success": False,
+                "error": str(e),
+                "photos": []
+            }
+    
     async def get_random_marcin_photo(self, bot_username: str = "marcin_frames_art") -> Dict:
         """Get a random unused photo from Marcin's collection"""
         try:
-            # Get multiple pages to have more variety
-            all_photos = []
-            for page in range(1, 4):  # Get first 3 pages (90 photos total)
-                result = await self.get_marcin_photos(per_page=30, page=page)
-                if result["success"] and result["photos"]:
-                    all_photos.extend(result["photos"])
-                else:
-                    break
+            all_photos = await self.get_catalog_photos()
             
             if not all_photos:
                 return {
@@ -138,34 +293,54 @@ class MarcinArtService:
                     "photo": None
                 }
             
-            # Filter out used photos
-            unused_photos = get_unused_photos(bot_username, all_photos)
+            def is_used(photo_id: str) -> bool:
+                return is_photo_used(bot_username, photo_id)
             
-            # If no unused photos, reset and use all photos again
-            if not unused_photos:
-                logger.info(f"🔄 All photos used for {bot_username}, resetting...")
-                reset_used_photos(bot_username)
-                unused_photos = all_photos
+            def is_fresh(photo: Photo) -> bool:
+                # Not used yet and not a near-duplicate of anything already posted
+                return not is_used(photo.id) and not perceptual_hashes.is_near_duplicate(bot_username, photo.id)
             
-            # Select random photo from unused ones
-            selected_photo = random.choice(unused_photos)
+            selected_photo = None
+            selection_method = "shuffle_bag"
             
-            # Mark as used
-            mark_photo_used(bot_username, selected_photo["id"])
+            # Draw from the bot's shuffle bag, reserving in shared storage;
+            # another worker may win the same photo, so draw again
+            while selected_photo is None:
+                photo = shuffle_bags.draw(bot_username, all_photos, is_fresh, is_used)
+                if photo is None:
+                    break
+                if await reserve_photo(bot_username, photo.id):
+                    selected_photo = photo
+            
+            # Once nothing fresh is left, reuse whatever was posted longest ago
+            if selected_photo is None:
+                logger.info(f"🔄 All photos used for {bot_username}, reusing the least recently used")
+                selected_photo = await reuse_least_recent(bot_username, all_photos)
+                selection_method = "least_recently_used"
+            
+            if selected_photo is None:
+                return {
+                    "success": False,
+                    "error": f"No photos left to post: all were used in the last {settings.PHOTO_REUSE_COOLDOWN_DAYS} days or look like ones already posted",
+                    "photo": None
+                }
             
             # Get usage stats
             stats = get_photo_stats(bot_username)
             
-            logger.info(f"🎲 Selected unused photo: {selected_photo['id']} (Used: {stats['used_count']}/{len(all_photos)})")
+            logger.info(f"🎲 Selected unused photo: {selected_photo.id} (Used: {stats['used_count']}/{len(all_photos)})")
             
             return {
                 "success": True,
                 "photo": selected_photo,
-                "selection_method": "random_unused",
+                "selection_method": selection_method,
+                "reserved": True,
                 "usage_stats": stats,
                 "total_available": len(all_photos)
             }
                 
+        except RateBudgetExceeded:
+            raise
         except Exception as e:
             logger.error(f"❌ Error getting random photo: {str(e)}")
             return {
@@ -177,13 +352,13 @@ class MarcinArtService:
     async def get_best_marcin_photos(self, count: int = 10) -> Dict:
         """Get the most popular photos from Marcin's collection"""
         try:
-            result = await self.get_marcin_photos(per_page=30, page=1)
+            all_photos = await self.get_catalog_photos()
             
-            if result["success"] and result["photos"]:
+            if all_photos:
                 # Sort by likes (popularity)
                 sorted_photos = sorted(
-                    result["photos"], 
-                    key=lambda x: x["likes"], 
+                    all_photos, 
+                    key=lambda x: x.likes, 
                     reverse=True
                 )
                 
@@ -205,6 +380,8 @@ class MarcinArtService:
                     "photos": []
                 }
                 
+        except RateBudgetExceeded:
+            raise
         except Exception as e:
             logger.error(f"❌ Error getting best photos: {str(e)}")
             return {
@@ -216,34 +393,19 @@ class MarcinArtService:
     async def get_marcin_photo_by_theme(self, theme: str = "portrait") -> Dict:
         """Get photos from Marcin's collection filtered by theme"""
         try:
-            result = await self.get_marcin_photos(per_page=30, page=1)
+            all_photos = await self.get_catalog_photos()
             
-            if result["success"] and result["photos"]:
-                # Filter by theme keywords
-                theme_keywords = {
-                    "portrait": ["portrait", "face", "person", "model", "fashion"],
-                    "artistic": ["art", "creative", "artistic", "conceptual", "abstract"],
-                    "dramatic": ["dramatic", "dark", "moody", "shadow", "contrast"],
-                    "fashion": ["fashion", "style", "clothing", "outfit", "editorial"]
-                }
-                
-                keywords = theme_keywords.get(theme.lower(), ["portrait"])
-                
-                # Filter photos by description and tags
-                filtered_photos = []
-                for photo in result["photos"]:
-                    description = (photo["description"] or "").lower()
-                    tags = [tag.lower() for tag in photo["tags"]]
-                    
-                    # Check if any keyword matches
-                    if any(keyword in description or keyword in " ".join(tags) for keyword in keywords):
-                        filtered_photos.append(photo)
+            if all_photos:
+                # Theme keywords resolve to photo ids through the catalog's inverted index
+                index = photo_catalog.get_index(self.marcin_username)
+                matching_ids = index.ids_for_theme(theme)
+                filtered_photos = [all_photos[index.positions[photo_id]] for photo_id in index.in_catalog_order(matching_ids)]
                 
                 # If no themed photos found, return random selection
                 if not filtered_photos:
                     filtered_photos = random.sample(
-                        result["photos"], 
-                        min(5, len(result["photos"]))
+                        all_photos, 
+                        min(5, len(all_photos))
                     )
                 
                 logger.info(f"🎨 Found {len(filtered_photos)} photos matching theme '{theme}'")
@@ -262,6 +424,8 @@ class MarcinArtService:
                     "photos": []
                 }
                 
+        except RateBudgetExceeded:
+            raise
         except Exception as e:
             logger.error(f"❌ Error getting themed photos: {str(e)}")
             return {
@@ -270,12 +434,11 @@ class MarcinArtService:
                 "photos": []
             }
     
-    def generate_artistic_caption(self, photo: Dict) -> str:
+    def generate_artistic_caption(self, photo: Photo) -> str:
         """Generate artistic caption for Marcin's photo"""
         try:
-            description = photo.get("description", "")
-            tags = photo.get("tags", [])
-            likes = photo.get("likes", 0)
+            description = photo.description
+            tags = photo.tags
             
             # Artistic caption templates
             templates = [
@@ -318,10 +481,21 @@ class MarcinArtService:
             return "Artistic vision through the lens of creativity. 🎨📸 #PortraitArt #CreativePhotography"
 
 # Standalone functions for easy import
+async def fetch_source_portfolio(username: str) -> List[Photo]:
+    """Fetch a source account's full portfolio from Unsplash"""
+    async with MarcinArtService() as service:
+        return await service.fetch_portfolio(username)
+
+async def iter_portfolio(username: str) -> AsyncIterator[Photo]:
+    """Stream a source account's portfolio photo by photo"""
+    async with MarcinArtService() as service:
+        async for photo in service.iter_portfolio(username):
+            yield photo
+
 async def get_marcin_photos(per_page: int = 30, page: int = 1):
     """Get photos from Marcin Sajur's account"""
     async with MarcinArtService() as service:
-        return await service.get_marcin_photos(per_page, page)
+        return await service.get_catalog_page(per_page, page)
 
 async def get_random_marcin_photo():
     """Get random photo from Marcin's collection"""
@@ -0,0 +1,298 @@
+"""
+Perceptual Hash Service
+Near-duplicate detection across image sources using dHash and a BK-tree
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from contextlib import closing
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from .image_pipeline_service import image_pipeline
+from .photo_catalog_service import photo_catalog
+from .photo_model import Photo
+from .tracker_storage import get_tracker_storage
+
+logger = logging.getLogger(__name__)
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+class BKTree:
+    """Metric tree over 64-bit hashes for Hamming-radius lookups"""
+
+    def __init__(self):
+        # Each node: [hash, key, {distance: child}]
+        self.root = None
+        self.size = 0
+
+    def add(self, value: int, key: str):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, key, {}]
+            return
+
+        node = self.root
+        while True:
+            distance = hamming_distance(value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, key, {}]
+                return
+            node = child
+
+    def search(self, value: int, radius: int) -> List[Tuple[str, int]]:
+        """All (key, distance) pairs within radius of value"""
+        if self.root is None:
+            return []
+
+        matches = []
+        stack = [self.root]
+        while stack:
+            node_value, node_key, children = stack.pop()
+            distance = hamming_distance(value, node_value)
+            if distance <= radius:
+                matches.append((node_key, distance))
+
+            # Triangle inequality: only children in [d - r, d + r] can match
+            for child_distance, child in children.items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return matches
+
+class PerceptualHashService:
+    """Stores catalog and posted-image hashes and rejects near-duplicates"""
+
+    def __init__(self):
+        self.db_file = photo_catalog.db_file
+        self.threshold = settings.PHASH_DUPLICATE_THRESHOLD
+
+        self.hashes: Dict[str, int] = {}       # photo_id -> dHash
+        self.posted: Dict[str, BKTree] = {}    # bot_username -> tree of posted hashes
+        # Posted here while a reload was reading the table, re-added once it's done
+        # (bot, None, None) records a reset
+        self.posted_during_reload: Optional[List[Tuple[str, Optional[str], Optional[int]]]] = None
+        self.posted_signature: Optional[Tuple[int, int]] = None
+        self.reloads = 0
+
+        self._ensure_db()
+        self._load_data()
+        # Another worker posting bumps the tracker version; pick up its hashes too
+        get_tracker_storage().add_listener(self._schedule_reload)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, timeout=10.0)
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _ensure_db(self):
+        """Ensure hash tables exist next to the catalog"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS photo_hashes (
+                    photo_id TEXT PRIMARY KEY,
+                    dhash INTEGER NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS posted_hashes (
+                    bot_username TEXT NOT NULL,
+                    photo_id TEXT NOT NULL,
+                    dhash INTEGER NOT NULL,
+                    posted_at REAL NOT NULL,
+                    PRIMARY KEY (bot_username, photo_id)
+                )
+            """)
+
+    def _load_data(self):
+        """Load stored hashes and rebuild the posted-image trees"""
+        try:
+            with closing(self._connect()) as conn:
+                for photo_id, dhash in conn.execute("SELECT photo_id, dhash FROM photo_hashes"):
+                    self.hashes[photo_id] = self._from_db(dhash)
+
+            self.posted = self._load_posted()
+        except Exception as e:
+            logger.error(f"❌ Error loading perceptual hashes: {str(e)}")
+
+    def _load_posted(self) -> Dict[str, BKTree]:
+        """Build every bot's posted-image tree from the table"""
+        posted: Dict[str, BKTree] = {}
+        with closing(self._connect()) as conn:
+            self.posted_signature = self._read_signature(conn)
+            for bot_username, photo_id, dhash in conn.execute(
+                "SELECT bot_username, photo_id, dhash FROM posted_hashes"
+            ):
+                posted.setdefault(bot_username, BKTree()).add(self._from_db(dhash), photo_id)
+        return posted
+
+    @staticmethod
+    def _read_signature(conn: sqlite3.Connection) -> Tuple[int, int]:
+        # Changes with every insert, replace (new rowid) or delete
+        return conn.execute("SELECT COUNT(*), COALESCE(MAX(rowid), 0) FROM posted_hashes").fetchone()
+
+    def _posted_signature(self) -> Tuple[int, int]:
+        with closing(self._connect()) as conn:
+            return self._read_signature(conn)
+
+    def _schedule_reload(self):
+        """Tracker storage listener: another worker wrote, so it may have posted too"""
+        try:
+            asyncio.get_running_loop().create_task(self.refresh_posted())
+        except RuntimeError:
+            pass  # No loop (scripts): nothing else is posting concurrently
+
+    async def refresh_posted(self):
+        """Reload the posted trees if the table changed (other workers post too)"""
+        if self.posted_during_reload is not None:
+            return  # Already reloading
+        try:
+            if await asyncio.to_thread(self._posted_signature) != self.posted_signature:
+                await self.reload_posted()
+        except Exception as e:
+            logger.error(f"❌ Error checking posted hashes: {str(e)}")
+
+    async def reload_posted(self):
+        """Rebuild the posted trees from the table, off the event loop"""
+        self.posted_during_reload = []
+        try:
+            posted = await asyncio.to_thread(self._load_posted)
+            # Replay what happened here while the table was being read
+            for bot_username, photo_id, dhash in self.posted_during_reload:
+                if photo_id is None:
+                    posted.pop(bot_username, None)
+                else:
+                    posted.setdefault(bot_username, BKTree()).add(dhash, photo_id)
+            self.posted = posted
+            self.reloads += 1
+        except Exception as e:
+            logger.error(f"❌ Error reloading posted hashes: {str(e)}")
+        finally:
+            self.posted_during_reload = None
+
+    # SQLite integers are signed 64-bit
+    @staticmethod
+    def _to_db(value: int) -> int:
+        return value - (1 << 64) if value >= (1 << 63) else value
+
+    @staticmethod
+    def _from_db(value: int) -> int:
+        return value + (1 << 64) if value < 0 else value
+
+    def _write_hashes(self, rows: List[Tuple[str, int]]):
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO photo_hashes (photo_id, dhash) VALUES (?, ?)",
+                [(photo_id, self._to_db(dhash)) for photo_id, dhash in rows]
+            )
+
+    def _write_posted(self, bot_username: str, photo_id: str, dhash: int):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO posted_hashes (bot_username, photo_id, dhash, posted_at) VALUES (?, ?, ?, ?)",
+                (bot_username, photo_id, self._to_db(dhash), time.time())
+            )
+
+    def _delete_posted(self, bot_username: str):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM posted_hashes WHERE bot_username = ?", (bot_username,))
+
+    async def _hash_photo(self, photo: Photo) -> Optional[int]:
+        """Download a photo's thumbnail and hash it in a worker process"""
+        try:
+            data = await image_pipeline.download(photo.url("thumb"))
+            return await image_pipeline.hash_image(data)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not hash photo {photo.id}: {str(e)}")
+            return None
+
+    async def ensure_hashes(self, source: str, photos: List[Photo]):
+        """Hash any photos (catalogued or from a search) that don't have a hash yet"""
+        missing = [photo for photo in photos if photo.id not in self.hashes]
+        if not settings.PHASH_ENABLED or not missing:
+            return
+
+        semaphore = asyncio.Semaphore(settings.PHASH_DOWNLOAD_CONCURRENCY)
+
+        async def hash_one(photo: Photo):
+            async with semaphore:
+                return photo.id, await self._hash_photo(photo)
+
+        results = await asyncio.gather(*(hash_one(photo) for photo in missing))
+        rows = [(photo_id, dhash) for photo_id, dhash in results if dhash is not None]
+
+        if rows:
+            await asyncio.to_thread(self._write_hashes, rows)
+            self.hashes.update(rows)
+
+        logger.info(f"🧬 Hashed {len(rows)}/{len(missing)} new photos for {source}")
+
+    def is_near_duplicate(self, bot_username: str, photo_id: str) -> bool:
+        """Check a photo against everything the bot has posted (other ids only)"""
+        dhash = self.hashes.get(photo_id)
+        tree = self.posted.get(bot_username)
+        if not settings.PHASH_ENABLED or dhash is None or tree is None:
+            return False
+
+        # Reposting the same id is the photo tracker's call, not ours
+        return any(key != photo_id for key, _ in tree.search(dhash, self.threshold))
+
+    def filter_near_duplicates(self, bot_username: str, photos: List[Photo]) -> List[Photo]:
+        """Drop photos that look like something the bot already posted"""
+        if not settings.PHASH_ENABLED or bot_username not in self.posted:
+            return photos
+
+        kept = [photo for photo in photos if not self.is_near_duplicate(bot_username, photo.id)]
+        if len(kept) < len(photos):
+            logger.info(f"🧬 {bot_username}: rejected {len(photos) - len(kept)} near-duplicate photos")
+        return kept
+
+    async def record_posted(self, bot_username: str, photo: Photo):
+        """Remember a posted photo's hash for future near-duplicate checks"""
+        if not settings.PHASH_ENABLED:
+            return
+
+        dhash = self.hashes.get(photo.id)
+        if dhash is None:
+            dhash = await self._hash_photo(photo)
+            if dhash is None:
+                return
+            self.hashes[photo.id] = dhash
+
+        self.posted.setdefault(bot_username, BKTree()).add(dhash, photo.id)
+        if self.posted_during_reload is not None:
+            self.posted_during_reload.append((bot_username, photo.id, dhash))
+        await asyncio.to_thread(self._write_posted, bot_username, photo.id, dhash)
+
+    async def reset_posted(self, bot_username: str):
+        """Forget a bot's posted hashes (when its photo history is reset)"""
+        self.posted.pop(bot_username, None)
+        if self.posted_during_reload is not None:
+            self.posted_during_reload.append((bot_username, None, None))
+        await asyncio.to_thread(self._delete_posted, bot_username)
+
+    def get_stats(self) -> Dict:
+        """Get hash index statistics"""
+        return {
+            "hashed_photos": len(self.hashes),
+            "threshold": self.threshold,
+            "posted": {bot_username: tree.size for bot_username, tree in self.posted.items()},
+            "reloads": self.reloads
+        }
+
+# Global instance
+perceptual_hashes = PerceptualHashService()
+
+async def _hash_catalog(username: str, photos: List[Photo]):
+    if settings.PHASH_ENABLED:
+        try:
+            await perceptual_hashes.ensure_hashes(f"@{username}", photos)
+        except Exception as e:
+            logger.error(f"❌ Error hashing catalog for @{username}: {str(e)}")
+
+# Keep hashes in step with the catalog
+photo_catalog.add_listener(_hash_catalog)
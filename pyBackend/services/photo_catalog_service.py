@@ -0,0 +1,311 @@
+"""
+Photo Catalog Service
+Persistent local catalog of source photographers' Unsplash portfolios
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from .rate_budget_service import unsplash_priority, PRIORITY_BACKGROUND
+from .photo_index import PhotoIndex
+from .photo_model import Photo
+from .single_flight import upstream_flight
+
+logger = logging.getLogger(__name__)
+
+PortfolioFetcher = Callable[[str], Awaitable[List[Photo]]]
+CatalogListener = Callable[[str, List[Photo]], Awaitable[None]]
+
+class PhotoCatalogService:
+    """SQLite-backed catalog so photo selection never waits on Unsplash"""
+
+    def __init__(self):
+        self.db_file = os.path.join(os.path.dirname(__file__), "..", "data", "photo_catalog.db")
+        self.ttl_seconds = settings.PHOTO_CATALOG_TTL_MINUTES * 60
+
+        # In-memory mirror of the catalog: {source_username: [photo, ...]}
+        self.photos: Dict[str, List[Photo]] = {}
+        self.refreshed_at: Dict[str, float] = {}
+        self.indexes: Dict[str, PhotoIndex] = {}
+
+        self.refresh_task = None
+        self._pending_refreshes: Dict[str, asyncio.Task] = {}
+        self.listeners: List[CatalogListener] = []
+        self._listener_tasks = set()
+
+        self._ensure_db()
+        self._load_data()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Every worker reads and writes this file (catalog and perceptual hashes)
+        conn = sqlite3.connect(self.db_file, timeout=10.0)
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def _ensure_db(self):
+        """Ensure data directory and catalog tables exist"""
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS photos (
+                    source_username TEXT NOT NULL,
+                    photo_id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (source_username, photo_id)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sources (
+                    source_username TEXT PRIMARY KEY,
+                    refreshed_at REAL NOT NULL,
+                    photo_count INTEGER NOT NULL
+                )
+            """)
+            # Which worker gets to fetch a stale source from Unsplash
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS refresh_claims (
+                    source_username TEXT PRIMARY KEY,
+                    claimed_until REAL NOT NULL
+                )
+            """)
+
+    def _load_data(self):
+        """Load every catalogued source into memory"""
+        try:
+            with closing(self._connect()) as conn:
+                for username, refreshed_at in conn.execute(
+                    "SELECT source_username, refreshed_at FROM sources"
+                ):
+                    self.refreshed_at[username] = refreshed_at
+
+                for username, data in conn.execute(
+                    "SELECT source_username, data FROM photos ORDER BY source_username, position"
+                ):
+                    self.photos.setdefault(username, []).append(Photo.from_dict(json.loads(data)))
+
+            for username, photos in self.photos.items():
+                self.indexes[username] = PhotoIndex(photos)
+                logger.info(f"📚 Loaded {len(photos)} catalogued photos for @{username}")
+        except Exception as e:
+            logger.error(f"❌ Error loading photo catalog: {str(e)}")
+            self.photos = {}
+            self.refreshed_at = {}
+            self.indexes = {}
+
+    def _write_photos(self, username: str, photos: List[Photo], refreshed_at: float):
+        """Replace a source's photos in a single transaction"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM photos WHERE source_username = ?", (username,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO photos (source_username, photo_id, position, data) VALUES (?, ?, ?, ?)",
+                [(username, photo.id, position, json.dumps(photo.to_dict())) for position, photo in enumerate(photos)]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO sources (source_username, refreshed_at, photo_count) VALUES (?, ?, ?)",
+                (username, refreshed_at, len(photos))
+            )
+
+    def _read_refreshed_at(self, username: str) -> Optional[float]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT refreshed_at FROM sources WHERE source_username = ?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def _read_source(self, username: str) -> Tuple[Optional[float], List[Photo]]:
+        """A source's stored photos and refresh time (as another worker may have written them)"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT refreshed_at FROM sources WHERE source_username = ?", (username,)).fetchone()
+            photos = [
+                Photo.from_dict(json.loads(data)) for data, in conn.execute(
+                    "SELECT data FROM photos WHERE source_username = ? ORDER BY position", (username,)
+                )
+            ]
+        return (row[0] if row else None), photos
+
+    def _claim_refresh(self, username: str) -> bool:
+        """Claim a source's refresh unless another worker's claim is still live"""
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            return conn.execute("""
+                INSERT INTO refresh_claims (source_username, claimed_until) VALUES (?, ?)
+                ON CONFLICT(source_username) DO UPDATE SET claimed_until = excluded.claimed_until
+                WHERE refresh_claims.claimed_until <= ?
+            """, (username, now + settings.PHOTO_CATALOG_REFRESH_CLAIM_SECONDS, now)).rowcount == 1
+
+    def get_photos(self, username: str) -> List[Photo]:
+        """Get catalogued photos for a source account"""
+        return self.photos.get(username, [])
+
+    def get_index(self, username: str) -> PhotoIndex:
+        """Get the keyword index for a source account"""
+        index = self.indexes.get(username)
+        if index is None:
+            index = self.indexes[username] = PhotoIndex(self.get_photos(username))
+        return index
+
+    def add_listener(self, listener: CatalogListener):
+        """Register a callback run in the background whenever a source's photos are (re)loaded"""
+        self.listeners.append(listener)
+
+    def _notify(self, username: str, photos: List[Photo]):
+        for listener in self.listeners:
+            task = asyncio.create_task(listener(username, photos))
+            self._listener_tasks.add(task)
+            task.add_done_callback(self._listener_tasks.discard)
+
+    def is_stale(self, username: str) -> bool:
+        """Check whether a source's catalog has outlived its TTL"""
+        refreshed_at = self.refreshed_at.get(username)
+        if refreshed_at is None:
+            return True
+        return time.time() - refreshed_at >= self.ttl_seconds
+
+    def seconds_until_stale(self, username: str) -> float:
+        """Seconds until a source needs refreshing (0 if already stale)"""
+        refreshed_at = self.refreshed_at.get(username)
+        if refreshed_at is None:
+            return 0
+        return max(0, refreshed_at + self.ttl_seconds - time.time())
+
+    async def refresh(self, username: str, fetcher: PortfolioFetcher) -> int:
+        """Fetch a source's portfolio from upstream and store it"""
+        # Concurrent refreshes of the same source share one portfolio fetch
+        return await upstream_flight.do(("catalog_refresh", username), lambda: self._refresh(username, fetcher))
+
+    async def _refresh(self, username: str, fetcher: PortfolioFetcher) -> int:
+        photos = await fetcher(username)
+
+        if not photos:
+            logger.warning(f"⚠️ Catalog refresh for @{username} returned no photos, keeping {len(self.get_photos(username))} cached")
+            return 0
+
+        refreshed_at = time.time()
+        await asyncio.to_thread(self._write_photos, username, photos, refreshed_at)
+        self._set_photos(username, photos, refreshed_at)
+
+        logger.info(f"📚 Catalog refreshed for @{username}: {len(photos)} photos")
+        return len(photos)
+
+    def _set_photos(self, username: str, photos: List[Photo], refreshed_at: float):
+        self.photos[username] = photos
+        self.indexes[username] = PhotoIndex(photos)
+        self.refreshed_at[username] = refreshed_at
+        self._notify(username, photos)
+
+    async def _reload_if_newer(self, username: str) -> bool:
+        """Pick up a refresh another worker stored since ours (True if there was one)"""
+        refreshed_at = await asyncio.to_thread(self._read_refreshed_at, username)
+        if refreshed_at is None or refreshed_at <= self.refreshed_at.get(username, 0):
+            return False
+
+        refreshed_at, photos = await asyncio.to_thread(self._read_source, username)
+        if not photos:
+            return False
+        self._set_photos(username, photos, refreshed_at)
+        logger.info(f"📚 Catalog reloaded for @{username}: {len(photos)} photos (refreshed by another worker)")
+        return True
+
+    def _schedule_refresh(self, username: str, fetcher: PortfolioFetcher):
+        """Refresh a stale source in the background, at most once at a time"""
+        pending = self._pending_refreshes.get(username)
+        if pending and not pending.done():
+            return
+
+        self._pending_refreshes[username] = asyncio.create_task(self._safe_refresh(username, fetcher))
+
+    async def _safe_refresh(self, username: str, fetcher: PortfolioFetcher):
+        try:
+            # Every worker watches the TTL, but only the one holding the claim fetches;
+            # the others load what it stored once it's done
+            if await self._reload_if_newer(username) and not self.is_stale(username):
+                return
+            if not await asyncio.to_thread(self._claim_refresh, username):
+                return
+
+            # Background refreshes only spend budget that posts and API calls don't need
+            with unsplash_priority(PRIORITY_BACKGROUND):
+                await self.refresh(username, fetcher)
+        except Exception as e:
+            logger.error(f"❌ Error refreshing catalog for @{username}: {str(e)}")
+
+    async def ensure_photos(self, username: str, fetcher: PortfolioFetcher) -> List[Photo]:
+        """Get a source's photos, only blocking on upstream when the catalog is empty"""
+        if not self.get_photos(username) and not await self._reload_if_newer(username):
+            await self.refresh(username, fetcher)
+        elif self.is_stale(username):
+            self._schedule_refresh(username, fetcher)
+
+        return self.get_photos(username)
+
+    async def start_background_refresh(self, usernames: List[str], fetcher: PortfolioFetcher):
+        """Start keeping the given sources fresh on the catalog TTL"""
+        if self.refresh_task and not self.refresh_task.done():
+            logger.warning("⚠️ Catalog refresher is already running")
+            return
+
+        # Sources loaded from disk won't be refreshed yet; let listeners see them now
+        for username in usernames:
+            if self.get_photos(username):
+                self._notify(username, self.get_photos(username))
+
+        self.refresh_task = asyncio.create_task(self._refresh_loop(usernames, fetcher))
+
+    async def stop_background_refresh(self):
+        """Stop the background refresher"""
+        if self.refresh_task:
+            self.refresh_task.cancel()
+            try:
+                await self.refresh_task
+            except asyncio.CancelledError:
+                pass
+            self.refresh_task = None
+
+    async def _refresh_loop(self, usernames: List[str], fetcher: PortfolioFetcher):
+        """Refresh each source whenever it goes stale"""
+        try:
+            while True:
+                for username in usernames:
+                    if self.is_stale(username):
+                        await self._safe_refresh(username, fetcher)
+
+                # Sleep until the next source expires (retry failed or claimed sources after a minute)
+                next_check = min(
+                    self.seconds_until_stale(username) or 60 for username in usernames
+                ) if usernames else self.ttl_seconds
+                await asyncio.sleep(next_check)
+
+        except asyncio.CancelledError:
+            logger.info("📋 Catalog refresh loop cancelled")
+            raise
+
+    def get_stats(self) -> Dict:
+        """Get catalog statistics"""
+        return {
+            username: {
+                "photos": len(photos),
+                "refreshed_at": self.refreshed_at.get(username),
+                "stale": self.is_stale(username)
+            }
+            for username, photos in self.photos.items()
+        }
+
+# Global instance
+photo_catalog = PhotoCatalogService()
+
+# Helper functions for easy import
+def get_catalog_photos(username: str) -> List[Photo]:
+    """Get catalogued photos for a source account"""
+    return photo_catalog.get_photos(username)
+
+def get_catalog_stats() -> Dict:
+    """Get catalog stats"""
+    return photo_catalog.get_stats()
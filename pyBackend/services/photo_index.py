@@ -0,0 +1,104 @@
+"""
+Photo Index
+Inverted keyword index over catalogued photos for theme and mood lookups
+"""
+
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+from .photo_model import Photo
+
+# Theme keywords used by theme-filtered selection
+THEME_KEYWORDS = {
+    "portrait": ["portrait", "face", "person", "model", "fashion"],
+    "artistic": ["art", "creative", "artistic", "conceptual", "abstract"],
+    "dramatic": ["dramatic", "dark", "moody", "shadow", "contrast"],
+    "fashion": ["fashion", "style", "clothing", "outfit", "editorial"]
+}
+
+# Mood keywords, checked in order (first match wins)
+MOOD_KEYWORDS = [
+    ("dramatic", ["dark", "shadow", "dramatic", "moody", "black"]),
+    ("sophisticated", ["fashion", "style", "elegant", "chic"]),
+    ("intimate", ["portrait", "face", "person", "model"]),
+    ("creative", ["art", "creative", "artistic", "abstract"])
+]
+DEFAULT_MOOD = "artistic"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: Optional[str]) -> Set[str]:
+    """Normalize free text into lowercase word tokens"""
+    return set(_TOKEN_RE.findall((text or "").lower()))
+
+def photo_tokens(photo: Photo) -> Set[str]:
+    """Tokens from a photo's description, alt description and tags"""
+    tokens = tokenize(photo.description)
+    tokens |= tokenize(photo.alt_description)
+    for tag in photo.tags:
+        tokens |= tokenize(tag)
+    return tokens
+
+class PhotoIndex:
+    """Token -> photo id postings, built once per catalog refresh"""
+
+    def __init__(self, photos: List[Photo]):
+        self.postings: Dict[str, Set[str]] = {}
+        self.positions: Dict[str, int] = {}
+        self._keyword_cache: Dict[str, FrozenSet[str]] = {}
+
+        for position, photo in enumerate(photos):
+            photo_id = photo.id
+            self.positions[photo_id] = position
+            for token in photo_tokens(photo):
+                self.postings.setdefault(token, set()).add(photo_id)
+
+        self.moods = self._build_moods()
+
+    def ids_for_keyword(self, keyword: str) -> FrozenSet[str]:
+        """Photo ids whose text contains the keyword (matches inside words too)"""
+        keyword = keyword.lower()
+        ids = self._keyword_cache.get(keyword)
+        if ids is None:
+            # Resolved against the vocabulary once, then served from the cache
+            matched = set()
+            for token, token_ids in self.postings.items():
+                if keyword in token:
+                    matched |= token_ids
+            ids = self._keyword_cache[keyword] = frozenset(matched)
+        return ids
+
+    def ids_for_any(self, keywords: Iterable[str]) -> Set[str]:
+        """Photo ids matching at least one keyword"""
+        ids = set()
+        for keyword in keywords:
+            ids |= self.ids_for_keyword(keyword)
+        return ids
+
+    def ids_for_theme(self, theme: str) -> Set[str]:
+        """Photo ids matching a theme's keywords"""
+        return self.ids_for_any(THEME_KEYWORDS.get(theme.lower(), ["portrait"]))
+
+    def in_catalog_order(self, ids: Iterable[str]) -> List[str]:
+        """Sort photo ids back into catalog (popularity) order"""
+        return sorted((i for i in ids if i in self.positions), key=self.positions.__getitem__)
+
+    def _build_moods(self) -> Dict[str, str]:
+        moods = {}
+        unassigned = set(self.positions)
+        for mood, keywords in MOOD_KEYWORDS:
+            matched = unassigned & self.ids_for_any(keywords)
+            for photo_id in matched:
+                moods[photo_id] = mood
+            unassigned -= matched
+        return moods
+
+    def mood_for(self, photo_id: str) -> Optional[str]:
+        """Precomputed mood for a catalogued photo (None if not indexed)"""
+        if photo_id not in self.positions:
+            return None
+        return self.moods.get(photo_id, DEFAULT_MOOD)
+
+def determine_mood(photo: Photo) -> str:
+    """Mood for a single photo that isn't in any catalog index"""
+    return PhotoIndex([photo]).mood_for(photo.id)
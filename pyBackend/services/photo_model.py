@@ -0,0 +1,145 @@
+"""
+Photo Model
+Compact, slotted record for Unsplash photos kept in catalogs and posts
+"""
+
+import sys
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+URL_SIZES = ("raw", "full", "regular", "small", "thumb")
+
+def _intern(value: Optional[str]) -> str:
+    return sys.intern(value or "")
+
+def _split_urls(urls: Dict) -> Tuple[str, Tuple[str, ...]]:
+    """Split image URLs into one shared (interned) origin and per-size tails"""
+    values = [urls.get(size) or "" for size in URL_SIZES]
+    origins = {f"{parts.scheme}://{parts.netloc}" for parts in map(urlsplit, values) if parts.netloc}
+
+    if len(origins) != 1:
+        return "", tuple(values)
+
+    origin = origins.pop()
+    return sys.intern(origin), tuple(value[len(origin):] for value in values)
+
+@dataclass(frozen=True, slots=True)
+class Photo:
+    """A photo with only the fields the bots use"""
+
+    id: str
+    description: str
+    alt_description: str
+    url_origin: str
+    url_tails: Tuple[str, ...]
+    width: int
+    height: int
+    color: str
+    likes: int
+    created_at: str
+    download_url: str
+    html_url: str
+    photographer_name: str
+    photographer_username: str
+    tags: Tuple[str, ...]
+    photographer_image: str = ""
+
+    @classmethod
+    def from_unsplash(cls, photo: Dict) -> "Photo":
+        """Build from a raw Unsplash API photo object"""
+        url_origin, url_tails = _split_urls(photo["urls"])
+        user = photo["user"]
+
+        return cls(
+            id=photo.get("id"),
+            description=photo.get("description") or photo.get("alt_description") or "",
+            alt_description=photo.get("alt_description") or "",
+            url_origin=url_origin,
+            url_tails=url_tails,
+            width=photo.get("width") or 0,
+            height=photo.get("height") or 0,
+            color=_intern(photo.get("color")),
+            likes=photo.get("likes", 0),
+            created_at=photo.get("created_at") or "",
+            download_url=photo["links"]["download"],
+            html_url=photo["links"]["html"],
+            photographer_name=_intern(user["name"]),
+            photographer_username=_intern(user["username"]),
+            tags=tuple(_intern(tag["title"]) for tag in photo.get("tags", [])[:5]),  # First 5 tags
+            photographer_image=(user.get("profile_image") or {}).get("medium", "")
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Photo":
+        """Build from the serialized shape produced by to_dict()"""
+        url_origin, url_tails = _split_urls(data["urls"])
+        photographer = data["photographer"]
+
+        return cls(
+            id=data["id"],
+            description=data.get("description") or "",
+            alt_description=data.get("alt_description") or "",
+            url_origin=url_origin,
+            url_tails=url_tails,
+            width=data.get("width") or 0,
+            height=data.get("height") or 0,
+            color=_intern(data.get("color")),
+            likes=data.get("likes", 0),
+            created_at=data.get("created_at") or "",
+            download_url=data.get("download_url") or "",
+            html_url=data.get("html_url") or "",
+            photographer_name=_intern(photographer["name"]),
+            photographer_username=_intern(photographer["username"]),
+            tags=tuple(_intern(tag) for tag in data.get("tags", [])),
+            photographer_image=photographer.get("profile_image", "")
+        )
+
+    def url(self, size: str = "regular") -> str:
+        """Image URL for one of the Unsplash sizes"""
+        return self.url_origin + self.url_tails[URL_SIZES.index(size)]
+
+    @property
+    def urls(self) -> Dict[str, str]:
+        return {size: self.url_origin + tail for size, tail in zip(URL_SIZES, self.url_tails)}
+
+    @property
+    def profile_url(self) -> str:
+        return f"https://unsplash.com/@{self.photographer_username}"
+
+    def to_dict(self) -> Dict:
+        """Serialize for API responses and catalog storage"""
+        photographer = {
+            "name": self.photographer_name,
+            "username": self.photographer_username,
+            "profile_url": self.profile_url
+        }
+        if self.photographer_image:
+            photographer["profile_image"] = self.photographer_image
+
+        return {
+            "id": self.id,
+            "description": self.description,
+            "alt_description": self.alt_description,
+            "urls": self.urls,
+            "width": self.width,
+            "height": self.height,
+            "color": self.color,
+            "likes": self.likes,
+            "created_at": self.created_at,
+            "download_url": self.download_url,
+            "html_url": self.html_url,
+            "photographer": photographer,
+            "tags": list(self.tags)
+        }
+
+    def to_post_photo_data(self) -> Dict:
+        """Serialize to the bot_metadata.photo_data shape the Node backend expects"""
+        return {
+            "id": self.id,
+            "description": self.description,
+            "photographer": self.photographer_name,
+            "likes": self.likes,
+            "tags": list(self.tags),
+            "unsplash_url": self.html_url
+        }
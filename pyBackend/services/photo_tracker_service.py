@@ -3,111 +3,184 @@ Photo Tracker Service
 Tracks used photos to prevent duplicates
 """
 
-import json
-import os
 import asyncio
-from datetime import datetime
-from typing import Dict, List, Set
+import heapq
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
 import logging
 
+from config import settings
+from .photo_model import Photo
+from .perceptual_hash_service import perceptual_hashes
+from .shuffle_bag_service import shuffle_bags
+from .tracker_storage import WriteBehindStorage, get_tracker_storage
+
 logger = logging.getLogger(__name__)
 
 class PhotoTrackerService:
     """Service to track used photos and prevent duplicates"""
     
-    def __init__(self):
-        self.data_file = os.path.join(os.path.dirname(__file__), "..", "data", "used_photos.json")
-        self.data = {}
-        self._ensure_data_file()
-        self._load_data()
+    def __init__(self, storage: Optional[WriteBehindStorage] = None):
+        self.storage = storage or get_tracker_storage()
+        
+        # bot_username -> {photo_id: used_at}, loaded from storage on first use
+        self.used: Dict[str, Dict[str, Optional[str]]] = {}
+        self.last_used: Dict[str, Optional[str]] = {}
+        # bot_username -> min-heap of (used_at, photo_id); stale entries are skipped lazily
+        self.lru: Dict[str, List[Tuple[str, str]]] = {}
+        # (bot_username, photo_id) -> used_at before a reuse, restored if the reuse is released
+        self.previous_use: Dict[Tuple[str, str], Optional[str]] = {}
+        self.cleaned_on: Optional[str] = None
+        self.storage.add_reloader(self.reload)
     
-    def _ensure_data_file(self):
-        """Ensure data directory and file exist"""
-        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+    def reload(self) -> Callable[[], None]:
+        """Re-read the cached bots' used photos (on the writer thread; another worker wrote to storage)"""
+        fresh = {bot_username: self.storage.load_used_photos(bot_username) for bot_username in list(self.used)}
         
-        if not os.path.exists(self.data_file):
-            default_data = {
-                "marcin_frames_art": {
-                    "used_photo_ids": [],
-                    "last_updated": None,
-                    "total_used": 0
-                }
-            }
-            with open(self.data_file, 'w') as f:
-                json.dump(default_data, f, indent=2)
+        def swap():
+            for bot_username, used in fresh.items():
+                self.used[bot_username] = used
+                self.last_used[bot_username] = max((used_at for used_at in used.values() if used_at), default=None)
+                self.lru.pop(bot_username, None)
+        return swap
     
-    def _load_data(self):
-        """Load data from JSON file"""
-        try:
-            with open(self.data_file, 'r') as f:
-                self.data = json.load(f)
-        except Exception as e:
-            logger.error(f"❌ Error loading photo tracker data: {str(e)}")
-            self.data = {}
-    
-    def _save_data(self):
-        """Save data to JSON file"""
-        try:
-            with open(self.data_file, 'w') as f:
-                json.dump(self.data, f, indent=2)
-        except Exception as e:
-            logger.error(f"❌ Error saving photo tracker data: {str(e)}")
+    def _used(self, bot_username: str) -> Dict[str, Optional[str]]:
+        """A bot's used photos, loading them from storage once"""
+        used = self.used.get(bot_username)
+        if used is None:
+            used = self.used[bot_username] = self.storage.load_used_photos(bot_username)
+            self.last_used[bot_username] = max((used_at for used_at in used.values() if used_at), default=None)
+        return used
+    
+    def _lru(self, bot_username: str) -> List[Tuple[str, str]]:
+        """A bot's least-recently-used heap, built once from its used photos"""
+        heap = self.lru.get(bot_username)
+        if heap is None:
+            heap = [(used_at or "", photo_id) for photo_id, used_at in self._used(bot_username).items()]
+            heapq.heapify(heap)
+            self.lru[bot_username] = heap
+        return heap
+    
+    def _set_used(self, bot_username: str, photo_id: str, used_at: Optional[str]):
+        self._used(bot_username)[photo_id] = used_at
+        if used_at and used_at > (self.last_used.get(bot_username) or ""):
+            self.last_used[bot_username] = used_at
+        if bot_username in self.lru:
+            heapq.heappush(self.lru[bot_username], (used_at or "", photo_id))
     
     def is_photo_used(self, bot_username: str, photo_id: str) -> bool:
         """Check if a photo has been used by a bot"""
-        if bot_username not in self.data:
-            self.data[bot_username] = {
-                "used_photo_ids": [],
-                "last_updated": None,
-                "total_used": 0
-            }
-        
-        return photo_id in self.data[bot_username]["used_photo_ids"]
+        return photo_id in self._used(bot_username)
     
-    def mark_photo_used(self, bot_username: str, photo_id: str):
-        """Mark a photo as used by a bot"""
-        if bot_username not in self.data:
-            self.data[bot_username] = {
-                "used_photo_ids": [],
-                "last_updated": None,
-                "total_used": 0
-            }
+    def mark_photo_used(self, bot_username: str, photo_id: str) -> bool:
+        """Mark a photo as used by a bot (False if it was already taken)"""
+        if self.is_photo_used(bot_username, photo_id):
+            return False
         
-        if photo_id not in self.data[bot_username]["used_photo_ids"]:
-            self.data[bot_username]["used_photo_ids"].append(photo_id)
-            self.data[bot_username]["total_used"] += 1
-            self.data[bot_username]["last_updated"] = datetime.now().isoformat()
-            self._save_data()
+        used_at = datetime.now().isoformat()
+        reserved = self.storage.reserve_photo(bot_username, photo_id, used_at)
+        self._set_used(bot_username, photo_id, used_at)
+        if reserved:
             logger.info(f"📝 Marked photo {photo_id} as used by {bot_username}")
+            self._maybe_cleanup()
+        return reserved
+    
+    async def reserve_photo(self, bot_username: str, photo_id: str) -> bool:
+        """Reserve a photo in shared storage (False if this or another worker already used it)"""
+        if self.is_photo_used(bot_username, photo_id):
+            return False
+        
+        used_at = datetime.now().isoformat()
+        reserved = await self.storage.reserve_photo_now(bot_username, photo_id, used_at)
+        self._set_used(bot_username, photo_id, used_at)
+        if reserved:
+            logger.info(f"📝 Reserved photo {photo_id} for {bot_username}")
+            self._maybe_cleanup()
+        return reserved
+    
+    async def reuse_least_recent(self, bot_username: str, available_photos: List[Photo]) -> Optional[Photo]:
+        """Re-reserve the least recently used available photo (once nothing unused is left)
+
+        Only photos last used before the reuse cooldown qualify, and not ones that
+        look like something else the bot posted; None if nothing qualifies.
+        """
+        available = {photo.id: photo for photo in available_photos}
+        used = self._used(bot_username)
+        heap = self._lru(bot_username)
+        cooldown_cutoff = (datetime.now() - timedelta(days=settings.PHOTO_REUSE_COOLDOWN_DAYS)).isoformat()
+        
+        # Photos missing from the current catalog (or near-duplicates) go back on the heap afterwards
+        set_aside = []
+        try:
+            while heap:
+                used_at, photo_id = heapq.heappop(heap)
+                
+                # Released, reused or reset since this entry was pushed
+                if photo_id not in used or (used[photo_id] or "") != used_at:
+                    continue
+                if used_at > cooldown_cutoff:
+                    # The heap is oldest first, so everything left is within the cooldown too
+                    set_aside.append((used_at, photo_id))
+                    logger.warning(f"⚠️ {bot_username}: every photo was used in the last {settings.PHOTO_REUSE_COOLDOWN_DAYS} days, nothing to reuse")
+                    return None
+                if photo_id not in available or perceptual_hashes.is_near_duplicate(bot_username, photo_id):
+                    set_aside.append((used_at, photo_id))
+                    continue
+                
+                now = datetime.now().isoformat()
+                if await self.storage.reuse_photo_now(bot_username, photo_id, used[photo_id], now):
+                    self.previous_use[(bot_username, photo_id)] = used[photo_id]
+                    self._set_used(bot_username, photo_id, now)
+                    logger.info(f"♻️ Reusing photo {photo_id} for {bot_username} (last used {used_at or 'unknown'})")
+                    return available[photo_id]
+                # Another worker reused it first; its new timestamp arrives with the next reload
+            return None
+        finally:
+            for entry in set_aside:
+                heapq.heappush(heap, entry)
+    
+    def release_photo(self, bot_username: str, photo_id: str):
+        """Release a photo that was reserved but never posted"""
+        used = self._used(bot_username)
+        if (bot_username, photo_id) in self.previous_use:
+            # A reused photo goes back to its previous timestamp instead of becoming unused
+            previous_used_at = self.previous_use.pop((bot_username, photo_id))
+            self.storage.reuse_photo(bot_username, photo_id, used.get(photo_id), previous_used_at)
+            self._set_used(bot_username, photo_id, previous_used_at)
+            logger.info(f"↩️ Released reused photo {photo_id} for {bot_username}")
+            return
+        
+        used.pop(photo_id, None)
+        shuffle_bags.put_back(bot_username, photo_id)
+        if self.storage.release_photo(bot_username, photo_id):
+            logger.info(f"↩️ Released photo {photo_id} for {bot_username}")
     
     def get_used_photos(self, bot_username: str) -> List[str]:
         """Get list of used photo IDs for a bot"""
-        if bot_username not in self.data:
-            return []
-        return self.data[bot_username]["used_photo_ids"].copy()
+        return list(self._used(bot_username))
     
-    def get_unused_photos(self, bot_username: str, available_photos: List[Dict]) -> List[Dict]:
+    def get_unused_photos(self, bot_username: str, available_photos: List[Photo]) -> List[Photo]:
         """Filter out used photos from available photos"""
-        used_ids = set(self.get_used_photos(bot_username))
-        unused_photos = [photo for photo in available_photos if photo["id"] not in used_ids]
+        used_ids = self._used(bot_username)
+        unused_photos = [photo for photo in available_photos if photo.id not in used_ids]
         
         logger.info(f"🔍 {bot_username}: {len(available_photos)} total, {len(used_ids)} used, {len(unused_photos)} unused")
         
         return unused_photos
     
     def reset_used_photos(self, bot_username: str):
-        """Reset used photos for a bot (when all photos are exhausted)"""
-        if bot_username in self.data:
-            old_count = len(self.data[bot_username]["used_photo_ids"])
-            self.data[bot_username]["used_photo_ids"] = []
-            self.data[bot_username]["total_used"] = 0
-            self.data[bot_username]["last_updated"] = datetime.now().isoformat()
-            self._save_data()
-            logger.info(f"🔄 Reset {old_count} used photos for {bot_username}")
+        """Reset used photos for a bot (manual history reset)"""
+        old_count = len(self._used(bot_username))
+        self.storage.reset_photos(bot_username)
+        self.used[bot_username] = {}
+        self.lru.pop(bot_username, None)
+        shuffle_bags.reset(bot_username)
+        logger.info(f"🔄 Reset {old_count} used photos for {bot_username}")
     
     def get_stats(self, bot_username: str) -> Dict:
         """Get usage statistics for a bot"""
-        if bot_username not in self.data:
+        used = self._used(bot_username)
+        if not used:
             return {
                 "total_used": 0,
                 "last_updated": None,
@@ -115,16 +188,27 @@ class PhotoTrackerService:
             }
         
         return {
-            "total_used": self.data[bot_username]["total_used"],
-            "last_updated": self.data[bot_username]["last_updated"],
-            "used_count": len(self.data[bot_username]["used_photo_ids"])
+            "total_used": len(used),
+            "last_updated": self.last_used.get(bot_username),
+            "used_count": len(used)
         }
     
-    def cleanup_old_data(self, days_old: int = 30):
-        """Clean up old tracking data (optional maintenance)"""
-        # This could be implemented to remove very old tracking data
-        # For now, we keep all data to ensure no duplicates
-        pass
+    def _maybe_cleanup(self):
+        """Forget old uses at most once a day, alongside the schedule history compaction"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        if self.cleaned_on != today:
+            self.cleaned_on = today
+            self.cleanup_old_data()
+    
+    def cleanup_old_data(self, days_old: Optional[int] = None):
+        """Forget uses older than the retention window (those photos count as unused again)"""
+        days_old = days_old or settings.PHOTO_HISTORY_RETENTION_DAYS
+        cutoff = (datetime.now() - timedelta(days=days_old)).isoformat()
+        
+        self.storage.delete_used_before(cutoff)
+        for used in self.used.values():
+            for photo_id in [photo_id for photo_id, used_at in used.items() if used_at and used_at < cutoff]:
+                del used[photo_id]
 
 # Global instance
 photo_tracker = PhotoTrackerService()
@@ -134,11 +218,19 @@ def is_photo_used(bot_username: str, photo_id: str) -> bool:
     """Check if photo is already used"""
     return photo_tracker.is_photo_used(bot_username, photo_id)
 
-def mark_photo_used(bot_username: str, photo_id: str):
+def mark_photo_used(bot_username: str, photo_id: str) -> bool:
     """Mark photo as used"""
-    photo_tracker.mark_photo_used(bot_username, photo_id)
+    return photo_tracker.mark_photo_used(bot_username, photo_id)
+
+async def reserve_photo(bot_username: str, photo_id: str) -> bool:
+    """Reserve photo across workers"""
+    return await photo_tracker.reserve_photo(bot_username, photo_id)
 
-def get_unused_photos(bot_username: str, available_photos: List[Dict]) -> List[Dict]:
+def release_photo(bot_username: str, photo_id: str):
+    """Release a reserved photo"""
+    photo_tracker.release_photo(bot_username, photo_id)
+
+def get_unused_photos(bot_username: str, available_photos: List[Photo]) -> List[Photo]:
     """Get only unused photos"""
     return photo_tracker.get_unused_photos(bot_username, available_photos)
 
@@ -146,6 +238,14 @@ def get_photo_stats(bot_username: str) -> Dict:
     """Get photo usage stats"""
     return photo_tracker.get_stats(bot_username)
 
+async def reuse_least_recent(bot_username: str, available_photos: List[Photo]) -> Optional[Photo]:
+    """Reuse the least recently used photo"""
+    return await photo_tracker.reuse_least_recent(bot_username, available_photos)
+
+def cleanup_old_photo_data():
+    """Forget photo uses past the retention window"""
+    photo_tracker.cleanup_old_data()
+
 def reset_used_photos(bot_username: str):
-    """Reset used photos when exhausted"""
+    """Reset used photos"""
     photo_tracker.reset_used_photos(bot_username)
@@ -0,0 +1,312 @@
+"""
+Post Outbox
+Post payloads are written to data/trackers.db under an idempotency key before
+they go to the Node backend, then delivered with retries until they land
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+from contextlib import closing
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from .tracker_storage import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_DELIVERED = "delivered"
+STATUS_DEAD = "dead"
+
+# A claimed row isn't offered to other workers for this long (well above the send timeout)
+CLAIM_SECONDS = 120
+CLAIM_BATCH = 10
+PURGE_INTERVAL_SECONDS = 3600
+
+# Sends a payload with its idempotency key; returns the HTTP status, or None when there was no response
+SendFunc = Callable[[Dict, str], Awaitable[Optional[int]]]
+
+# Row: (idempotency_key, bot_username, payload, attempts)
+Row = Tuple[str, str, str, int]
+
+def is_retryable(status_code: Optional[int]) -> bool:
+    """No response, 408, 429 and 5xx are worth retrying; other 4xx won't get better"""
+    return status_code is None or status_code in (408, 429) or status_code >= 500
+
+def backoff_delay(attempts: int) -> float:
+    """Exponential delay after a number of failed attempts, jittered so retries don't line up"""
+    ceiling = min(settings.POST_OUTBOX_MAX_DELAY_SECONDS,
+                  settings.POST_OUTBOX_BASE_DELAY_SECONDS * 2 ** (attempts - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+class PostOutbox:
+    """Durable queue of posts for the Node backend
+
+    A payload is stored before its first send, so a timeout, a 5xx or a
+    restart doesn't lose it. The key goes along as the Idempotency-Key header,
+    so a retry of a request that actually went through returns the existing
+    post instead of creating a second one. Rows are claimed with BEGIN
+    IMMEDIATE, so several workers can share the outbox.
+    """
+
+    def __init__(self, send: SendFunc, db_file: Optional[str] = None):
+        self.send = send
+        self.db_file = db_file or os.path.join(DATA_DIR, "trackers.db")
+        self.task: Optional[asyncio.Task] = None
+        self.purged_at = 0.0
+
+        self.delivered = 0
+        self.retried = 0
+        self.dead_lettered = 0
+
+        self._ensure_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Manual transactions: BEGIN IMMEDIATE takes the write lock before reading due rows
+        return sqlite3.connect(self.db_file, timeout=10.0, isolation_level=None)
+
+    def _ensure_db(self):
+        """Ensure the outbox table exists"""
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS post_outbox (
+                    idempotency_key TEXT PRIMARY KEY,
+                    bot_username TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_post_outbox_due ON post_outbox (status, next_attempt_at)")
+
+    def _insert(self, key: str, bot_username: str, payload: str) -> bool:
+        """Store a payload (False if the key already has a live one); a dead-lettered key starts over"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute("""
+                INSERT INTO post_outbox (idempotency_key, bot_username, payload, status, attempts, next_attempt_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, 0, ?, ?, ?)
+                ON CONFLICT(idempotency_key) DO UPDATE SET
+                    payload = excluded.payload, status = excluded.status, attempts = 0,
+                    next_attempt_at = excluded.next_attempt_at, last_error = NULL, updated_at = excluded.updated_at
+                WHERE post_outbox.status = ?
+            """, (key, bot_username, payload, STATUS_PENDING, now, now, now, STATUS_DEAD))
+            return cursor.rowcount > 0
+
+    def _claim(self, key: Optional[str] = None) -> List[Row]:
+        """Take due rows (or just one key) for sending, pushing their next attempt past the claim window"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if key:
+                    rows = conn.execute(
+                        "SELECT idempotency_key, bot_username, payload, attempts FROM post_outbox "
+                        "WHERE idempotency_key = ? AND status = ? AND next_attempt_at <= ?",
+                        (key, STATUS_PENDING, now)
+                    ).fetchall()
+                else:
+                    rows = conn.execute(
+                        "SELECT idempotency_key, bot_username, payload, attempts FROM post_outbox "
+                        "WHERE status = ? AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                        (STATUS_PENDING, now, CLAIM_BATCH)
+                    ).fetchall()
+                conn.executemany(
+                    "UPDATE post_outbox SET next_attempt_at = ? WHERE idempotency_key = ?",
+                    [(now + CLAIM_SECONDS, row[0]) for row in rows]
+                )
+                conn.execute("COMMIT")
+                return rows
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _finish(self, key: str, status: str, attempts: int, next_attempt_at: float, error: Optional[str]):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE post_outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? "
+                "WHERE idempotency_key = ?",
+                (status, attempts, next_attempt_at, error, time.time(), key)
+            )
+
+    def _status(self, key: str) -> Optional[str]:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT status FROM post_outbox WHERE idempotency_key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _purge(self):
+        """Drop delivered rows past the idempotency window"""
+        cutoff = time.time() - settings.POST_OUTBOX_KEEP_DAYS * 86400
+        with closing(self._connect()) as conn:
+            deleted = conn.execute(
+                "DELETE FROM post_outbox WHERE status = ? AND updated_at < ?", (STATUS_DELIVERED, cutoff)
+            ).rowcount
+        if deleted:
+            logger.info(f"🧹 Purged {deleted} delivered posts from the outbox")
+
+    async def _attempt(self, row: Row) -> str:
+        """Send one claimed row and record the outcome"""
+        key, bot_username, payload, attempts = row
+        attempts += 1
+        try:
+            status_code = await self.send(json.loads(payload), key)
+            error = f"HTTP {status_code}" if status_code is not None else "no response"
+        except Exception as e:
+            status_code, error = None, str(e)
+
+        if status_code is not None and 200 <= status_code < 300:
+            await asyncio.to_thread(self._finish, key, STATUS_DELIVERED, attempts, time.time(), None)
+            self.delivered += 1
+            return STATUS_DELIVERED
+
+        if not is_retryable(status_code) or attempts >= settings.POST_OUTBOX_MAX_ATTEMPTS:
+            await asyncio.to_thread(self._finish, key, STATUS_DEAD, attempts, time.time(), error)
+            self.dead_lettered += 1
+            logger.error(f"☠️ Dead-lettered post {key} for {bot_username} after {attempts} attempts: {error}")
+            return STATUS_DEAD
+
+        delay = backoff_delay(attempts)
+        await asyncio.to_thread(self._finish, key, STATUS_PENDING, attempts, time.time() + delay, error)
+        self.retried += 1
+        logger.warning(f"🔁 Post {key} for {bot_username} failed ({error}), "
+                       f"retry {attempts}/{settings.POST_OUTBOX_MAX_ATTEMPTS - 1} in {delay:.0f}s")
+        return STATUS_PENDING
+
+    def has_post(self, key: str) -> bool:
+        """Whether a post under this key is queued or delivered (dead letters don't count)"""
+        return self._status(key) in (STATUS_PENDING, STATUS_DELIVERED)
+
+    async def enqueue(self, key: str, bot_username: str, payload: Dict) -> bool:
+        """Store a post for delivery (False if the key already has one); from here on it will be sent"""
+        return await asyncio.to_thread(self._insert, key, bot_username, json.dumps(payload))
+
+    async def deliver_now(self, key: str) -> Optional[str]:
+        """Try a stored post once right away; returns its status"""
+        rows = await asyncio.to_thread(self._claim, key)
+        if not rows:
+            # The background worker got to it first
+            return await asyncio.to_thread(self._status, key)
+        return await self._attempt(rows[0])
+
+    async def submit(self, key: str, bot_username: str, payload: Dict) -> Optional[str]:
+        """Store a post and try it once right away; returns its status (None if the key was already queued)"""
+        if not await self.enqueue(key, bot_username, payload):
+            return None
+        return await self.deliver_now(key)
+
+    async def deliver_due(self) -> int:
+        """Send every row that's due; returns how many were attempted"""
+        attempted = 0
+        while True:
+            rows = await asyncio.to_thread(self._claim)
+            if not rows:
+                return attempted
+            await asyncio.gather(*(self._attempt(row) for row in rows))
+            attempted += len(rows)
+
+    async def _delivery_loop(self):
+        """Retry due posts (including ones left over from before a restart) every poll interval"""
+        try:
+            while True:
+                try:
+                    await self.deliver_due()
+                    if time.time() - self.purged_at >= PURGE_INTERVAL_SECONDS:
+                        self.purged_at = time.time()
+                        await asyncio.to_thread(self._purge)
+                except Exception as e:
+                    logger.error(f"❌ Outbox delivery error: {str(e)}")
+
+                await asyncio.sleep(settings.POST_OUTBOX_POLL_SECONDS)
+
+        except asyncio.CancelledError:
+            logger.info("📋 Outbox delivery cancelled")
+
+    async def start(self):
+        """Start the background delivery worker"""
+        if self.task is None:
+            self.task = asyncio.create_task(self._delivery_loop())
+
+    async def close(self):
+        """Stop the worker, then drain due posts for up to POST_OUTBOX_DRAIN_SECONDS"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+        try:
+            await asyncio.wait_for(self.deliver_due(), timeout=settings.POST_OUTBOX_DRAIN_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("⏰ Outbox drain timed out")
+        except Exception as e:
+            logger.error(f"❌ Error draining outbox: {str(e)}")
+
+        try:
+            pending = (await asyncio.to_thread(self.get_stats))["pending"]
+            if pending:
+                logger.info(f"📮 {pending} posts left in the outbox for the next start")
+        except Exception as e:
+            logger.error(f"❌ Error reading outbox: {str(e)}")
+
+    def requeue_dead_letters(self) -> int:
+        """Give every dead-lettered post a fresh set of attempts"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "UPDATE post_outbox SET status = ?, attempts = 0, next_attempt_at = ?, updated_at = ? WHERE status = ?",
+                (STATUS_PENDING, now, now, STATUS_DEAD)
+            ).rowcount
+
+    def get_dead_letters(self, limit: int = 20) -> List[Dict]:
+        """Most recent dead-lettered posts (without their payloads)"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT idempotency_key, bot_username, attempts, last_error, created_at, updated_at FROM post_outbox "
+                "WHERE status = ? ORDER BY updated_at DESC LIMIT ?",
+                (STATUS_DEAD, limit)
+            ).fetchall()
+        return [
+            {
+                "idempotency_key": key,
+                "bot_username": bot_username,
+                "attempts": attempts,
+                "last_error": error,
+                "created_at": created_at,
+                "dead_since": updated_at
+            }
+            for key, bot_username, attempts, error, created_at, updated_at in rows
+        ]
+
+    def get_stats(self) -> Dict:
+        """Get outbox statistics"""
+        with closing(self._connect()) as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM post_outbox GROUP BY status").fetchall())
+            oldest = conn.execute(
+                "SELECT MIN(created_at) FROM post_outbox WHERE status = ?", (STATUS_PENDING,)
+            ).fetchone()[0]
+
+        return {
+            "running": self.task is not None,
+            "pending": counts.get(STATUS_PENDING, 0),
+            "delivered": counts.get(STATUS_DELIVERED, 0),
+            "dead": counts.get(STATUS_DEAD, 0),
+            "oldest_pending_seconds": round(time.time() - oldest) if oldest else None,
+            "session": {
+                "delivered": self.delivered,
+                "retried": self.retried,
+                "dead_lettered": self.dead_lettered
+            }
+        }
@@ -0,0 +1,206 @@
+"""
+Post Pipeline
+Posts flow through explicit stages (select, enrich, caption, render, deliver)
+joined by bounded queues, each stage with its own worker count and timings
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("select", "enrich", "caption", "render", "deliver")
+
+class PostJob:
+    """One post moving through the pipeline; stages fill in its fields"""
+
+    def __init__(self, bot_username: str, method: str, scheduled: bool = False, **options: Any):
+        self.bot_username = bot_username
+        self.method = method  # Selection method / theme
+        self.scheduled = scheduled
+        self.options = options
+        self.slot = None
+
+        # Filled in by the stages
+        self.photo = None
+        self.reserved = False  # Whether this job holds the photo's reservation
+        self.mood: Optional[str] = None
+        self.caption: Optional[str] = None
+        self.image: Optional[Dict] = None
+        self.post_data: Optional[Dict] = None
+        self.delivery: Optional[str] = None  # Outbox status once the backend has it or it's queued
+        self.idempotency_key: Optional[str] = None
+        self.error: Optional[str] = None
+
+        self.next_stage = 0
+        self.stop_after = len(STAGES) - 1
+        self.timings: Dict[str, float] = {}
+        self.future: Optional[asyncio.Future] = None
+        self.task: Optional[asyncio.Task] = None  # The stage handler running for it
+        self.context: Optional[contextvars.Context] = None
+
+class StageStats:
+    __slots__ = ("runs", "failures", "total_seconds", "max_seconds", "busy")
+
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.busy = 0
+
+class PostPipeline:
+    """Runs PostJobs through the stages, each stage served by its own workers
+
+    A stage returns False (with job.error set) to stop a job, or raises. Jobs
+    can stop after a given stage and be resubmitted later to carry on from the
+    next one (pre-staging builds a post up to render and delivers it at the
+    slot). Stages run in the submitter's context, so context variables such as
+    the Unsplash request priority carry over into the workers.
+    """
+
+    def __init__(self, stages: List[Tuple[str, Callable[[PostJob], Awaitable[bool]]]],
+                 concurrency: Optional[Dict[str, int]] = None, queue_size: Optional[int] = None):
+        self.stages = stages
+        self.concurrency = concurrency or settings.POST_PIPELINE_CONCURRENCY
+        self.queue_size = queue_size or settings.POST_PIPELINE_QUEUE_SIZE
+
+        self.queues: List[asyncio.Queue] = []
+        self.tasks: List[asyncio.Task] = []
+        self.stats: Dict[str, StageStats] = {name: StageStats() for name, _ in stages}
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        """Start every stage's workers (done on first use)"""
+        if self.tasks:
+            return
+
+        self.queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        for index, (name, _) in enumerate(self.stages):
+            for _ in range(max(1, self.concurrency.get(name, 1))):
+                self.tasks.append(asyncio.create_task(self._stage_worker(index)))
+        logger.info(f"🏭 Post pipeline started: {', '.join(f'{name} x{self.concurrency.get(name, 1)}' for name, _ in self.stages)}")
+
+    async def close(self):
+        """Stop the workers; jobs still queued fail with CancelledError"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+        for queue in self.queues:
+            while not queue.empty():
+                job = queue.get_nowait()
+                if not job.future.done():
+                    job.future.cancel()
+        self.queues = []
+
+    def _stage_index(self, name: str) -> int:
+        return [stage_name for stage_name, _ in self.stages].index(name)
+
+    async def run(self, job: PostJob, until: Optional[str] = None) -> bool:
+        """Push a job through the pipeline (up to and including `until`); True if every stage passed"""
+        self.start()
+        job.stop_after = self._stage_index(until) if until else len(self.stages) - 1
+        if job.next_stage > job.stop_after:
+            return True
+
+        job.future = asyncio.get_running_loop().create_future()
+        job.context = contextvars.copy_context()
+        await self.queues[job.next_stage].put(job)
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            # Stop the stage it's in, so nothing carries on after the caller gave up
+            if job.task:
+                job.task.cancel()
+            raise
+
+    async def _stage_worker(self, index: int):
+        name, handler = self.stages[index]
+        stats = self.stats[name]
+        queue = self.queues[index]
+
+        while True:
+            job = await queue.get()
+            if job.future.done():
+                # The submitter gave up while the job was queued
+                queue.task_done()
+                continue
+
+            started = time.perf_counter()
+            stats.busy += 1
+            try:
+                job.task = asyncio.create_task(handler(job), context=job.context)
+                ok = await job.task
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                if asyncio.current_task().cancelling():
+                    raise
+                # Only the job was cancelled (by its submitter); the worker carries on
+                ok = False
+            except Exception as e:
+                ok = False
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                job.task = None
+                elapsed = time.perf_counter() - started
+                stats.busy -= 1
+                stats.runs += 1
+                stats.total_seconds += elapsed
+                stats.max_seconds = max(stats.max_seconds, elapsed)
+                job.timings[name] = round(elapsed, 3)
+                queue.task_done()
+
+            if not ok:
+                stats.failures += 1
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_result(False)
+                continue
+
+            job.next_stage = index + 1
+            if index >= job.stop_after:
+                self.completed += 1
+                # The submitter may have given up (cancelled) in the meantime
+                if not job.future.done():
+                    job.future.set_result(True)
+                continue
+
+            try:
+                # Bounded queues: a slow stage holds back the ones feeding it
+                await self.queues[index + 1].put(job)
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+
+    def get_stats(self) -> Dict:
+        """Get per-stage timing and queue statistics"""
+        stages = {}
+        for index, (name, _) in enumerate(self.stages):
+            stats = self.stats[name]
+            stages[name] = {
+                "workers": self.concurrency.get(name, 1),
+                "queued": self.queues[index].qsize() if self.queues else 0,
+                "busy": stats.busy,
+                "runs": stats.runs,
+                "failures": stats.failures,
+                "avg_ms": round(stats.total_seconds / stats.runs * 1000, 1) if stats.runs else None,
+                "max_ms": round(stats.max_seconds * 1000, 1)
+            }
+
+        return {
+            "running": bool(self.tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+            "stages": stages
+        }
@@ -0,0 +1,247 @@
+"""
+Posting Schedule
+Per-bot cron-style posting rules, compiled once into next-occurrence calculators
+"""
+
+import json
+import logging
+import os
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import pytz
+
+from .premium_bot_accounts import get_premium_bot_accounts
+
+logger = logging.getLogger(__name__)
+
+BOT_PROFILES_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "bot_profiles.json")
+DEFAULT_TIMEZONE = "Asia/Ho_Chi_Minh"
+# Used for bots that don't define their own rules
+DEFAULT_RULES = ("0 9,15,19 * * *",)
+
+# (low, high) for minute, hour, day of month, month, day of week (0 = Sunday)
+FIELD_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+# Furthest a rule like "0 9 29 2 *" can be from its next match
+MAX_SEARCH_DAYS = 366 * 8
+
+def _parse_field(expression: str, low: int, high: int) -> FrozenSet[int]:
+    """Values matched by one cron field ("*", "5", "1-5", "*/15", "9,15,19")"""
+    values = set()
+    for part in expression.split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            # "5/15" means every 15 from 5 on
+            end = high if step > 1 else start
+
+        if step < 1 or start < low or end > high or start > end:
+            raise ValueError(f"Invalid cron field '{expression}' (allowed {low}-{high})")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+class CronRule:
+    """One "minute hour day-of-month month day-of-week" rule"""
+
+    __slots__ = ("expression", "times", "days", "months", "weekdays", "any_day")
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron rule '{expression}' needs 5 fields")
+
+        minutes, hours, days, months, weekdays = (
+            _parse_field(field, low, high) for field, (low, high) in zip(fields, FIELD_RANGES)
+        )
+        self.expression = expression
+        # Minutes since midnight, sorted, so each day is a bisect away
+        self.times = tuple(sorted(hour * 60 + minute for hour in hours for minute in minutes))
+        self.days = days if fields[2] != "*" else None
+        self.months = months
+        # 7 is Sunday too
+        self.weekdays = frozenset(day % 7 for day in weekdays) if fields[4] != "*" else None
+        self.any_day = self.days is None and self.weekdays is None and len(months) == 12
+
+    def matches_day(self, day: date) -> bool:
+        if self.any_day:
+            return True
+        if day.month not in self.months:
+            return False
+
+        day_matches = self.days is None or day.day in self.days
+        weekday_matches = self.weekdays is None or (day.weekday() + 1) % 7 in self.weekdays
+        # Like cron: when both day fields are restricted, either one matching is enough
+        if self.days is not None and self.weekdays is not None:
+            return day_matches or weekday_matches
+        return day_matches and weekday_matches
+
+class PostingSchedule:
+    """A bot's rules in its own timezone"""
+
+    def __init__(self, rules: Tuple[str, ...], timezone: str = DEFAULT_TIMEZONE):
+        self.rules = tuple(CronRule(rule) for rule in rules)
+        self.timezone = pytz.timezone(timezone)
+        # Rules that fire every day collapse into one precomputed time list
+        self.daily_times = tuple(sorted({t for rule in self.rules if rule.any_day for t in rule.times}))
+        self.daily_only = all(rule.any_day for rule in self.rules)
+
+    @property
+    def expressions(self) -> List[str]:
+        return [rule.expression for rule in self.rules]
+
+    def times_on(self, day: date) -> Tuple[int, ...]:
+        """Posting minutes (since local midnight) on a day"""
+        if self.daily_only:
+            return self.daily_times
+        times = set(self.daily_times)
+        for rule in self.rules:
+            if not rule.any_day and rule.matches_day(day):
+                times.update(rule.times)
+        return tuple(sorted(times))
+
+    def _at(self, day: date, minutes: int) -> datetime:
+        naive = datetime.combine(day, datetime.min.time()) + timedelta(minutes=minutes)
+        # normalize() moves times that don't exist (DST gaps) to a real instant
+        return self.timezone.normalize(self.timezone.localize(naive))
+
+    def next_after(self, instant: datetime) -> Optional[datetime]:
+        """First posting slot strictly after an instant"""
+        local = instant.astimezone(self.timezone)
+        # An hour back: around DST changes a slot's wall time can be behind the instant's
+        # while the slot itself is still ahead (02:30 moved to 03:30, or a repeated 01:30)
+        minute = local.hour * 60 + local.minute - 60
+        for offset in range(MAX_SEARCH_DAYS):
+            day = local.date() + timedelta(days=offset)
+            times = self.times_on(day)
+            for index in range(bisect_left(times, minute) if offset == 0 else 0, len(times)):
+                slot = self._at(day, times[index])
+                if slot > instant:
+                    return slot
+        return None
+
+    def previous_before(self, instant: datetime) -> Optional[datetime]:
+        """Last posting slot at or before an instant"""
+        local = instant.astimezone(self.timezone)
+        minute = local.hour * 60 + local.minute
+        for offset in range(MAX_SEARCH_DAYS):
+            day = local.date() - timedelta(days=offset)
+            times = self.times_on(day)
+            for index in range((bisect_right(times, minute) if offset == 0 else len(times)) - 1, -1, -1):
+                slot = self._at(day, times[index])
+                if slot <= instant:
+                    return slot
+        return None
+
+    def closest(self, instant: datetime) -> Optional[datetime]:
+        """The slot nearest to an instant, before or after"""
+        candidates = [slot for slot in (self.previous_before(instant), self.next_after(instant)) if slot]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda slot: abs((slot - instant).total_seconds()))
+
+    def is_due(self, instant: datetime, window_minutes: int = 1) -> bool:
+        """Whether an instant is within window_minutes of a slot"""
+        slot = self.closest(instant)
+        return slot is not None and abs((slot - instant).total_seconds()) < (window_minutes + 1) * 60
+
+    def describe(self, day: Optional[date] = None) -> List[str]:
+        """Posting times on a day (default: today in the bot's timezone) as HH:MM"""
+        day = day or datetime.now(self.timezone).date()
+        return [f"{t // 60:02d}:{t % 60:02d}" for t in self.times_on(day)]
+
+@lru_cache(maxsize=None)
+def compile_schedule(rules: Tuple[str, ...], timezone: str = DEFAULT_TIMEZONE) -> PostingSchedule:
+    """Compiled schedule, shared by every bot with the same rules and timezone"""
+    return PostingSchedule(rules, timezone)
+
+def rules_from_config(posting_schedule: Dict) -> Tuple[str, ...]:
+    """Cron rules from a posting_schedule dict ("cron" rules, or "best_times" as HH:MM)"""
+    cron = posting_schedule.get("cron") or []
+    if isinstance(cron, str):
+        cron = [cron]
+
+    rules = list(cron)
+    for value in posting_schedule.get("best_times") or []:
+        hour, minute = value.split(":")
+        rules.append(f"{int(minute)} {int(hour)} * * *")
+    return tuple(rules)
+
+class PostingScheduleRegistry:
+    """Every bot's compiled schedule, loaded once from the bot configs"""
+
+    def __init__(self):
+        self.schedules: Optional[Dict[str, PostingSchedule]] = None
+        self.default = compile_schedule(DEFAULT_RULES)
+
+    def _add(self, schedules: Dict[str, PostingSchedule], username: str, posting_schedule: Dict):
+        rules = rules_from_config(posting_schedule)
+        if not rules:
+            return
+        try:
+            schedules[username] = compile_schedule(rules, posting_schedule.get("timezone", DEFAULT_TIMEZONE))
+        except Exception as e:
+            logger.error(f"❌ Invalid posting schedule for {username}: {str(e)}")
+
+    def load(self) -> Dict[str, PostingSchedule]:
+        """(Re)load schedules from premium accounts and active bot profiles"""
+        schedules = {}
+        for bot in get_premium_bot_accounts():
+            self._add(schedules, bot["username"], bot.get("posting_schedule", {}))
+
+        try:
+            if os.path.exists(BOT_PROFILES_FILE):
+                with open(BOT_PROFILES_FILE, "r", encoding="utf-8") as f:
+                    profiles = json.load(f)
+                for profile in profiles.values():
+                    if profile.get("is_active") and profile.get("username") not in schedules:
+                        self._add(schedules, profile["username"], profile.get("posting_schedule", {}))
+        except Exception as e:
+            logger.error(f"❌ Error loading bot profile schedules: {str(e)}")
+
+        self.schedules = schedules
+        logger.info(f"🗓️ Loaded posting schedules for {len(schedules)} bots")
+        return schedules
+
+    def all(self) -> Dict[str, PostingSchedule]:
+        if self.schedules is None:
+            self.load()
+        return self.schedules
+
+    def get(self, bot_username: str) -> PostingSchedule:
+        """A bot's schedule (the default one if it has none)"""
+        return self.all().get(bot_username, self.default)
+
+    def next_posting_times(self, after: Optional[datetime] = None) -> List[Tuple[datetime, str]]:
+        """(next slot, bot) for every scheduled bot, soonest first"""
+        after = after or datetime.now(pytz.utc)
+        upcoming = []
+        for bot_username, schedule in self.all().items():
+            slot = schedule.next_after(after)
+            if slot:
+                upcoming.append((slot, bot_username))
+        upcoming.sort()
+        return upcoming
+
+# Global instance
+posting_schedules = PostingScheduleRegistry()
+
+# Helper functions for easy import
+def get_posting_schedule(bot_username: str) -> PostingSchedule:
+    """Get a bot's compiled posting schedule"""
+    return posting_schedules.get(bot_username)
+
+def get_all_posting_schedules() -> Dict[str, PostingSchedule]:
+    """Get every configured bot's compiled posting schedule"""
+    return posting_schedules.all()
@@ -55,7 +55,9 @@ PREMIUM_BOT_ACCOUNTS = [
         ],
         "posting_schedule": {
             "frequency": "daily",
-            "best_times": ["09:00", "15:00", "19:00"],
+            # Cron rules (minute hour day month weekday) in the bot's own timezone
+            "cron": ["0 9,15,19 * * *"],
+            "timezone": "Asia/Ho_Chi_Minh",
             "content_mix": {
                 "portraits": 70,
                 "behind_scenes": 20,
@@ -77,6 +79,13 @@ def get_premium_bot_by_username(username: str) -> Dict:
             return bot
     return None
 
+def get_premium_bot_by_source(unsplash_source: str) -> Dict:
+    """Get premium bot that posts from a given Unsplash source account"""
+    for bot in PREMIUM_BOT_ACCOUNTS:
+        if bot.get("unsplash_source") == unsplash_source:
+            return bot
+    return None
+
 def get_premium_bot_by_type(bot_type: str) -> List[Dict]:
     """Get premium bots by type"""
     return [bot for bot in PREMIUM_BOT_ACCOUNTS if bot["botType"] == bot_type]
@@ -0,0 +1,144 @@
+"""
+Rate Budget Service
+Shared, quota-aware budget for Unsplash API requests
+"""
+
+import logging
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict
+
+import httpx
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Request priorities, highest first. Lower priorities must leave the
+# reserves of the higher ones untouched.
+PRIORITY_SCHEDULED = "scheduled"
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+
+_current_priority: ContextVar[str] = ContextVar("unsplash_priority", default=PRIORITY_INTERACTIVE)
+
+class RateBudgetExceeded(Exception):
+    """Raised instead of sending a request the budget cannot afford"""
+
+    def __init__(self, priority: str, retry_after: int):
+        self.priority = priority
+        self.retry_after = retry_after
+        super().__init__(f"Unsplash rate budget exhausted for {priority} requests, retry after {retry_after}s")
+
+@contextmanager
+def unsplash_priority(priority: str):
+    """Run Unsplash requests made inside the block at the given priority"""
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+def current_unsplash_priority() -> str:
+    """Priority Unsplash requests made here would run at"""
+    return _current_priority.get()
+
+class UnsplashRateBudget:
+    """Token bucket over the hourly Unsplash quota, synced from response headers"""
+
+    def __init__(self):
+        self.window_seconds = 3600
+        self.limit = settings.UNSPLASH_HOURLY_LIMIT
+        self.tokens = float(self.limit)
+        self.updated_at = time.monotonic()
+        self.in_flight = 0
+        self.last_request_at = 0.0
+        self.last_remaining = None
+        self.rejected = {PRIORITY_SCHEDULED: 0, PRIORITY_INTERACTIVE: 0, PRIORITY_BACKGROUND: 0}
+
+    def _floor(self, priority: str) -> int:
+        """Tokens a priority class must leave for the classes above it"""
+        if priority == PRIORITY_SCHEDULED:
+            return 0
+        if priority == PRIORITY_INTERACTIVE:
+            return settings.UNSPLASH_SCHEDULED_RESERVE
+        return settings.UNSPLASH_SCHEDULED_RESERVE + settings.UNSPLASH_INTERACTIVE_RESERVE
+
+    def _refill(self):
+        now = time.monotonic()
+        rate = self.limit / self.window_seconds
+        self.tokens = min(float(self.limit), self.tokens + (now - self.updated_at) * rate)
+        self.updated_at = now
+        
+        # Requests that died without a response never report back; nothing
+        # can still be in flight once the client timeout has long passed
+        if now - self.last_request_at > 120:
+            self.in_flight = 0
+
+    def acquire(self, priority: str = None):
+        """Take one token or fail fast with a retry-after"""
+        priority = priority or _current_priority.get()
+        self._refill()
+
+        floor = self._floor(priority)
+        if self.tokens - 1 < floor:
+            rate = self.limit / self.window_seconds
+            retry_after = max(1, math.ceil((floor + 1 - self.tokens) / rate))
+            self.rejected[priority] = self.rejected.get(priority, 0) + 1
+            logger.warning(f"🚦 Unsplash budget: rejecting {priority} request ({self.tokens:.1f} tokens left, retry in {retry_after}s)")
+            raise RateBudgetExceeded(priority, retry_after)
+
+        self.tokens -= 1
+        self.in_flight += 1
+        self.last_request_at = time.monotonic()
+
+    def update_from_headers(self, headers: httpx.Headers, status_code: int = 200):
+        """Sync the bucket with Unsplash's own view of the quota"""
+        self.in_flight = max(0, self.in_flight - 1)
+
+        limit = headers.get("X-Ratelimit-Limit")
+        remaining = headers.get("X-Ratelimit-Remaining")
+
+        if limit and limit.isdigit():
+            self.limit = int(limit)
+
+        if remaining and remaining.lstrip("-").isdigit():
+            self.last_remaining = int(remaining)
+            # Requests still in flight have already been charged locally
+            self.tokens = max(0.0, float(self.last_remaining - self.in_flight))
+            self.updated_at = time.monotonic()
+        elif status_code in (403, 429):
+            # Rate limited without headers: assume the window is spent
+            self.tokens = 0.0
+            self.updated_at = time.monotonic()
+
+    async def on_request(self, request: httpx.Request):
+        """httpx request hook: charge API calls against the budget"""
+        if request.url.host == "api.unsplash.com":
+            self.acquire()
+
+    async def on_response(self, response: httpx.Response):
+        """httpx response hook: read rate-limit headers from every API response"""
+        if response.request.url.host == "api.unsplash.com":
+            self.update_from_headers(response.headers, response.status_code)
+
+    def get_stats(self) -> Dict:
+        """Get budget statistics"""
+        self._refill()
+        return {
+            "limit": self.limit,
+            "tokens": round(self.tokens, 2),
+            "last_remaining": self.last_remaining,
+            "in_flight": self.in_flight,
+            "reserves": {
+                PRIORITY_SCHEDULED: 0,
+                PRIORITY_INTERACTIVE: self._floor(PRIORITY_INTERACTIVE),
+                PRIORITY_BACKGROUND: self._floor(PRIORITY_BACKGROUND)
+            },
+            "rejected": dict(self.rejected)
+        }
+
+# Global instance
+unsplash_budget = UnsplashRateBudget()
@@ -1,218 +1,244 @@
 """
 Schedule Tracker Service
 Persistent tracking để tránh spam posts khi restart server
-Sử dụng timezone Việt Nam và schedule cố định
+Lịch đăng riêng cho từng bot (cron + timezone, xem posting_schedule)
 """
 
-import json
-import os
-from datetime import datetime, time
-from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
 import logging
 import pytz
 
+from config import settings
+from .posting_schedule import PostingSchedule, get_posting_schedule
+from .tracker_storage import WriteBehindStorage, get_tracker_storage
+
 logger = logging.getLogger(__name__)
 
+def _slot_bit(time_slot: str) -> int:
+    """Bit for an "HH:MM" slot in a day's bitmap (one bit per minute of the day)"""
+    hour, minute = time_slot.split(':')
+    return 1 << (int(hour) * 60 + int(minute))
+
+def _slots_mask(time_slots: List[str]) -> int:
+    mask = 0
+    for time_slot in time_slots:
+        mask |= _slot_bit(time_slot)
+    return mask
+
 class ScheduleTrackerService:
     """Service để track schedule và tránh duplicate posts"""
     
-    def __init__(self):
-        self.data_file = os.path.join(os.path.dirname(__file__), "..", "data", "schedule_tracker.json")
+    def __init__(self, storage: Optional[WriteBehindStorage] = None):
         self.vietnam_tz = pytz.timezone('Asia/Ho_Chi_Minh')
         
-        # Fixed posting times (Vietnam timezone)
-        self.posting_times = [
-            time(9, 0),   # 9:00 AM
-            time(15, 0),  # 3:00 PM  
-            time(19, 0)   # 7:00 PM
-        ]
+        self.storage = storage or get_tracker_storage()
         
-        self.data = {}
-        self._ensure_data_file()
-        self._load_data()
+        # bot_username -> {date: slot bitmap}, for days in the recent window asked about
+        self.posted_slots: Dict[str, Dict[str, int]] = {}
+        # bot_username -> {"total_posts", "last_updated"}, kept current as slots are claimed
+        self.summaries: Dict[str, Optional[Dict]] = {}
+        self.compacted_on: Optional[str] = None
+        self.storage.add_reloader(self.reload)
     
-    def _ensure_data_file(self):
-        """Ensure data directory and file exist"""
-        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+    def reload(self) -> Callable[[], None]:
+        """Re-read the cached days and totals (on the writer thread; another worker wrote to storage)"""
+        slots = {
+            bot_username: {date: self.storage.load_posted_slots(bot_username, date) for date in list(bot_slots)}
+            for bot_username, bot_slots in list(self.posted_slots.items())
+        }
+        summaries = {bot_username: self.storage.get_schedule_summary(bot_username) for bot_username in list(self.summaries)}
         
-        if not os.path.exists(self.data_file):
-            default_data = {
-                "marcin_frames_art": {
-                    "last_post_dates": {},  # {"2025-10-06": ["09:00", "15:00"]}
-                    "total_posts": 0,
-                    "last_updated": None
-                }
-            }
-            with open(self.data_file, 'w') as f:
-                json.dump(default_data, f, indent=2)
-    
-    def _load_data(self):
-        """Load data from JSON file"""
-        try:
-            with open(self.data_file, 'r') as f:
-                self.data = json.load(f)
-        except Exception as e:
-            logger.error(f"❌ Error loading schedule tracker data: {str(e)}")
-            self.data = {}
-    
-    def _save_data(self):
-        """Save data to JSON file"""
-        try:
-            with open(self.data_file, 'w') as f:
-                json.dump(self.data, f, indent=2)
-        except Exception as e:
-            logger.error(f"❌ Error saving schedule tracker data: {str(e)}")
+        def swap():
+            for bot_username, days in slots.items():
+                bot_slots = self.posted_slots.setdefault(bot_username, {})
+                for date, time_slots in days.items():
+                    bot_slots[date] = _slots_mask(time_slots)
+            self.summaries.update(summaries)
+        return swap
+    
+    def _posted_mask(self, bot_username: str, date: str) -> int:
+        """Bitmap of the slots a bot posted on a date, loaded from storage once per day"""
+        bot_slots = self.posted_slots.setdefault(bot_username, {})
+        if date not in bot_slots:
+            # Keep the cache to the recent window
+            for old_date in sorted(bot_slots)[:-settings.SCHEDULE_HISTORY_RECENT_DAYS]:
+                del bot_slots[old_date]
+            bot_slots[date] = _slots_mask(self.storage.load_posted_slots(bot_username, date))
+        return bot_slots[date]
+    
+    def _is_posted(self, bot_username: str, date: str, time_slot: str) -> bool:
+        return bool(self._posted_mask(bot_username, date) & _slot_bit(time_slot))
+    
+    def _set_posted(self, bot_username: str, date: str, time_slot: str, posted: bool):
+        mask = self._posted_mask(bot_username, date)
+        bit = _slot_bit(time_slot)
+        self.posted_slots[bot_username][date] = mask | bit if posted else mask & ~bit
+    
+    def _summary(self, bot_username: str) -> Optional[Dict]:
+        """Post totals for a bot, loaded from storage once"""
+        if bot_username not in self.summaries:
+            self.summaries[bot_username] = self.storage.get_schedule_summary(bot_username)
+        return self.summaries[bot_username]
+    
+    def _schedule(self, bot_username: str) -> PostingSchedule:
+        return get_posting_schedule(bot_username)
     
     def get_vietnam_now(self) -> datetime:
         """Get current time in Vietnam timezone"""
         return datetime.now(self.vietnam_tz)
     
-    def get_today_string(self) -> str:
-        """Get today's date string in Vietnam timezone"""
-        return self.get_vietnam_now().strftime('%Y-%m-%d')
+    def get_bot_now(self, bot_username: str = "marcin_frames_art") -> datetime:
+        """Get current time in the bot's schedule timezone"""
+        return datetime.now(self._schedule(bot_username).timezone)
+    
+    def get_today_string(self, bot_username: str = "marcin_frames_art") -> str:
+        """Get today's date string in the bot's timezone"""
+        return self.get_bot_now(bot_username).strftime('%Y-%m-%d')
     
     def get_current_time_string(self) -> str:
         """Get current time string in HH:MM format"""
         return self.get_vietnam_now().strftime('%H:%M')
     
-    def is_posting_time(self) -> bool:
-        """Check if current time matches any posting schedule"""
-        current_time = self.get_vietnam_now().time()
-        
+    def is_posting_time(self, bot_username: str = "marcin_frames_art") -> bool:
+        """Check if current time matches the bot's posting schedule"""
         # Allow 1 minute window for each posting time
-        for posting_time in self.posting_times:
-            if (current_time.hour == posting_time.hour and 
-                abs(current_time.minute - posting_time.minute) <= 1):
-                return True
-        return False
+        return self._schedule(bot_username).is_due(self.get_bot_now(bot_username), window_minutes=1)
     
-    def get_next_posting_time(self) -> Optional[str]:
+    def get_next_posting_time(self, bot_username: str = "marcin_frames_art") -> Optional[str]:
         """Get next scheduled posting time"""
-        current_time = self.get_vietnam_now().time()
-        
-        for posting_time in self.posting_times:
-            if current_time < posting_time:
-                return posting_time.strftime('%H:%M')
+        now = self.get_bot_now(bot_username)
+        slot = self._schedule(bot_username).next_after(now)
+        if slot is None:
+            return None
         
-        # If past all today's times, return first time tomorrow
-        return self.posting_times[0].strftime('%H:%M') + " (tomorrow)"
+        days_ahead = (slot.date() - now.date()).days
+        if days_ahead == 0:
+            return slot.strftime('%H:%M')
+        if days_ahead == 1:
+            return slot.strftime('%H:%M') + " (tomorrow)"
+        return slot.strftime('%H:%M (%Y-%m-%d)')
+    
+    def get_next_posting_datetime(self, bot_username: str = "marcin_frames_art") -> Optional[datetime]:
+        """Get the next scheduled posting slot in the bot's timezone"""
+        return self._schedule(bot_username).next_after(self.get_bot_now(bot_username))
     
     def can_post_now(self, bot_username: str = "marcin_frames_art") -> bool:
         """Check if bot can post at current time"""
-        if not self.is_posting_time():
+        if not self.is_posting_time(bot_username):
             return False
         
-        today = self.get_today_string()
-        current_time = self.get_current_time_string()
-        
-        # Initialize bot data if not exists
-        if bot_username not in self.data:
-            self.data[bot_username] = {
-                "last_post_dates": {},
-                "total_posts": 0,
-                "last_updated": None
-            }
-        
-        # Check if already posted at this time today
-        if today in self.data[bot_username]["last_post_dates"]:
-            posted_times = self.data[bot_username]["last_post_dates"][today]
-            
-            # Check if current posting time slot is already used
-            for posting_time in self.posting_times:
-                time_str = posting_time.strftime('%H:%M')
-                if (abs(datetime.strptime(current_time, '%H:%M').time().hour - posting_time.hour) <= 0 and
-                    time_str in posted_times):
-                    return False
-        
-        return True
+        # Check if the current slot was already posted
+        return not self.is_slot_posted(bot_username, self._current_slot(bot_username))
+    
+    def _current_slot(self, bot_username: str) -> Optional[datetime]:
+        """The posting slot closest to now"""
+        return self._schedule(bot_username).closest(self.get_bot_now(bot_username))
+    
+    def is_slot_posted(self, bot_username: str, slot: datetime) -> bool:
+        """Whether a slot was already claimed (by any worker)"""
+        return self._is_posted(bot_username, slot.strftime('%Y-%m-%d'), slot.strftime('%H:%M'))
     
-    def mark_post_created(self, bot_username: str = "marcin_frames_art"):
-        """Mark that a post was created at current time"""
-        today = self.get_today_string()
-        current_time = self.get_current_time_string()
+    def _record_claim(self, bot_username: str, today: str, time_slot: str, posted_at: str, claimed: bool):
+        self._set_posted(bot_username, today, time_slot, True)
         
-        # Initialize bot data if not exists
-        if bot_username not in self.data:
-            self.data[bot_username] = {
-                "last_post_dates": {},
-                "total_posts": 0,
-                "last_updated": None
-            }
+        if claimed:
+            summary = self._summary(bot_username) or {"total_posts": 0, "last_updated": None}
+            self.summaries[bot_username] = {"total_posts": summary["total_posts"] + 1, "last_updated": posted_at}
+            logger.info(f"📝 Marked post created for {bot_username} at {time_slot} on {today}")
+            self._maybe_compact()
+    
+    def mark_post_created(self, bot_username: str = "marcin_frames_art") -> bool:
+        """Claim the posting slot closest to now (False if it was already claimed)"""
+        slot = self._current_slot(bot_username)
+        if slot is None:
+            return False
+        today, time_slot = slot.strftime('%Y-%m-%d'), slot.strftime('%H:%M')
         
-        # Initialize today's data if not exists
-        if today not in self.data[bot_username]["last_post_dates"]:
-            self.data[bot_username]["last_post_dates"][today] = []
+        # Claim the slot if not already there
+        if self._is_posted(bot_username, today, time_slot):
+            return False
         
-        # Find the closest posting time slot
-        current_datetime = datetime.strptime(current_time, '%H:%M').time()
-        closest_posting_time = min(
-            self.posting_times,
-            key=lambda t: abs((datetime.combine(datetime.today(), current_datetime) - 
-                             datetime.combine(datetime.today(), t)).total_seconds())
-        )
+        posted_at = self.get_vietnam_now().isoformat()
+        claimed = self.storage.claim_slot(bot_username, today, time_slot, posted_at)
+        self._record_claim(bot_username, today, time_slot, posted_at, claimed)
+        return claimed
+    
+    async def claim_post_slot(self, bot_username: str = "marcin_frames_art", slot: Optional[datetime] = None) -> Optional[str]:
+        """Claim a slot (default: the current one) in shared storage before posting (None if any worker has it)"""
+        slot = slot or self._current_slot(bot_username)
+        if slot is None:
+            return None
+        today, time_slot = slot.strftime('%Y-%m-%d'), slot.strftime('%H:%M')
         
-        time_slot = closest_posting_time.strftime('%H:%M')
+        if self._is_posted(bot_username, today, time_slot):
+            return None
         
-        # Add to posted times if not already there
-        if time_slot not in self.data[bot_username]["last_post_dates"][today]:
-            self.data[bot_username]["last_post_dates"][today].append(time_slot)
-            self.data[bot_username]["total_posts"] += 1
-            self.data[bot_username]["last_updated"] = self.get_vietnam_now().isoformat()
-            
-            self._save_data()
-            logger.info(f"📝 Marked post created for {bot_username} at {time_slot} on {today}")
+        posted_at = self.get_vietnam_now().isoformat()
+        claimed = await self.storage.claim_slot_now(bot_username, today, time_slot, posted_at)
+        self._record_claim(bot_username, today, time_slot, posted_at, claimed)
+        return time_slot if claimed else None
+    
+    def release_post_slot(self, bot_username: str, time_slot: str, date: Optional[str] = None):
+        """Give a claimed slot back when its post failed, so it can be retried"""
+        today = date or self.get_today_string(bot_username)
+        if self._is_posted(bot_username, today, time_slot):
+            self._set_posted(bot_username, today, time_slot, False)
+            self.storage.release_slot(bot_username, today, time_slot)
+            self.summaries.pop(bot_username, None)
+            logger.info(f"↩️ Released slot {time_slot} for {bot_username}")
     
     def get_today_posts_count(self, bot_username: str = "marcin_frames_art") -> int:
         """Get number of posts created today"""
-        today = self.get_today_string()
+        today = self.get_today_string(bot_username)
         
-        if (bot_username in self.data and 
-            today in self.data[bot_username]["last_post_dates"]):
-            return len(self.data[bot_username]["last_post_dates"][today])
-        
-        return 0
+        return self._posted_mask(bot_username, today).bit_count()
     
     def get_stats(self, bot_username: str = "marcin_frames_art") -> Dict:
         """Get scheduling statistics"""
-        if bot_username not in self.data:
-            return {
-                "total_posts": 0,
-                "today_posts": 0,
-                "last_updated": None,
-                "next_posting_time": self.get_next_posting_time(),
-                "can_post_now": False,
-                "posting_schedule": [t.strftime('%H:%M') for t in self.posting_times],
-                "vietnam_time": self.get_vietnam_now().strftime('%Y-%m-%d %H:%M:%S %Z')
-            }
-        
-        return {
-            "total_posts": self.data[bot_username]["total_posts"],
-            "today_posts": self.get_today_posts_count(bot_username),
-            "last_updated": self.data[bot_username]["last_updated"],
-            "next_posting_time": self.get_next_posting_time(),
-            "can_post_now": self.can_post_now(bot_username),
-            "posting_schedule": [t.strftime('%H:%M') for t in self.posting_times],
+        summary = self._summary(bot_username)
+        schedule = self._schedule(bot_username)
+        stats = {
+            "total_posts": 0,
+            "today_posts": 0,
+            "last_updated": None,
+            "next_posting_time": self.get_next_posting_time(bot_username),
+            "can_post_now": False,
+            "posting_schedule": schedule.describe(),
+            "cron": schedule.expressions,
+            "timezone": schedule.timezone.zone,
             "vietnam_time": self.get_vietnam_now().strftime('%Y-%m-%d %H:%M:%S %Z')
         }
-    
-    def cleanup_old_data(self, days_to_keep: int = 7):
-        """Clean up old scheduling data (keep last 7 days)"""
-        cutoff_date = (self.get_vietnam_now() - 
-                      datetime.timedelta(days=days_to_keep)).strftime('%Y-%m-%d')
         
-        for bot_username in self.data:
-            if "last_post_dates" in self.data[bot_username]:
-                dates_to_remove = [
-                    date for date in self.data[bot_username]["last_post_dates"]
-                    if date < cutoff_date
-                ]
-                
-                for date in dates_to_remove:
-                    del self.data[bot_username]["last_post_dates"][date]
+        if summary is not None:
+            stats.update({
+                "total_posts": summary["total_posts"],
+                "today_posts": self.get_today_posts_count(bot_username),
+                "last_updated": summary["last_updated"],
+                "can_post_now": self.can_post_now(bot_username)
+            })
+        
+        return stats
+    
+    def _maybe_compact(self):
+        """Compact history at most once a day, so storage stays bounded without a cron job"""
+        today = self.get_vietnam_now().strftime('%Y-%m-%d')
+        if self.compacted_on != today:
+            self.compacted_on = today
+            self.cleanup_old_data()
+    
+    def cleanup_old_data(self, days_to_keep: Optional[int] = None):
+        """Roll old per-slot history into daily counts, and old daily counts into monthly ones"""
+        today = self.get_vietnam_now()
+        recent_days = days_to_keep or settings.SCHEDULE_HISTORY_RECENT_DAYS
+        recent_before = (today - timedelta(days=recent_days)).strftime('%Y-%m-%d')
+        daily_before = (today - timedelta(days=max(settings.SCHEDULE_HISTORY_DAILY_DAYS, recent_days))).strftime('%Y-%m-%d')
         
-        if dates_to_remove:
-            self._save_data()
-            logger.info(f"🧹 Cleaned up {len(dates_to_remove)} old schedule entries")
+        self.storage.compact_schedule_history(recent_before, daily_before)
+        for bot_slots in self.posted_slots.values():
+            for old_date in [date for date in bot_slots if date < recent_before]:
+                del bot_slots[old_date]
+        logger.info(f"🧹 Compacting schedule history (slots before {recent_before}, daily counts before {daily_before})")
 
 # Global instance
 schedule_tracker = ScheduleTrackerService()
@@ -222,17 +248,33 @@ def can_post_now(bot_username: str = "marcin_frames_art") -> bool:
     """Check if bot can post now"""
     return schedule_tracker.can_post_now(bot_username)
 
-def mark_post_created(bot_username: str = "marcin_frames_art"):
+def mark_post_created(bot_username: str = "marcin_frames_art") -> bool:
     """Mark post as created"""
-    schedule_tracker.mark_post_created(bot_username)
+    return schedule_tracker.mark_post_created(bot_username)
+
+async def claim_post_slot(bot_username: str = "marcin_frames_art", slot: Optional[datetime] = None) -> Optional[str]:
+    """Claim a posting slot across workers"""
+    return await schedule_tracker.claim_post_slot(bot_username, slot)
+
+def is_slot_posted(bot_username: str, slot: datetime) -> bool:
+    """Check whether a slot was already posted"""
+    return schedule_tracker.is_slot_posted(bot_username, slot)
+
+def release_post_slot(bot_username: str, time_slot: str, date: Optional[str] = None):
+    """Release a claimed slot"""
+    schedule_tracker.release_post_slot(bot_username, time_slot, date)
 
 def get_schedule_stats(bot_username: str = "marcin_frames_art") -> Dict:
     """Get schedule stats"""
     return schedule_tracker.get_stats(bot_username)
 
-def is_posting_time() -> bool:
+def get_next_posting_datetime(bot_username: str = "marcin_frames_art") -> Optional[datetime]:
+    """Get next posting slot datetime"""
+    return schedule_tracker.get_next_posting_datetime(bot_username)
+
+def is_posting_time(bot_username: str = "marcin_frames_art") -> bool:
     """Check if current time is posting time"""
-    return schedule_tracker.is_posting_time()
+    return schedule_tracker.is_posting_time(bot_username)
 
 def get_vietnam_time() -> datetime:
     """Get current Vietnam time"""
@@ -0,0 +1,313 @@
+"""
+Scheduler Engine
+One timer over a heap of every bot's next fire time, with a bounded worker pool
+running the posts that come due
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import pytz
+
+from config import settings
+from .posting_schedule import PostingSchedule
+
+logger = logging.getLogger(__name__)
+
+# Wall-clock vs monotonic drift (seconds) treated as a clock jump
+CLOCK_JUMP_SECONDS = 60
+
+# Heap entry phases: build the post ahead of the slot, then send it.
+# Replays post a slot that was missed while the process was down or asleep.
+PHASE_STAGE = "stage"
+PHASE_POST = "post"
+PHASE_REPLAY = "replay"
+
+# How long an entry waits when its bot is still busy with another one
+BUSY_RETRY_SECONDS = 5
+
+def spread_offset(username: str) -> float:
+    """Stable per-bot delay after each slot, so bots sharing a slot don't fire together"""
+    return (zlib.crc32(username.encode("utf-8")) % 1000) / 1000 * settings.BOT_SCHEDULE_SPREAD_SECONDS
+
+# Heap entry: (fire timestamp, tie-breaker, generation, username, phase, slot)
+Entry = Tuple[float, int, int, str, str, datetime]
+
+class SchedulerEngine:
+    """Fires stage/post handlers for many bots from a single sleeping task"""
+
+    def __init__(self, post_handler: Callable[[str, datetime], Awaitable],
+                 stage_handler: Optional[Callable[[str, datetime], Awaitable]] = None,
+                 is_posted: Optional[Callable[[str, datetime], bool]] = None,
+                 workers: Optional[int] = None):
+        self.post_handler = post_handler
+        self.stage_handler = stage_handler
+        # Without it there's no catch-up: missed slots are simply skipped
+        self.is_posted = is_posted
+        self.worker_count = workers or settings.BOT_MAX_CONCURRENT_POSTS
+
+        self.schedules: Dict[str, PostingSchedule] = {}
+        self.heap: List[Entry] = []
+        # Bumped on every rebuild; entries from older generations are skipped when popped
+        self.generation = 0
+        # username -> phase of the entry being run for it
+        self.in_flight: Dict[str, str] = {}
+        self._counter = itertools.count()
+
+        self.queue: Optional[asyncio.Queue] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._rebuild = False
+        self.tasks: List[asyncio.Task] = []
+
+        self.dispatched = 0
+        self.failures = 0
+        self.replayed = 0
+        self.replays_skipped = 0
+
+    def set_schedules(self, schedules: Dict[str, PostingSchedule]):
+        """Replace the bots being scheduled (takes effect at once if running)"""
+        self.schedules = dict(schedules)
+        self.reschedule()
+
+    def reschedule(self):
+        """Recompute every bot's next fire time (schedule change or clock jump)"""
+        self._rebuild = True
+        if self._wake:
+            self._wake.set()
+
+    def _push(self, username: str, phase: str, slot: datetime, fire_at: float):
+        entry = (fire_at, next(self._counter), self.generation, username, phase, slot)
+        heapq.heappush(self.heap, entry)
+        # Only a new earliest entry changes how long the dispatcher should sleep
+        if self._wake and self.heap[0] is entry:
+            self._wake.set()
+
+    def _push_next(self, username: str, after: Optional[datetime] = None):
+        """Queue a bot's next slot (staging first when there's a stage handler)"""
+        schedule = self.schedules.get(username)
+        if schedule is None:
+            return
+
+        now = datetime.now(pytz.utc)
+        slot = schedule.next_after(max(after, now) if after else now)
+        if slot is None:
+            return
+
+        if self.stage_handler:
+            stage_at = slot - timedelta(minutes=settings.BOT_PRESTAGE_LEAD_MINUTES)
+            self._push(username, PHASE_STAGE, slot, stage_at.timestamp())
+        else:
+            self._push(username, PHASE_POST, slot, self._fire_time(username, slot))
+
+    def _fire_time(self, username: str, slot: datetime) -> float:
+        jitter = spread_offset(username) + random.uniform(0, settings.BOT_SCHEDULE_JITTER_SECONDS)
+        return slot.timestamp() + jitter
+
+    def _rebuild_heap(self):
+        """Fresh entries for every idle bot; busy bots queue their own next entry when done"""
+        # Posts already staged for their slot keep their fire time
+        staged = [entry for entry in self.heap if entry[4] == PHASE_POST and entry[2] == self.generation]
+
+        self._rebuild = False
+        self.generation += 1
+        self.heap = []
+        # A replay in progress doesn't queue the bot's next slot when it's done, so it isn't busy here
+        busy = {username for username, phase in self.in_flight.items() if phase != PHASE_REPLAY}
+        for fire_at, _, _, username, phase, slot in staged:
+            if username in self.schedules:
+                self._push(username, phase, slot, fire_at)
+                busy.add(username)
+
+        for username in self.schedules:
+            if username not in busy:
+                self._push_next(username)
+
+        self._schedule_catch_up(busy | set(self.in_flight))
+
+        self._wake.clear()
+        logger.info(f"⏰ Scheduled {len(self.schedules)} bots ({len(self.in_flight)} busy)")
+
+    def _find_missed(self, skip: set) -> List[Tuple[datetime, str]]:
+        """(slot, bot) for slots inside the grace period that nobody posted, newest first"""
+        now = datetime.now(pytz.utc)
+        since = now - timedelta(minutes=settings.BOT_CATCHUP_GRACE_MINUTES)
+
+        missed = []
+        for username, schedule in self.schedules.items():
+            if username in skip:
+                continue
+            slot = schedule.next_after(since)
+            while slot is not None and slot <= now:
+                if not self.is_posted(username, slot):
+                    missed.append((slot, username))
+                slot = schedule.next_after(slot)
+
+        missed.sort(reverse=True)
+        return missed
+
+    def _schedule_catch_up(self, skip: set):
+        """Queue replays of missed slots, spaced out and capped so an outage doesn't burst"""
+        if self.is_posted is None or settings.BOT_CATCHUP_GRACE_MINUTES <= 0:
+            return
+
+        missed = self._find_missed(skip)
+        if not missed:
+            return
+
+        # Most recent slots win when there are more than the burst allows
+        replays = sorted(missed[:settings.BOT_CATCHUP_MAX_REPLAYS])
+        skipped = len(missed) - len(replays)
+        self.replays_skipped += skipped
+
+        now = time.time()
+        for index, (slot, username) in enumerate(replays):
+            self._push(username, PHASE_REPLAY, slot, now + index * settings.BOT_CATCHUP_SPACING_SECONDS)
+
+        logger.info(f"⏪ Replaying {len(replays)} missed slots{f', skipping {skipped} older ones' if skipped else ''}")
+
+    async def start(self):
+        """Start the dispatcher and worker pool"""
+        if self.tasks:
+            return
+
+        self.queue = asyncio.Queue()
+        self._wake = asyncio.Event()
+        self._rebuild = True
+        self.tasks = [asyncio.create_task(self._dispatch_loop())]
+        self.tasks += [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        logger.info(f"🚀 Scheduler engine started for {len(self.schedules)} bots with {self.worker_count} workers")
+
+    async def stop(self):
+        """Cancel the dispatcher and workers (posts in progress are cancelled)"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.in_flight.clear()
+        self.heap = []
+
+    async def _sleep_until(self, fire_at: float) -> bool:
+        """Sleep until a wall-clock timestamp; False if woken early to look at the heap again"""
+        while True:
+            remaining = fire_at - time.time()
+            if remaining <= 0:
+                return True
+
+            # Wake at least every BOT_SCHEDULER_MAX_SLEEP_SECONDS to notice clock changes
+            wall_start, monotonic_start = time.time(), time.monotonic()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=min(remaining, settings.BOT_SCHEDULER_MAX_SLEEP_SECONDS))
+                self._wake.clear()
+                return False
+            except asyncio.TimeoutError:
+                pass
+
+            # Wall clock moved differently from elapsed time: NTP step, manual change or suspend
+            drift = (time.time() - wall_start) - (time.monotonic() - monotonic_start)
+            if abs(drift) > CLOCK_JUMP_SECONDS:
+                logger.warning(f"⏱️ Wall clock jumped {drift:+.0f}s, recomputing the schedule")
+                self._rebuild = True
+                return False
+
+    async def _dispatch_loop(self):
+        """Sleep until the earliest entry, then hand every due entry to the workers"""
+        try:
+            while True:
+                if self._rebuild:
+                    self._rebuild_heap()
+
+                if not self.heap:
+                    await self._wake.wait()
+                    self._wake.clear()
+                    continue
+
+                if not await self._sleep_until(self.heap[0][0]):
+                    continue
+
+                now = time.time()
+                while self.heap and self.heap[0][0] <= now:
+                    entry = heapq.heappop(self.heap)
+                    fire_at, _, generation, username, phase, slot = entry
+                    if generation != self.generation:
+                        continue
+                    if username in self.in_flight:
+                        # One job per bot at a time (a replay can overlap the bot's regular slot)
+                        self._push(username, phase, slot, now + BUSY_RETRY_SECONDS)
+                        continue
+                    self.in_flight[username] = phase
+                    self.queue.put_nowait(entry)
+                    self.dispatched += 1
+
+        except asyncio.CancelledError:
+            logger.info("📋 Scheduler dispatcher cancelled")
+
+    async def _worker(self):
+        """Run due entries one at a time; the engine runs worker_count of these"""
+        while True:
+            _, _, generation, username, phase, slot = await self.queue.get()
+            try:
+                if phase == PHASE_STAGE:
+                    await self.stage_handler(username, slot)
+                else:
+                    if phase == PHASE_REPLAY:
+                        logger.info(f"⏪ Catching up {username}'s missed {slot.strftime('%Y-%m-%d %H:%M')} slot")
+                        self.replayed += 1
+                    await self.post_handler(username, slot)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"❌ Scheduled {phase} for {username} failed: {str(e)}")
+            finally:
+                self.in_flight.pop(username, None)
+                self.queue.task_done()
+
+            # Staging is followed by the post for the same slot, a post by the next slot;
+            # a replay leaves the bot's regular entry alone
+            if phase == PHASE_REPLAY:
+                continue
+            if phase == PHASE_POST:
+                self._push_next(username, after=slot)
+            elif generation == self.generation:
+                self._push(username, PHASE_POST, slot, self._fire_time(username, slot))
+            else:
+                # Rescheduled while staging: start over from the new schedule
+                self._push_next(username)
+
+    def next_fire(self, username: str) -> Optional[datetime]:
+        """When a bot's next queued entry fires (O(N) scan, for stats only)"""
+        times = [entry[0] for entry in self.heap if entry[3] == username]
+        return datetime.fromtimestamp(min(times), pytz.utc) if times else None
+
+    def get_stats(self) -> Dict:
+        """Get scheduler statistics"""
+        head = None
+        if self.heap:
+            fire_at, _, _, username, phase, slot = self.heap[0]
+            head = {
+                "bot": username,
+                "phase": phase,
+                "slot": slot.isoformat(),
+                "fires_in_seconds": round(fire_at - time.time())
+            }
+
+        return {
+            "running": bool(self.tasks),
+            "bots": len(self.schedules),
+            "queued": len(self.heap),
+            "in_flight": len(self.in_flight),
+            "waiting": self.queue.qsize() if self.queue else 0,
+            "workers": self.worker_count,
+            "dispatched": self.dispatched,
+            "failures": self.failures,
+            "replayed": self.replayed,
+            "replays_skipped": self.replays_skipped,
+            "next": head
+        }
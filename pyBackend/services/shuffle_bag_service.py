@@ -0,0 +1,137 @@
+"""
+Shuffle Bag Service
+Persisted per-bot random permutation of the catalog for no-repeat photo selection
+"""
+
+import logging
+import random
+from typing import Callable, Dict, List, Optional, Set
+
+from .photo_model import Photo
+from .tracker_storage import WriteBehindStorage, get_tracker_storage
+
+logger = logging.getLogger(__name__)
+
+class ShuffleBag:
+    """One bot's permutation; everything from cursor on is still to be drawn"""
+
+    __slots__ = ("order", "cursor", "remaining", "catalog", "photos_by_id", "refilled_from")
+
+    def __init__(self, order: List[str], cursor: int):
+        self.order = order
+        self.cursor = cursor
+        self.remaining: Set[str] = set(order[cursor:])
+        # The catalog list this bag was last synced/refilled against (compared by identity)
+        self.catalog: Optional[List[Photo]] = None
+        self.refilled_from: Optional[List[Photo]] = None
+        self.photos_by_id: Dict[str, Photo] = {}
+
+class ShuffleBagService:
+    """Draws photos in O(1) from a persisted shuffle bag per bot"""
+
+    def __init__(self, storage: Optional[WriteBehindStorage] = None):
+        self.storage = storage or get_tracker_storage()
+        self.bags: Dict[str, ShuffleBag] = {}
+        self.storage.add_reloader(self.reload)
+
+    def reload(self) -> Callable[[], None]:
+        """Re-read the cached bags (on the writer thread; another worker wrote to storage)"""
+        fresh = {bot_username: self.storage.load_shuffle_bag(bot_username) for bot_username in list(self.bags)}
+
+        def swap():
+            for bot_username, (order, cursor) in fresh.items():
+                self.bags[bot_username] = ShuffleBag(order, cursor)
+        return swap
+
+    def _bag(self, bot_username: str) -> ShuffleBag:
+        bag = self.bags.get(bot_username)
+        if bag is None:
+            bag = self.bags[bot_username] = ShuffleBag(*self.storage.load_shuffle_bag(bot_username))
+        return bag
+
+    def _splice(self, bot_username: str, bag: ShuffleBag, photo_id: str):
+        """Add a photo at a random position among the ones still to be drawn"""
+        bag.order.append(photo_id)
+        last = len(bag.order) - 1
+        position = random.randint(bag.cursor, last)
+
+        if position != last:
+            bag.order[position], bag.order[last] = bag.order[last], bag.order[position]
+            self.storage.set_bag_slot(bot_username, last, bag.order[last])
+        self.storage.set_bag_slot(bot_username, position, photo_id)
+        bag.remaining.add(photo_id)
+
+    def _sync(self, bot_username: str, bag: ShuffleBag, photos: List[Photo], is_used: Callable[[str], bool]):
+        """Splice in catalog photos the bag doesn't know yet (once per catalog refresh)"""
+        bag.catalog = photos
+        bag.photos_by_id = {photo.id: photo for photo in photos}
+
+        added = 0
+        for photo in photos:
+            if photo.id not in bag.remaining and not is_used(photo.id):
+                self._splice(bot_username, bag, photo.id)
+                added += 1
+
+        if added:
+            logger.info(f"🎒 {bot_username}: spliced {added} new photos into the shuffle bag")
+
+    def _refill(self, bot_username: str, bag: ShuffleBag, photos: List[Photo], is_used: Callable[[str], bool]):
+        """Start a new permutation from every catalog photo that isn't used"""
+        bag.order = [photo.id for photo in photos if not is_used(photo.id)]
+        random.shuffle(bag.order)
+        bag.cursor = 0
+        bag.remaining = set(bag.order)
+        bag.refilled_from = photos
+        self.storage.replace_shuffle_bag(bot_username, bag.order)
+        logger.info(f"🎒 {bot_username}: new shuffle bag of {len(bag.order)} photos")
+
+    def draw(self, bot_username: str, photos: List[Photo], is_eligible: Callable[[Photo], bool],
+             is_used: Callable[[str], bool]) -> Optional[Photo]:
+        """Next eligible photo from the bag (None once nothing unused is left)"""
+        bag = self._bag(bot_username)
+        if bag.catalog is not photos:
+            self._sync(bot_username, bag, photos, is_used)
+
+        for _ in range(2):
+            while bag.cursor < len(bag.order):
+                photo_id = bag.order[bag.cursor]
+                bag.cursor += 1
+                bag.remaining.discard(photo_id)
+
+                # Photos dropped from the catalog or used elsewhere are skipped here
+                photo = bag.photos_by_id.get(photo_id)
+                if photo is not None and is_eligible(photo):
+                    self.storage.set_bag_cursor(bot_username, bag.cursor)
+                    return photo
+
+            self.storage.set_bag_cursor(bot_username, bag.cursor)
+
+            # Refill at most once per catalog so an exhausted catalog doesn't rescan every draw
+            if bag.refilled_from is photos:
+                break
+            self._refill(bot_username, bag, photos, is_used)
+
+        return None
+
+    def put_back(self, bot_username: str, photo_id: str):
+        """Return a released photo to the bag"""
+        bag = self._bag(bot_username)
+        if photo_id not in bag.remaining:
+            self._splice(bot_username, bag, photo_id)
+
+    def reset(self, bot_username: str):
+        """Empty a bot's bag; the next draw rebuilds it from the catalog"""
+        self.bags.pop(bot_username, None)
+        self.storage.replace_shuffle_bag(bot_username, [])
+
+    def get_stats(self, bot_username: str) -> Dict:
+        """Get shuffle bag statistics"""
+        bag = self._bag(bot_username)
+        return {
+            "size": len(bag.order),
+            "drawn": bag.cursor,
+            "remaining": len(bag.remaining)
+        }
+
+# Global instance
+shuffle_bags = ShuffleBagService()
@@ -0,0 +1,58 @@
+"""
+Single Flight
+Coalesces concurrent identical calls into one shared in-flight future
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+from .rate_budget_service import current_unsplash_priority
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """Runs at most one call per key at a time and shares its result"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await fn(), or the identical call already in flight for this key"""
+        # The shared call runs in its starter's context, rate-budget priority included,
+        # so only callers at the same priority share one
+        key = (key, current_unsplash_priority())
+        future = self._calls.get(key)
+
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            self.started += 1
+            future.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+            logger.debug(f"🔗 {self.name}: joined in-flight call {key}")
+
+        # A cancelled waiter must not cancel the call the others are sharing
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+    def get_stats(self) -> Dict:
+        """Get coalescing statistics"""
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "coalesced": self.coalesced
+        }
+
+# Global instances
+upstream_flight = SingleFlight("unsplash")
+api_flight = SingleFlight("api")
@@ -0,0 +1,990 @@
+"""
+Tracker Storage
+Pluggable persistence for the photo and schedule trackers (JSON files or SQLite)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+
+def _atomic_write_json(path: str, data: Dict):
+    """Write JSON via temp file + fsync + rename so readers never see a torn file"""
+    _atomic_write_text(path, json.dumps(data, indent=2))
+
+def _atomic_write_text(path: str, content: str):
+    temp_file = path + ".tmp"
+    with open(temp_file, 'w') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+    # Persist the rename itself
+    dir_fd = os.open(os.path.dirname(path), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+class TrackerStorage:
+    """Interface the trackers persist through"""
+
+    name = "base"
+
+    # Used photos
+    def load_used_photos(self, bot_username: str) -> Dict[str, Optional[str]]:
+        """Used photo ids for a bot (oldest first) mapped to when they were used"""
+        raise NotImplementedError
+
+    def reserve_photo(self, bot_username: str, photo_id: str, used_at: str) -> bool:
+        """Atomically mark a photo used; False if it already was"""
+        raise NotImplementedError
+
+    def release_photo(self, bot_username: str, photo_id: str) -> bool:
+        """Unmark a reserved photo; False if it wasn't marked"""
+        raise NotImplementedError
+
+    def reuse_photo(self, bot_username: str, photo_id: str, previous_used_at: Optional[str], used_at: str) -> bool:
+        """Move a used photo's timestamp forward if it still has previous_used_at (compare-and-set)"""
+        raise NotImplementedError
+
+    def reset_photos(self, bot_username: str) -> int:
+        """Forget every used photo for a bot, returning how many were dropped"""
+        raise NotImplementedError
+
+    def delete_used_before(self, used_at: str) -> int:
+        """Forget photo uses older than a timestamp, returning how many went"""
+        raise NotImplementedError
+
+    # Shuffle bags
+    def load_shuffle_bag(self, bot_username: str) -> Tuple[List[str], int]:
+        """A bot's persisted photo permutation and how far into it selection is"""
+        raise NotImplementedError
+
+    def replace_shuffle_bag(self, bot_username: str, order: List[str]):
+        """Start a new permutation for a bot (cursor back to 0)"""
+        raise NotImplementedError
+
+    def set_bag_slot(self, bot_username: str, position: int, photo_id: str):
+        """Put a photo at one position of a bot's permutation"""
+        raise NotImplementedError
+
+    def set_bag_cursor(self, bot_username: str, cursor: int):
+        """Record how far into its permutation a bot has got"""
+        raise NotImplementedError
+
+    # Posted schedule slots
+    def load_posted_slots(self, bot_username: str, date: str) -> List[str]:
+        """Slots ("HH:MM") a bot already posted on a date ("YYYY-MM-DD")"""
+        raise NotImplementedError
+
+    def claim_slot(self, bot_username: str, date: str, slot: str, posted_at: str) -> bool:
+        """Atomically record a post for a slot; False if it was already claimed"""
+        raise NotImplementedError
+
+    def release_slot(self, bot_username: str, date: str, slot: str) -> bool:
+        """Give back a claimed slot whose post never went out"""
+        raise NotImplementedError
+
+    def get_schedule_summary(self, bot_username: str) -> Optional[Dict]:
+        """{"total_posts", "last_updated"} for a bot across every history tier, None if it never posted"""
+        raise NotImplementedError
+
+    def compact_schedule_history(self, recent_before: str, daily_before: str) -> int:
+        """Roll per-slot history before recent_before into daily counts, and daily counts
+        before daily_before into monthly counts; returns how many slot records were rolled up"""
+        raise NotImplementedError
+
+    def get_version(self) -> Optional[int]:
+        """Counter that changes whenever any process writes (None if the backend can't tell)"""
+        return None
+
+    def end_batch(self):
+        """Called after each batch of queued writes, to persist anything the backend deferred"""
+
+class JsonTrackerStorage(TrackerStorage):
+    """The original data/*.json files (used photos journaled, schedule rewritten atomically)"""
+
+    name = "json"
+
+    def __init__(self, data_dir: str = DATA_DIR):
+        self.photos_file = os.path.join(data_dir, "used_photos.json")
+        self.journal_file = os.path.join(data_dir, "used_photos.journal")
+        self.schedule_file = os.path.join(data_dir, "schedule_tracker.json")
+        self.bags_file = os.path.join(data_dir, "shuffle_bags.json")
+
+        # bot_username -> {photo_id: used_at} in insertion order
+        self.used: Dict[str, Dict[str, Optional[str]]] = {}
+        self.last_updated: Dict[str, Optional[str]] = {}
+        self.journal_entries = 0
+        self.schedule: Dict[str, Dict] = {}
+        self.bags: Dict[str, Dict] = {}
+        # Bag writes are kept in memory and saved once per batch (see end_batch)
+        self.bags_dirty = False
+
+        # Writes run in the write-behind thread while reads come from the event loop
+        self._lock = threading.RLock()
+
+        os.makedirs(data_dir, exist_ok=True)
+        self._load_photos()
+        self._load_schedule()
+        self._load_bags()
+
+    def _load_photos(self):
+        """Load the last snapshot, then replay the journal on top of it"""
+        if os.path.exists(self.photos_file):
+            try:
+                with open(self.photos_file, 'r') as f:
+                    snapshot = json.load(f)
+
+                for bot_username, bot_data in snapshot.items():
+                    used_at = bot_data.get("used_at", {})
+                    self.used[bot_username] = {
+                        photo_id: used_at.get(photo_id) for photo_id in bot_data.get("used_photo_ids", [])
+                    }
+                    self.last_updated[bot_username] = bot_data.get("last_updated")
+            except Exception as e:
+                logger.error(f"❌ Error loading photo tracker data: {str(e)}")
+
+        self._replay_journal()
+
+    def _replay_journal(self):
+        """Apply journal entries written since the last compaction"""
+        if not os.path.exists(self.journal_file):
+            return
+
+        try:
+            with open(self.journal_file, 'rb+') as f:
+                content = f.read()
+
+                # A crash mid-append can only tear the last line; cut it off so
+                # the next append starts on a fresh line
+                complete = content.rfind(b"\n") + 1
+                if complete < len(content):
+                    logger.warning("⚠️ Dropping torn photo tracker journal entry")
+                    f.truncate(complete)
+
+            for line in content[:complete].splitlines():
+                self._apply(json.loads(line))
+                self.journal_entries += 1
+        except Exception as e:
+            logger.error(f"❌ Error replaying photo tracker journal: {str(e)}")
+
+    def _apply(self, entry: Dict):
+        """Apply one mark/release/reset entry to the in-memory state"""
+        bot_username = entry["bot"]
+        used = self.used.setdefault(bot_username, {})
+
+        if entry["op"] == "mark":
+            used[entry["photo_id"]] = entry["at"]
+        elif entry["op"] == "release":
+            used.pop(entry["photo_id"], None)
+        elif entry["op"] == "reset":
+            used.clear()
+
+        self.last_updated[bot_username] = entry["at"]
+
+    def _record(self, op: str, bot_username: str, photo_id: Optional[str] = None, at: Optional[str] = None):
+        """Apply an entry and append it to the journal (compacting when it grows)"""
+        entry = {"op": op, "bot": bot_username, "at": at or datetime.now().isoformat()}
+        if photo_id is not None:
+            entry["photo_id"] = photo_id
+        self._apply(entry)
+
+        with open(self.journal_file, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.journal_entries += 1
+
+        if self.journal_entries >= settings.PHOTO_TRACKER_COMPACT_EVERY:
+            self._compact()
+
+    def _compact(self):
+        """Atomically rewrite the snapshot and truncate the journal"""
+        snapshot = {
+            bot_username: {
+                "used_photo_ids": list(used),
+                "used_at": used,
+                "last_updated": self.last_updated.get(bot_username),
+                "total_used": len(used)
+            }
+            for bot_username, used in self.used.items()
+        }
+
+        try:
+            _atomic_write_json(self.photos_file, snapshot)
+
+            # Replaying entries over a snapshot that already holds them is harmless,
+            # so a crash between the rename and this truncate loses nothing
+            with open(self.journal_file, 'w') as f:
+                os.fsync(f.fileno())
+
+            logger.info(f"🗜️ Compacted photo tracker journal ({self.journal_entries} entries)")
+            self.journal_entries = 0
+        except Exception as e:
+            logger.error(f"❌ Error compacting photo tracker data: {str(e)}")
+
+    def _load_schedule(self):
+        if os.path.exists(self.schedule_file):
+            try:
+                with open(self.schedule_file, 'r') as f:
+                    self.schedule = json.load(f)
+            except Exception as e:
+                logger.error(f"❌ Error loading schedule tracker data: {str(e)}")
+
+    def _load_bags(self):
+        if os.path.exists(self.bags_file):
+            try:
+                with open(self.bags_file, 'r') as f:
+                    self.bags = json.load(f)
+            except Exception as e:
+                logger.error(f"❌ Error loading shuffle bags: {str(e)}")
+
+    def load_used_photos(self, bot_username: str) -> Dict[str, Optional[str]]:
+        with self._lock:
+            return dict(self.used.get(bot_username, {}))
+
+    def reserve_photo(self, bot_username: str, photo_id: str, used_at: str) -> bool:
+        with self._lock:
+            if photo_id in self.used.get(bot_username, ()):
+                return False
+            self._record("mark", bot_username, photo_id, used_at)
+            return True
+
+    def release_photo(self, bot_username: str, photo_id: str) -> bool:
+        with self._lock:
+            if photo_id not in self.used.get(bot_username, ()):
+                return False
+            self._record("release", bot_username, photo_id)
+            return True
+
+    def reuse_photo(self, bot_username: str, photo_id: str, previous_used_at: Optional[str], used_at: str) -> bool:
+        with self._lock:
+            used = self.used.get(bot_username, {})
+            if photo_id not in used or used[photo_id] != previous_used_at:
+                return False
+            self._record("mark", bot_username, photo_id, used_at)
+            return True
+
+    def delete_used_before(self, used_at: str) -> int:
+        with self._lock:
+            expired = [
+                (bot_username, photo_id)
+                for bot_username, used in self.used.items()
+                for photo_id, photo_used_at in used.items()
+                if photo_used_at and photo_used_at < used_at
+            ]
+            for bot_username, photo_id in expired:
+                self._record("release", bot_username, photo_id)
+            return len(expired)
+
+    def reset_photos(self, bot_username: str) -> int:
+        with self._lock:
+            count = len(self.used.get(bot_username, ()))
+            self._record("reset", bot_username)
+            # A reset makes everything before it dead weight, so compact right away
+            self._compact()
+            return count
+
+    def load_shuffle_bag(self, bot_username: str) -> Tuple[List[str], int]:
+        with self._lock:
+            bag = self.bags.get(bot_username, {})
+            return list(bag.get("order", [])), bag.get("cursor", 0)
+
+    def replace_shuffle_bag(self, bot_username: str, order: List[str]):
+        with self._lock:
+            self.bags[bot_username] = {"order": list(order), "cursor": 0}
+            self.bags_dirty = True
+
+    def set_bag_slot(self, bot_username: str, position: int, photo_id: str):
+        with self._lock:
+            order = self.bags.setdefault(bot_username, {"order": [], "cursor": 0})["order"]
+            order.extend([None] * (position + 1 - len(order)))
+            order[position] = photo_id
+            self.bags_dirty = True
+
+    def set_bag_cursor(self, bot_username: str, cursor: int):
+        with self._lock:
+            self.bags.setdefault(bot_username, {"order": [], "cursor": 0})["cursor"] = cursor
+            self.bags_dirty = True
+
+    def end_batch(self):
+        # Bags are only a selection hint, so one rewrite per batch is enough
+        with self._lock:
+            if not self.bags_dirty:
+                return
+            self.bags_dirty = False
+            content = json.dumps(self.bags)
+
+        # Written outside the lock so event-loop readers aren't held up by the fsync
+        try:
+            _atomic_write_text(self.bags_file, content)
+        except Exception as e:
+            logger.error(f"❌ Error saving shuffle bags: {str(e)}")
+            with self._lock:
+                self.bags_dirty = True
+
+    def load_posted_slots(self, bot_username: str, date: str) -> List[str]:
+        with self._lock:
+            return list(self.schedule.get(bot_username, {}).get("last_post_dates", {}).get(date, []))
+
+    def claim_slot(self, bot_username: str, date: str, slot: str, posted_at: str) -> bool:
+        with self._lock:
+            bot_data = self.schedule.setdefault(bot_username, {
+                "last_post_dates": {},
+                "total_posts": 0,
+                "last_updated": None
+            })
+            posted_times = bot_data["last_post_dates"].setdefault(date, [])
+            if slot in posted_times:
+                return False
+
+            posted_times.append(slot)
+            bot_data["total_posts"] += 1
+            bot_data["last_updated"] = posted_at
+            _atomic_write_json(self.schedule_file, self.schedule)
+            return True
+
+    def release_slot(self, bot_username: str, date: str, slot: str) -> bool:
+        with self._lock:
+            posted_times = self.schedule.get(bot_username, {}).get("last_post_dates", {}).get(date, [])
+            if slot not in posted_times:
+                return False
+
+            posted_times.remove(slot)
+            self.schedule[bot_username]["total_posts"] -= 1
+            _atomic_write_json(self.schedule_file, self.schedule)
+            return True
+
+    def get_schedule_summary(self, bot_username: str) -> Optional[Dict]:
+        with self._lock:
+            bot_data = self.schedule.get(bot_username)
+            if bot_data is None:
+                return None
+            return {"total_posts": bot_data["total_posts"], "last_updated": bot_data["last_updated"]}
+
+    def compact_schedule_history(self, recent_before: str, daily_before: str) -> int:
+        with self._lock:
+            rolled_up = 0
+            changed = False
+            for bot_data in self.schedule.values():
+                post_dates = bot_data.setdefault("last_post_dates", {})
+                daily = bot_data.setdefault("daily_posts", {})
+                monthly = bot_data.setdefault("monthly_posts", {})
+
+                for old_date in [d for d in post_dates if d < recent_before]:
+                    slots = post_dates.pop(old_date)
+                    daily[old_date] = daily.get(old_date, 0) + len(slots)
+                    rolled_up += len(slots)
+                    changed = True
+
+                for old_date in [d for d in daily if d < daily_before]:
+                    month = old_date[:7]
+                    monthly[month] = monthly.get(month, 0) + daily.pop(old_date)
+                    changed = True
+
+            if changed:
+                _atomic_write_json(self.schedule_file, self.schedule)
+            return rolled_up
+
+class SqliteTrackerStorage(TrackerStorage):
+    """SQLite (WAL) tables with one indexed row per used photo and per posted slot"""
+
+    name = "sqlite"
+
+    def __init__(self, db_file: Optional[str] = None):
+        self.db_file = db_file or os.path.join(DATA_DIR, "trackers.db")
+        self._ensure_db()
+        self._migrate_json()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, timeout=10.0)
+        conn.execute("PRAGMA synchronous = NORMAL")  # Durable enough under WAL, far fewer fsyncs
+        return conn
+
+    def _ensure_db(self):
+        """Ensure data directory and tracker tables exist"""
+        os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS used_photos (
+                    bot_username TEXT NOT NULL,
+                    photo_id TEXT NOT NULL,
+                    used_at TEXT,
+                    PRIMARY KEY (bot_username, photo_id)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS used_photos_by_time ON used_photos (bot_username, used_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS posted_slots (
+                    bot_username TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    slot TEXT NOT NULL,
+                    posted_at TEXT,
+                    PRIMARY KEY (bot_username, date, slot)
+                )
+            """)
+            # Older history, rolled up by compact_schedule_history
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schedule_daily (
+                    bot_username TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    posts INTEGER NOT NULL,
+                    last_posted_at TEXT,
+                    PRIMARY KEY (bot_username, date)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schedule_monthly (
+                    bot_username TEXT NOT NULL,
+                    month TEXT NOT NULL,
+                    posts INTEGER NOT NULL,
+                    last_posted_at TEXT,
+                    PRIMARY KEY (bot_username, month)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tracker_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+
+            # Shuffle bags are only a selection hint (reservations arbitrate), so they don't bump the version
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shuffle_bag_slots (
+                    bot_username TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    photo_id TEXT NOT NULL,
+                    PRIMARY KEY (bot_username, position)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shuffle_bag_cursors (
+                    bot_username TEXT PRIMARY KEY,
+                    cursor INTEGER NOT NULL
+                )
+            """)
+
+            # Every write from any process bumps the version, so other workers know to reload
+            conn.execute("INSERT OR IGNORE INTO tracker_meta (key, value) VALUES ('version', 0)")
+            for table in ("used_photos", "posted_slots"):
+                for event in ("INSERT", "UPDATE", "DELETE"):
+                    conn.execute(f"""
+                        CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version AFTER {event} ON {table}
+                        BEGIN
+                            UPDATE tracker_meta SET value = value + 1 WHERE key = 'version';
+                        END
+                    """)
+
+    def _migrate_json(self):
+        """One-time import of data/used_photos.json(+journal) and data/schedule_tracker.json"""
+        with closing(self._connect()) as conn:
+            if conn.execute("SELECT 1 FROM tracker_meta WHERE key = 'json_migrated'").fetchone():
+                return
+
+        with closing(self._connect()) as conn:
+            # Workers starting together race here: take the write lock, then check again
+            conn.isolation_level = None
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("SELECT 1 FROM tracker_meta WHERE key = 'json_migrated'").fetchone():
+                    conn.execute("ROLLBACK")
+                    return
+
+                legacy = JsonTrackerStorage(os.path.dirname(self.db_file))
+                photo_rows = [
+                    (bot_username, photo_id, used_at or legacy.last_updated.get(bot_username))
+                    for bot_username, used in legacy.used.items()
+                    for photo_id, used_at in used.items()
+                ]
+                slot_rows = [
+                    (bot_username, date, slot, f"{date}T{slot}:00")
+                    for bot_username, bot_data in legacy.schedule.items()
+                    for date, slots in bot_data.get("last_post_dates", {}).items()
+                    for slot in slots
+                ]
+
+                conn.executemany("INSERT OR IGNORE INTO used_photos VALUES (?, ?, ?)", photo_rows)
+                conn.executemany("INSERT OR IGNORE INTO posted_slots VALUES (?, ?, ?, ?)", slot_rows)
+                conn.execute(
+                    "INSERT OR IGNORE INTO tracker_meta (key, value) VALUES ('json_migrated', ?)",
+                    (datetime.now().isoformat(),)
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        logger.info(f"📦 Migrated {len(photo_rows)} used photos and {len(slot_rows)} posted slots from JSON to SQLite")
+
+    def load_used_photos(self, bot_username: str) -> Dict[str, Optional[str]]:
+        with closing(self._connect()) as conn:
+            return dict(conn.execute(
+                "SELECT photo_id, used_at FROM used_photos WHERE bot_username = ? ORDER BY used_at",
+                (bot_username,)
+            ))
+
+    def reserve_photo(self, bot_username: str, photo_id: str, used_at: str) -> bool:
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO used_photos (bot_username, photo_id, used_at) VALUES (?, ?, ?)",
+                (bot_username, photo_id, used_at)
+            )
+            return cursor.rowcount == 1
+
+    def release_photo(self, bot_username: str, photo_id: str) -> bool:
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "DELETE FROM used_photos WHERE bot_username = ? AND photo_id = ?",
+                (bot_username, photo_id)
+            )
+            return cursor.rowcount == 1
+
+    def reuse_photo(self, bot_username: str, photo_id: str, previous_used_at: Optional[str], used_at: str) -> bool:
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "UPDATE used_photos SET used_at = ? WHERE bot_username = ? AND photo_id = ? AND used_at IS ?",
+                (used_at, bot_username, photo_id, previous_used_at)
+            )
+            return cursor.rowcount == 1
+
+    def reset_photos(self, bot_username: str) -> int:
+        with closing(self._connect()) as conn, conn:
+            return conn.execute("DELETE FROM used_photos WHERE bot_username = ?", (bot_username,)).rowcount
+
+    def delete_used_before(self, used_at: str) -> int:
+        with closing(self._connect()) as conn, conn:
+            return conn.execute("DELETE FROM used_photos WHERE used_at < ?", (used_at,)).rowcount
+
+    def load_shuffle_bag(self, bot_username: str) -> Tuple[List[str], int]:
+        with closing(self._connect()) as conn:
+            order = [photo_id for (photo_id,) in conn.execute(
+                "SELECT photo_id FROM shuffle_bag_slots WHERE bot_username = ? ORDER BY position",
+                (bot_username,)
+            )]
+            row = conn.execute("SELECT cursor FROM shuffle_bag_cursors WHERE bot_username = ?", (bot_username,)).fetchone()
+        return order, row[0] if row else 0
+
+    def replace_shuffle_bag(self, bot_username: str, order: List[str]):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM shuffle_bag_slots WHERE bot_username = ?", (bot_username,))
+            conn.executemany(
+                "INSERT INTO shuffle_bag_slots (bot_username, position, photo_id) VALUES (?, ?, ?)",
+                [(bot_username, position, photo_id) for position, photo_id in enumerate(order)]
+            )
+            conn.execute("INSERT OR REPLACE INTO shuffle_bag_cursors (bot_username, cursor) VALUES (?, 0)", (bot_username,))
+
+    def set_bag_slot(self, bot_username: str, position: int, photo_id: str):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO shuffle_bag_slots (bot_username, position, photo_id) VALUES (?, ?, ?)",
+                (bot_username, position, photo_id)
+            )
+
+    def set_bag_cursor(self, bot_username: str, cursor: int):
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO shuffle_bag_cursors (bot_username, cursor) VALUES (?, ?)",
+                (bot_username, cursor)
+            )
+
+    def load_posted_slots(self, bot_username: str, date: str) -> List[str]:
+        with closing(self._connect()) as conn:
+            return [slot for (slot,) in conn.execute(
+                "SELECT slot FROM posted_slots WHERE bot_username = ? AND date = ? ORDER BY slot",
+                (bot_username, date)
+            )]
+
+    def claim_slot(self, bot_username: str, date: str, slot: str, posted_at: str) -> bool:
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO posted_slots (bot_username, date, slot, posted_at) VALUES (?, ?, ?, ?)",
+                (bot_username, date, slot, posted_at)
+            )
+            return cursor.rowcount == 1
+
+    def release_slot(self, bot_username: str, date: str, slot: str) -> bool:
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "DELETE FROM posted_slots WHERE bot_username = ? AND date = ? AND slot = ?",
+                (bot_username, date, slot)
+            )
+            return cursor.rowcount == 1
+
+    def get_schedule_summary(self, bot_username: str) -> Optional[Dict]:
+        # Each tier holds a bounded number of rows per bot, so this stays flat over time
+        with closing(self._connect()) as conn:
+            tiers = [
+                conn.execute(
+                    f"SELECT {count}, MAX({posted_at}) FROM {table} WHERE bot_username = ?",
+                    (bot_username,)
+                ).fetchone()
+                for table, count, posted_at in (
+                    ("posted_slots", "COUNT(*)", "posted_at"),
+                    ("schedule_daily", "COALESCE(SUM(posts), 0)", "last_posted_at"),
+                    ("schedule_monthly", "COALESCE(SUM(posts), 0)", "last_posted_at")
+                )
+            ]
+
+        total_posts = sum(posts for posts, _ in tiers)
+        if not total_posts:
+            return None
+        return {"total_posts": total_posts, "last_updated": max(at for _, at in tiers if at)}
+
+    def compact_schedule_history(self, recent_before: str, daily_before: str) -> int:
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                INSERT INTO schedule_daily (bot_username, date, posts, last_posted_at)
+                SELECT bot_username, date, COUNT(*), MAX(posted_at) FROM posted_slots
+                WHERE date < ? GROUP BY bot_username, date
+                ON CONFLICT (bot_username, date) DO UPDATE SET
+                    posts = posts + excluded.posts,
+                    last_posted_at = MAX(COALESCE(last_posted_at, ''), COALESCE(excluded.last_posted_at, ''))
+            """, (recent_before,))
+            rolled_up = conn.execute("DELETE FROM posted_slots WHERE date < ?", (recent_before,)).rowcount
+
+            conn.execute("""
+                INSERT INTO schedule_monthly (bot_username, month, posts, last_posted_at)
+                SELECT bot_username, substr(date, 1, 7), SUM(posts), MAX(last_posted_at) FROM schedule_daily
+                WHERE date < ? GROUP BY bot_username, substr(date, 1, 7)
+                ON CONFLICT (bot_username, month) DO UPDATE SET
+                    posts = posts + excluded.posts,
+                    last_posted_at = MAX(COALESCE(last_posted_at, ''), COALESCE(excluded.last_posted_at, ''))
+            """, (daily_before,))
+            conn.execute("DELETE FROM schedule_daily WHERE date < ?", (daily_before,))
+            return rolled_up
+
+    def get_version(self) -> Optional[int]:
+        with closing(self._connect()) as conn:
+            return int(conn.execute("SELECT value FROM tracker_meta WHERE key = 'version'").fetchone()[0])
+
+class WriteBehindStorage(TrackerStorage):
+    """Queues writes in memory and flushes them off the event loop in debounced batches
+
+    The trackers keep their own in-memory view, so queued writes report success
+    straight away. Photo reservations and slot claims have async write-through
+    variants that let the database decide between competing workers. All writes
+    run on one writer thread, so queued and write-through writes land in order.
+    A watcher notices writes from other processes and rebuilds the trackers'
+    caches on the writer thread instead of leaving them to reload on the loop.
+    Until start() is called (scripts, tests) every write goes straight through.
+    """
+
+    def __init__(self, storage: TrackerStorage, flush_interval: float):
+        self.storage = storage
+        self.name = f"{storage.name} (write-behind)"
+        self.flush_interval = flush_interval
+
+        # Latest pending write per key, in the order they were last touched
+        self.pending: Dict[Hashable, Tuple[str, tuple]] = {}
+        self._lock = threading.Lock()
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.flush_task = None
+        self.watch_task = None
+        self._dirty: Optional[asyncio.Event] = None
+
+        # Called when another process changed the stored state
+        self.listeners: List[Callable[[], None]] = []
+        # Run on the writer thread after such a change to read fresh cache state;
+        # each returns a callback that swaps it in on the event loop
+        self.reloaders: List[Callable[[], Callable[[], None]]] = []
+        self.version: Optional[int] = None
+        self.enqueued = 0
+        self.stale = False  # A reload raced local writes and has to be redone
+
+        self.flushes = 0
+        self.flushed_writes = 0
+        self.coalesced_writes = 0
+        self.reloads = 0
+
+    def add_listener(self, listener: Callable[[], None]):
+        self.listeners.append(listener)
+
+    def add_reloader(self, reloader: Callable[[], Callable[[], None]]):
+        self.reloaders.append(reloader)
+
+    def _enqueue(self, key: Hashable, method: str, *args):
+        if self.flush_task is None:
+            getattr(self.storage, method)(*args)
+            self.storage.end_batch()
+            return
+
+        # A newer write to the same key supersedes the queued one
+        with self._lock:
+            if self.pending.pop(key, None) is not None:
+                self.coalesced_writes += 1
+            self.pending[key] = (method, args)
+            self.enqueued += 1
+        self._dirty.set()
+
+    def load_used_photos(self, bot_username: str) -> Dict[str, Optional[str]]:
+        return self.storage.load_used_photos(bot_username)
+
+    def reserve_photo(self, bot_username: str, photo_id: str, used_at: str) -> bool:
+        self._enqueue(("photo", bot_username, photo_id), "reserve_photo", bot_username, photo_id, used_at)
+        return True
+
+    def release_photo(self, bot_username: str, photo_id: str) -> bool:
+        self._enqueue(("photo", bot_username, photo_id), "release_photo", bot_username, photo_id)
+        return True
+
+    def reuse_photo(self, bot_username: str, photo_id: str, previous_used_at: Optional[str], used_at: str) -> bool:
+        self._enqueue(("photo", bot_username, photo_id), "reuse_photo", bot_username, photo_id, previous_used_at, used_at)
+        return True
+
+    def delete_used_before(self, used_at: str) -> int:
+        self._enqueue(("photo-cleanup",), "delete_used_before", used_at)
+        return 0
+
+    def reset_photos(self, bot_username: str) -> int:
+        # Queued marks/releases for this bot are moot once it's reset
+        with self._lock:
+            for key in [key for key in self.pending if key[:2] == ("photo", bot_username)]:
+                del self.pending[key]
+                self.coalesced_writes += 1
+        self._enqueue(("reset", bot_username), "reset_photos", bot_username)
+        return 0
+
+    def load_shuffle_bag(self, bot_username: str) -> Tuple[List[str], int]:
+        return self.storage.load_shuffle_bag(bot_username)
+
+    def replace_shuffle_bag(self, bot_username: str, order: List[str]):
+        # Queued slot writes for the old permutation are moot
+        with self._lock:
+            for key in [key for key in self.pending if key[:2] == ("bag-slot", bot_username)]:
+                del self.pending[key]
+                self.coalesced_writes += 1
+        self._enqueue(("bag", bot_username), "replace_shuffle_bag", bot_username, list(order))
+
+    def set_bag_slot(self, bot_username: str, position: int, photo_id: str):
+        self._enqueue(("bag-slot", bot_username, position), "set_bag_slot", bot_username, position, photo_id)
+
+    def set_bag_cursor(self, bot_username: str, cursor: int):
+        self._enqueue(("bag-cursor", bot_username), "set_bag_cursor", bot_username, cursor)
+
+    def load_posted_slots(self, bot_username: str, date: str) -> List[str]:
+        return self.storage.load_posted_slots(bot_username, date)
+
+    def claim_slot(self, bot_username: str, date: str, slot: str, posted_at: str) -> bool:
+        self._enqueue(("slot", bot_username, date, slot), "claim_slot", bot_username, date, slot, posted_at)
+        return True
+
+    def release_slot(self, bot_username: str, date: str, slot: str) -> bool:
+        self._enqueue(("slot", bot_username, date, slot), "release_slot", bot_username, date, slot)
+        return True
+
+    def get_schedule_summary(self, bot_username: str) -> Optional[Dict]:
+        return self.storage.get_schedule_summary(bot_username)
+
+    def compact_schedule_history(self, recent_before: str, daily_before: str) -> int:
+        self._enqueue(("compact",), "compact_schedule_history", recent_before, daily_before)
+        return 0
+
+    def get_version(self) -> Optional[int]:
+        return self.storage.get_version()
+
+    def _drain(self) -> int:
+        """Apply everything queued so far (on the writer thread)"""
+        with self._lock:
+            batch, self.pending = self.pending, {}
+        if not batch:
+            return 0
+
+        try:
+            for method, args in batch.values():
+                self._count_own_write(getattr(self.storage, method)(*args))
+            self.storage.end_batch()
+        except Exception:
+            # Put the batch back ahead of anything queued meanwhile; the writes are idempotent
+            with self._lock:
+                for key in batch.keys() & self.pending.keys():
+                    del batch[key]
+                self.pending = {**batch, **self.pending}
+            raise
+
+        self.flushes += 1
+        self.flushed_writes += len(batch)
+        return len(batch)
+
+    def _write_through(self, method: str, *args):
+        """Flush queued writes, then run one write immediately (on the writer thread)"""
+        try:
+            self._drain()
+        except Exception as e:
+            logger.error(f"❌ Error flushing tracker writes: {str(e)}")
+        result = getattr(self.storage, method)(*args)
+        self._count_own_write(result)
+        return result
+
+    def _count_own_write(self, result):
+        """Move the version baseline past our own write (on the writer thread)
+
+        The version triggers bump once per row changed, which is exactly what the
+        storage methods return (True/False or a row count), so the watcher only
+        sees what other processes wrote.
+        """
+        if self.version is not None and result:
+            self.version += int(result)
+
+    def _storage_changed(self) -> bool:
+        """Whether another process wrote since our baseline (on the writer thread)"""
+        # Write out our own queued writes first, so listeners reload a view that has them
+        try:
+            self._drain()
+        except Exception as e:
+            logger.error(f"❌ Error flushing tracker writes: {str(e)}")
+
+        version = self.storage.get_version()
+        if version == self.version:
+            return False
+        self.version = version
+        return True
+
+    def _load_fresh(self) -> List[Callable[[], None]]:
+        """Read fresh state for every reloader (on the writer thread)"""
+        try:
+            self._drain()
+        except Exception as e:
+            logger.error(f"❌ Error flushing tracker writes: {str(e)}")
+        return [reloader() for reloader in self.reloaders]
+
+    async def _reload(self) -> bool:
+        """Rebuild the trackers' caches off the loop and swap them in (False if local writes raced it)"""
+        enqueued = self.enqueued
+        swaps = await self._run(self._load_fresh)
+        # A write queued meanwhile is in the old caches but maybe not in what was read
+        if self.enqueued != enqueued:
+            return False
+        for swap in swaps:
+            swap()
+        return True
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def reserve_photo_now(self, bot_username: str, photo_id: str, used_at: str) -> bool:
+        """Reserve a photo in storage right away; False if any worker already has it"""
+        if self.flush_task is None:
+            return self.storage.reserve_photo(bot_username, photo_id, used_at)
+        return await self._run(self._write_through, "reserve_photo", bot_username, photo_id, used_at)
+
+    async def reuse_photo_now(self, bot_username: str, photo_id: str, previous_used_at: Optional[str], used_at: str) -> bool:
+        """Re-reserve a used photo right away; False if another worker reused it first"""
+        if self.flush_task is None:
+            return self.storage.reuse_photo(bot_username, photo_id, previous_used_at, used_at)
+        return await self._run(self._write_through, "reuse_photo", bot_username, photo_id, previous_used_at, used_at)
+
+    async def claim_slot_now(self, bot_username: str, date: str, slot: str, posted_at: str) -> bool:
+        """Claim a slot in storage right away; False if any worker already has it"""
+        if self.flush_task is None:
+            return self.storage.claim_slot(bot_username, date, slot, posted_at)
+        return await self._run(self._write_through, "claim_slot", bot_username, date, slot, posted_at)
+
+    async def flush(self):
+        """Write everything queued so far"""
+        try:
+            count = await self._run(self._drain)
+            if count:
+                logger.debug(f"💾 Flushed {count} tracker writes")
+        except Exception as e:
+            logger.error(f"❌ Error flushing tracker writes: {str(e)}")
+            self._dirty.set()
+
+    async def _flush_loop(self):
+        while True:
+            await self._dirty.wait()
+            # Debounce: let a burst of writes pile up into one batch
+            await asyncio.sleep(self.flush_interval)
+            self._dirty.clear()
+            # Shielded so stopping the loop never abandons a batch halfway through
+            await asyncio.shield(self.flush())
+
+    async def _watch_loop(self):
+        """Reload listeners when another process has written to storage"""
+        while True:
+            await asyncio.sleep(settings.TRACKER_RELOAD_CHECK_SECONDS)
+            try:
+                changed = await self._run(self._storage_changed) or self.stale
+                if changed:
+                    # Until a reload lands, keep the old caches and try again next time
+                    self.stale = True
+                    self.stale = not await self._reload()
+            except Exception as e:
+                logger.error(f"❌ Error reloading tracker storage: {str(e)}")
+                continue
+
+            if changed and not self.stale:
+                self.reloads += 1
+                for listener in self.listeners:
+                    listener()
+
+    async def start(self):
+        """Start the writer thread, flusher and change watcher (called from the FastAPI lifespan)"""
+        if self.flush_task is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tracker-writer")
+            self._dirty = asyncio.Event()
+            self.flush_task = asyncio.create_task(self._flush_loop())
+
+            self.version = await self._run(self.storage.get_version)
+            if self.version is not None:
+                self.watch_task = asyncio.create_task(self._watch_loop())
+
+            logger.info(f"💾 Tracker write-behind started (every {self.flush_interval}s)")
+
+    async def close(self):
+        """Stop the background tasks and write out everything still queued"""
+        for task in (self.watch_task, self.flush_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+
+        if self.flush_task:
+            await self.flush()
+            self.executor.shutdown(wait=True)
+            self.flush_task = self.watch_task = None
+
+    def get_stats(self) -> Dict:
+        """Get write-behind statistics"""
+        return {
+            "backend": self.storage.name,
+            "pending_writes": len(self.pending),
+            "flushes": self.flushes,
+            "flushed_writes": self.flushed_writes,
+            "coalesced_writes": self.coalesced_writes,
+            "version": self.version,
+            "reloads": self.reloads
+        }
+
+_storage: Optional[WriteBehindStorage] = None
+
+def get_tracker_storage() -> WriteBehindStorage:
+    """Shared storage backend selected by TRACKER_STORAGE"""
+    global _storage
+    if _storage is None:
+        if settings.TRACKER_STORAGE == "json":
+            backend = JsonTrackerStorage()
+        else:
+            backend = SqliteTrackerStorage()
+        _storage = WriteBehindStorage(backend, settings.TRACKER_FLUSH_INTERVAL_SECONDS)
+        logger.info(f"🗄️ Tracker storage: {_storage.name}")
+    return _storage
@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+import pytest
+
+from services.leader_election import LeaderLease
+
+TTL = 0.3
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / "trackers.db")
+
+def make_lease(db_file, events=None, name="bot-scheduler"):
+    events = events if events is not None else []
+
+    async def on_acquired():
+        events.append("acquired")
+
+    async def on_lost():
+        events.append("lost")
+
+    return LeaderLease(name, on_acquired, on_lost, ttl_seconds=TTL, db_file=db_file)
+
+def test_live_lease_is_not_taken_over(db_file):
+    first, second = make_lease(db_file), make_lease(db_file)
+
+    assert first._try_acquire()
+    assert not second._try_acquire()
+    assert second.current_holder()["holder"] == first.holder
+    # Renewing our own lease always works
+    assert first._try_acquire()
+
+def test_expired_lease_is_taken_over(db_file):
+    first, second = make_lease(db_file), make_lease(db_file)
+    assert first._try_acquire()
+
+    time.sleep(TTL + 0.05)
+
+    assert second._try_acquire()
+    assert not first._try_acquire()
+    assert first.current_holder()["holder"] == second.holder
+
+def test_released_lease_is_free_at_once(db_file):
+    first, second = make_lease(db_file), make_lease(db_file)
+    assert first._try_acquire()
+
+    first._release()
+
+    assert second._try_acquire()
+
+async def wait_for(condition, timeout: float):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+def test_crashed_leader_is_replaced_and_steps_down(db_file):
+    first_events, second_events = [], []
+    first, second = make_lease(db_file, first_events), make_lease(db_file, second_events)
+
+    async def scenario():
+        await first.start()
+        assert await wait_for(lambda: first.is_leader, TTL * 2)
+
+        # The leader stops renewing without handing the lease back (hung or crashed)
+        first.task.cancel()
+        await asyncio.gather(first.task, return_exceptions=True)
+        first.task = None
+
+        await second.start()
+        assert not second.is_leader
+        assert await wait_for(lambda: second.is_leader, TTL * 3)
+
+        # The old leader comes back, finds the lease taken and steps down
+        await first.start()
+        assert await wait_for(lambda: not first.is_leader, TTL * 2)
+        assert second.is_leader
+
+        await first.stop()
+        await second.stop()
+
+    asyncio.run(scenario())
+
+    assert first_events == ["acquired", "lost"]
+    assert second_events == ["acquired", "lost"]
@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from config import settings
+from services.post_outbox import PostOutbox, STATUS_DEAD, STATUS_DELIVERED, STATUS_PENDING
+
+KEY = "marcin_frames_art:2026-01-01T09:00:00+07:00"
+PAYLOAD = {"content": "hello"}
+
+class FakeBackend:
+    """Answers each send with the next queued status code"""
+
+    def __init__(self, *status_codes):
+        self.status_codes = list(status_codes)
+        self.calls = []
+
+    async def send(self, payload, idempotency_key):
+        self.calls.append((payload, idempotency_key))
+        return self.status_codes.pop(0)
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "POST_OUTBOX_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "POST_OUTBOX_BASE_DELAY_SECONDS", 0.0)
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / "trackers.db")
+
+def test_retry_then_dead_letter_then_requeue(db_file):
+    backend = FakeBackend(503, 503, 503, 201)
+    outbox = PostOutbox(backend.send, db_file=db_file)
+
+    async def scenario():
+        # First attempt fails and is kept for a retry
+        assert await outbox.submit(KEY, "marcin_frames_art", PAYLOAD) == STATUS_PENDING
+        assert outbox.has_post(KEY)
+
+        # Retries run out: dead-lettered, and no longer counted as posted
+        assert await outbox.deliver_due() == 2
+        assert outbox._status(KEY) == STATUS_DEAD
+        assert not outbox.has_post(KEY)
+
+        dead = outbox.get_dead_letters()
+        assert [(row["idempotency_key"], row["attempts"], row["last_error"]) for row in dead] == [(KEY, 3, "HTTP 503")]
+
+        # Requeued with fresh attempts, it goes through
+        assert outbox.requeue_dead_letters() == 1
+        assert outbox._status(KEY) == STATUS_PENDING
+        assert await outbox.deliver_due() == 1
+        assert outbox._status(KEY) == STATUS_DELIVERED
+
+    asyncio.run(scenario())
+
+    # Every attempt carried the same payload and idempotency key
+    assert backend.calls == [(PAYLOAD, KEY)] * 4
+    assert (outbox.retried, outbox.dead_lettered, outbox.delivered) == (2, 1, 1)
+    assert outbox.get_stats()["dead"] == 0
+
+def test_client_error_is_dead_lettered_without_retrying(db_file):
+    backend = FakeBackend(400)
+    outbox = PostOutbox(backend.send, db_file=db_file)
+
+    assert asyncio.run(outbox.submit(KEY, "marcin_frames_art", PAYLOAD)) == STATUS_DEAD
+    assert len(backend.calls) == 1
+    assert outbox.get_dead_letters()[0]["last_error"] == "HTTP 400"
+
+def test_key_is_stored_once_until_dead_lettered(db_file):
+    backend = FakeBackend(400)
+    outbox = PostOutbox(backend.send, db_file=db_file)
+
+    async def scenario():
+        assert await outbox.enqueue(KEY, "marcin_frames_art", PAYLOAD)
+        assert not await outbox.enqueue(KEY, "marcin_frames_art", PAYLOAD)
+
+        assert await outbox.deliver_now(KEY) == STATUS_DEAD
+        # A dead-lettered key can be stored again and starts over
+        assert await outbox.enqueue(KEY, "marcin_frames_art", PAYLOAD)
+        assert outbox._status(KEY) == STATUS_PENDING
+
+    asyncio.run(scenario())
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import pytz
+
+from services.posting_schedule import PostingSchedule
+
+NEW_YORK = pytz.timezone("America/New_York")
+
+def local(*args) -> datetime:
+    return NEW_YORK.localize(datetime(*args))
+
+def test_spring_forward_moves_missing_slot_to_first_real_instant():
+    # 2026-03-08: clocks jump from 02:00 to 03:00, so 02:30 doesn't exist
+    schedule = PostingSchedule(("30 2 * * *", "0 9 * * *"), "America/New_York")
+
+    slot = schedule.next_after(local(2026, 3, 8, 0, 0))
+    assert slot == local(2026, 3, 8, 3, 30)
+    assert slot.utcoffset() == timedelta(hours=-4)
+
+def test_spring_forward_slot_not_skipped_after_the_jump():
+    schedule = PostingSchedule(("30 2 * * *", "0 9 * * *"), "America/New_York")
+
+    # 03:10 is past 02:30 on the wall clock, but the moved slot (03:30) is still ahead
+    assert schedule.next_after(local(2026, 3, 8, 3, 10)) == local(2026, 3, 8, 3, 30)
+
+def test_fall_back_posts_repeated_slot_once():
+    # 2026-11-01: 01:00-02:00 happens twice
+    schedule = PostingSchedule(("30 1 * * *",), "America/New_York")
+
+    slots = []
+    instant = local(2026, 10, 31, 12, 0)
+    for _ in range(3):
+        instant = schedule.next_after(instant)
+        slots.append(instant)
+
+    assert [slot.date().day for slot in slots] == [1, 2, 3]
+    assert len({slot.astimezone(pytz.utc) for slot in slots}) == 3
+
+def test_fall_back_slot_not_skipped_during_first_pass():
+    schedule = PostingSchedule(("30 1 * * *",), "America/New_York")
+
+    # 01:40 EDT (first pass) comes before the slot, which is 01:30 EST
+    first_pass = pytz.utc.localize(datetime(2026, 11, 1, 5, 40))
+    slot = schedule.next_after(first_pass)
+
+    assert slot > first_pass
+    assert slot.date() == first_pass.astimezone(NEW_YORK).date()
+
+def test_previous_before_walks_back_across_spring_forward():
+    schedule = PostingSchedule(("30 2 * * *", "0 9 * * *"), "America/New_York")
+
+    slots = []
+    instant = local(2026, 3, 8, 12, 0)
+    for _ in range(4):
+        slot = schedule.previous_before(instant)
+        slots.append(slot)
+        instant = slot - timedelta(seconds=1)
+
+    assert slots == [
+        local(2026, 3, 8, 9, 0),
+        local(2026, 3, 8, 3, 30),
+        local(2026, 3, 7, 9, 0),
+        local(2026, 3, 7, 2, 30),
+    ]
+
+def test_next_and_previous_agree_across_transitions():
+    schedule = PostingSchedule(("30 1,2 * * *",), "America/New_York")
+
+    for start in (local(2026, 3, 7, 12, 0), local(2026, 10, 31, 12, 0)):
+        instant = start
+        for _ in range(6):
+            slot = schedule.next_after(instant)
+            assert slot > instant
+            assert schedule.previous_before(slot) == slot
+            instant = slot
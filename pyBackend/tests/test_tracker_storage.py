@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+import pytz
+
+from services.photo_tracker_service import PhotoTrackerService
+from services.schedule_tracker_service import ScheduleTrackerService
+from services.tracker_storage import SqliteTrackerStorage, WriteBehindStorage
+
+BOT = "marcin_frames_art"
+VIETNAM = pytz.timezone("Asia/Ho_Chi_Minh")
+
+def today_at(hour: int) -> datetime:
+    # Today, so the daily history compaction that runs on a claim keeps the slot
+    return datetime.now(VIETNAM).replace(hour=hour, minute=0, second=0, microsecond=0)
+
+@pytest.fixture
+def db_file(tmp_path):
+    return str(tmp_path / "trackers.db")
+
+def two_workers(db_file):
+    """Two workers' storage on one database, as separate processes would have"""
+    return [WriteBehindStorage(SqliteTrackerStorage(db_file), flush_interval=0.01) for _ in range(2)]
+
+async def run_workers(storages, work):
+    for storage in storages:
+        await storage.start()
+    try:
+        return await work()
+    finally:
+        for storage in storages:
+            await storage.close()
+
+def test_only_one_worker_claims_a_slot(db_file):
+    storages = two_workers(db_file)
+    trackers = [ScheduleTrackerService(storage) for storage in storages]
+    slot = today_at(9)
+
+    async def work():
+        return await asyncio.gather(*(tracker.claim_post_slot(BOT, slot) for tracker in trackers))
+
+    results = asyncio.run(run_workers(storages, work))
+
+    assert sorted(results, key=str) == ["09:00", None]
+    assert SqliteTrackerStorage(db_file).load_posted_slots(BOT, slot.strftime('%Y-%m-%d')) == ["09:00"]
+
+def test_only_one_worker_reserves_a_photo(db_file):
+    storages = two_workers(db_file)
+    trackers = [PhotoTrackerService(storage) for storage in storages]
+
+    async def work():
+        return await asyncio.gather(*(tracker.reserve_photo(BOT, "photo-1") for tracker in trackers))
+
+    results = asyncio.run(run_workers(storages, work))
+
+    assert sorted(results) == [False, True]
+    assert list(SqliteTrackerStorage(db_file).load_used_photos(BOT)) == ["photo-1"]
+
+def test_released_slot_can_be_claimed_by_the_other_worker(db_file):
+    storages = two_workers(db_file)
+    first, second = (ScheduleTrackerService(storage) for storage in storages)
+    slot = today_at(15)
+
+    async def work():
+        assert await first.claim_post_slot(BOT, slot) == "15:00"
+        first.release_post_slot(BOT, "15:00", slot.strftime('%Y-%m-%d'))
+        await storages[0].flush()
+        return await second.claim_post_slot(BOT, slot)
+
+    assert asyncio.run(run_workers(storages, work)) == "15:00"